@@ -45,7 +45,7 @@ class LearnedCardinalityEstimator(CardinalityEstimator):
         encoded_queries = encode(factor_queries, self._cardinality_model, self._device)
         loader = DataLoader(encoded_queries, batch_size=1024)
         raw_estimations = []
-        self._cardinality_model.eval()
+        self._cardinality_model.freeze_for_inference()
         with torch.no_grad():
             for batch in loader:
                 estimation = self._cardinality_model.forward(batch).cpu().numpy()
@@ -67,6 +67,14 @@ class LearnedCardinalityEstimator(CardinalityEstimator):
         sampler = self._cardinality_model.encoder().sampler()
         if sampler is not None:
             sampler.save(path + ".samples")
+            self.save_bitmap_cache(path)
+
+    def save_bitmap_cache(self, path):
+        # bitmaps evaluated after the model was saved, e.g. for test queries, are kept by saving the cache again
+        sampler = self._cardinality_model.encoder().sampler()
+        if sampler is not None and sampler.bitmap_cache() is not None:
+            print("Bitmap cache: " + sampler.bitmap_cache().stats())
+            sampler.bitmap_cache().save(path + ".bitmaps")
 
     def supports(self, query: GraphlikeQuery) -> bool:
         return self._cardinality_model.supports(query)
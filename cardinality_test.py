@@ -10,11 +10,17 @@ from cardinality_injection import get_runtime_sql
 from data.query_db import QueryDB
 from encoder.cardinality_relation_data_generator import CardinalityRelationDataGenerator
 from encoder.sql_sampler import SQLSampler
+from encoder.encoder_util import SamplingMethod
+from encoder.bitmap_cache import BitmapCache
+from encoder.encoding_cache import EncodingCache
+from encoder.sample_entry import SampleEntry, SampleRows
+from encoder.predicate_encoding_cache import PredicateEncodingCache
 from models.bulk_jgmp_cardinality_model import BulkJGMPCardinalityModel
 from models.bulk_mscn_cardinality_model import BulkMSCNCardinalityModel
 from models.cardinality_model import CardinalityModel
 from models.graph_cardinality_model import GraphCardinalityModel
 from models.query_model import QueryModel
+from models.util import MultiHeadAggregation
 from plan_execution.pg_explain import PgExplain
 from plan_execution.stubborn_plan_engine import StubbornPlanEngine
 from query.query_generator import QueryGenerator
@@ -28,7 +34,10 @@ from query.symmetry.generator.card_rel_greater_monotonicity import CardRelGreate
 from query.symmetry.generator.card_rel_inclusion_exclusion import CardRelInclusionExclusion
 from query.symmetry.generator.card_rel_or_monotonicity import CardRelOrMonotonicity
 from query_data.bulk_cardinality_query_data import BulkCardinalityQueryData
+from schema.attribute import Attribute
+from schema.data_type import DATATYPES
 from schema.graphlike_schema import GraphlikeSchema
+from schema.schema_node import SchemaNode
 from typing import Any, Dict, List, Optional, Tuple, Union, FrozenSet
 from encoder.encoder import Encoder
 from schema.schemas import stats_schema, imdb_schema, imdb_light_schema
@@ -36,12 +45,15 @@ from schema.sql.sql_random_attribute_buffer import SQLRandomAttributeBuffer
 from train_cardinality import encode, test, train, q_error_stats
 from training_test_split import group_job, multi_split, incremental_subsets
 from schema.sql.sql_schema import SQLSchema
+from schema.sql.sql_table import SQLTable
 from logger import Logger
 import random
 import numpy as np
 import hyperopt
 import torch
 import datetime
+import time
+import tracemalloc
 import os
 import sys
 
@@ -61,7 +73,8 @@ class TrainingSetup:
                  tests: List[Tuple[str, List[List[GraphlikeQuery]]]],
                  config: Dict[str, Any],
                  validate_ratio: float,
-                 old_model: Optional[CardinalityModel] = None):
+                 old_model: Optional[CardinalityModel] = None,
+                 refresh_from: Optional['TrainingSetup'] = None):
         self.schema = schema
         self.train_and_validate = train_and_validate
         self.query_generator = query_generator
@@ -69,6 +82,8 @@ class TrainingSetup:
         self.config = config
         self.validate_ratio = validate_ratio
         self.old_model = old_model
+        # the model trained for this earlier setup is fine-tuned with an incrementally refreshed sampler
+        self.refresh_from = refresh_from
 
 
 class TrainingResult:
@@ -95,6 +110,164 @@ def count_parameters(model):
     return sum([p.numel() for p in model.parameters() if p.requires_grad])
 
 
+def relation_generation_benchmark(card_rel_data_generator: CardinalityRelationDataGenerator,
+                                  model_type: type,
+                                  num_relations: int = 1000,
+                                  worker_counts: List[int] = [1, 2, 4, 8, 16]):
+    if model_type == BulkJGMPCardinalityModel:
+        generate = card_rel_data_generator.generate_bulk_light_cardinality_relations_parallel
+    elif model_type == BulkMSCNCardinalityModel:
+        generate = card_rel_data_generator.generate_bulk_mscn_cardinality_relations_parallel
+    else:
+        generate = card_rel_data_generator.generate_cardinality_relations_parallel
+    old_num_processes = card_rel_data_generator.num_processes()
+    print("workers\tthreads (s)\tprocesses (s)\tspeedup")
+    for worker_count in worker_counts:
+        card_rel_data_generator.set_num_processes(0)
+        start = time.time()
+        generate(num_relations, num_threads=worker_count)
+        thread_time = time.time() - start
+
+        card_rel_data_generator.set_num_processes(worker_count)
+        # the first call starts the persistent pool, only later epochs are measured
+        generate(worker_count)
+        start = time.time()
+        generate(num_relations)
+        process_time = time.time() - start
+        print("%d\t%.2f\t%.2f\t%.2f" % (worker_count, thread_time, process_time, thread_time / process_time))
+    card_rel_data_generator.set_num_processes(old_num_processes)
+
+
+def query_set_load_benchmark(query_db: QueryDB,
+                             schema: GraphlikeSchema,
+                             query_set_names: List[str],
+                             snapshot_directory: str,
+                             repetitions: int = 3):
+    old_snapshot_directory = query_db.snapshot_directory()
+    print("query set\tdatabase (s)\tsnapshot (s)\tspeedup")
+    for query_set_name in query_set_names:
+        query_db.set_snapshot_directory(None)
+        start = time.time()
+        for _ in range(repetitions):
+            query_db.load_group_cardinalities(schema, query_set_name, 2, True)
+        database_time = (time.time() - start) / repetitions
+
+        query_db.set_snapshot_directory(snapshot_directory)
+        # the first load writes the snapshot
+        query_db.load_group_cardinalities(schema, query_set_name, 2, True)
+        start = time.time()
+        for _ in range(repetitions):
+            query_db.load_group_cardinalities(schema, query_set_name, 2, True)
+        snapshot_time = (time.time() - start) / repetitions
+        print("%s\t%.2f\t%.2f\t%.2f" % (query_set_name, database_time, snapshot_time, database_time / snapshot_time))
+    query_db.set_snapshot_directory(old_snapshot_directory)
+
+
+def workload_encoding_benchmark(cardinality_model: CardinalityModel,
+                                queries: List[List[GraphlikeQuery]],
+                                repetitions: int = 3):
+    num_subplans = sum([len(subqueries) for subqueries in queries])
+    # sample bitmaps are computed once up front, only the encoding is measured
+    sampler = cardinality_model.encoder().sampler()
+    if sampler is not None:
+        sampler.prefetch([subquery for subqueries in queries for subquery in subqueries])
+    start = time.time()
+    for _ in range(repetitions):
+        per_query = [encoding for subqueries in queries for encoding in cardinality_model.bulk_encode(subqueries)]
+    per_query_time = (time.time() - start) / repetitions
+    start = time.time()
+    for _ in range(repetitions):
+        workload = cardinality_model.bulk_encode_workload(queries)
+    workload_time = (time.time() - start) / repetitions
+    for per_query_data, workload_data in zip(per_query, workload):
+        for key in per_query_data.keys():
+            assert(torch.equal(per_query_data[key], workload_data[key]))
+    print("subplans\tper query (subplans/s)\tworkload (subplans/s)\tspeedup")
+    print("%d\t%.0f\t%.0f\t%.2f" % (num_subplans, num_subplans / per_query_time, num_subplans / workload_time, per_query_time / workload_time))
+
+
+def lattice_encoding_benchmark(cardinality_model: BulkJGMPCardinalityModel,
+                               queries: List[SQLQuery],
+                               group_cardinalities: Dict[GraphlikeQuery, Dict[FrozenSet[QueryNode], int]],
+                               repetitions: int = 3):
+    num_subplans = sum([len(group_cardinalities[query]) for query in queries])
+    sampler = cardinality_model.encoder().sampler()
+    if sampler is not None:
+        sampler.prefetch(queries)
+    start = time.time()
+    for _ in range(repetitions):
+        for query in queries:
+            subqueries = [query.build_subquery(node_set, group_cardinalities[query][node_set]) for node_set in group_cardinalities[query]]
+            cardinality_model.bulk_encode(subqueries)
+    subquery_time = (time.time() - start) / repetitions
+    start = time.time()
+    for _ in range(repetitions):
+        for query in queries:
+            node_sets = list(group_cardinalities[query])
+            cardinality_model.bulk_encode_lattice(query, [query.subquery_mask(node_set) for node_set in node_sets], [group_cardinalities[query][node_set] for node_set in node_sets])
+    lattice_time = (time.time() - start) / repetitions
+    print("subplans\tsubqueries (subplans/s)\tlattice (subplans/s)\tspeedup")
+    print("%d\t%.0f\t%.0f\t%.2f" % (num_subplans, num_subplans / subquery_time, num_subplans / lattice_time, subquery_time / lattice_time))
+
+
+def sample_rows_benchmark(table: Optional[SchemaNode] = None, num_rows: int = 100000, num_attributes: int = 8):
+    if table is None:
+        table = SchemaNode("benchmark", num_rows)
+    attributes = [Attribute("a%d" % i, DATATYPES["integer"], True) for i in range(num_attributes)]
+    rows = []
+    for i in range(num_rows):
+        row = []
+        for j in range(num_attributes):
+            if j % 4 == 0:
+                row.append(i)
+            elif j % 4 == 1:
+                row.append(None if i % 7 == 0 else float(i) / 3)
+            elif j % 4 == 2:
+                row.append("value %d" % (i % 1000))
+            else:
+                row.append(i % 5 == 0)
+        rows.append(tuple(row))
+
+    for name, build in [("SampleEntry", lambda: [SampleEntry([table], dict(zip(attributes, row))) for row in rows]),
+                        ("SampleRow", lambda: SampleRows(table, attributes, rows).entries())]:
+        tracemalloc.start()
+        start = time.time()
+        samples = build()
+        seconds = time.time() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        assert(all(samples[i].value(attributes[j]) == rows[i][j] for i in range(0, num_rows, 997) for j in range(num_attributes)))
+        print("%s: %d rows, %.1f MB, %.2f s" % (name, num_rows, memory / 2**20, seconds))
+        del samples
+
+
+def multi_head_aggregation_benchmark(num_rows: int = 200000,
+                                     num_groups: int = 20000,
+                                     input_size: int = 64,
+                                     output_size_per_head: int = 16,
+                                     num_heads: int = 8,
+                                     repetitions: int = 10):
+    x = torch.randn((num_rows, input_size))
+    index = torch.sort(torch.randint(0, num_groups, (num_rows,)))[0]
+    aggregation = MultiHeadAggregation(input_size, output_size_per_head, num_heads, True)
+    fused_result = aggregation(x, index=index, dim_size=num_groups)
+    per_head_result = aggregation.forward_per_head(x, index=index, dim_size=num_groups)
+    print("max difference: %g" % float(torch.max(torch.abs(fused_result - per_head_result))))
+    print("mode\tper head (s)\tfused (s)\tspeedup")
+    for mode in ["training", "inference"]:
+        times = []
+        for forward in [aggregation.forward_per_head, aggregation.forward]:
+            start = time.time()
+            for _ in range(repetitions):
+                if mode == "training":
+                    forward(x, index=index, dim_size=num_groups).sum().backward()
+                else:
+                    with torch.no_grad():
+                        forward(x, index=index, dim_size=num_groups)
+            times.append((time.time() - start) / repetitions)
+        print("%s\t%.4f\t%.4f\t%.2f" % (mode, times[0], times[1], times[0] / times[1]))
+
+
 def experiment(schema: GraphlikeSchema,
                query_db: QueryDB,
                setups: List[TrainingSetup],
@@ -110,6 +283,8 @@ def experiment(schema: GraphlikeSchema,
     os.makedirs(result_path, exist_ok=True)
     group_counters = {}
     results = []
+    setup_paths = []
+    setup_path_dict = {}
     for setup in setups:
         group_path = result_path + setup.config["name"] + "/"
         if setup.config["name"] not in group_counters:
@@ -117,12 +292,17 @@ def experiment(schema: GraphlikeSchema,
             os.mkdir(group_path)
         setup_path = group_path + str(group_counters[setup.config["name"]])
         sys.stdout = Logger(setup_path + ".log")
-        _, encoder, model = train_test(setup.schema, setup.train_and_validate, setup.tests, device, setup.config, validate_ratio=setup.validate_ratio, query_generator = setup.query_generator, old_model = setup.old_model)
+        old_model = setup.old_model
+        if setup.refresh_from is not None:
+            old_model = refresh_model(setup, setup_path_dict[setup.refresh_from], device)
+        _, encoder, model = train_test(setup.schema, setup.train_and_validate, setup.tests, device, setup.config, validate_ratio=setup.validate_ratio, query_generator = setup.query_generator, old_model = old_model)
         sys.stdout = sys.__stdout__
         model.to("cpu")
         estimator = LearnedCardinalityEstimator(model, device="cpu")
         estimator.save(setup_path)
         results.append(TrainingResult(estimator, setup))
+        setup_paths.append(setup_path)
+        setup_path_dict[setup] = setup_path
         group_counters[setup.config["name"]] += 1
 
     for test_name, get_runtimes, test_queries in tests:
@@ -131,6 +311,9 @@ def experiment(schema: GraphlikeSchema,
         if get_runtimes:
             final_runtime_test(schema, results, test_name, result_path)
 
+    for result, setup_path in zip(results, setup_paths):
+        result.estimator.save_bitmap_cache(setup_path)
+
 
 def final_card_test(query_db: QueryDB,
                     results: List[TrainingResult],
@@ -312,6 +495,9 @@ def repeat_runtime_parallel(schema: SQLSchema, path: str, test_name: str, config
                         line = str(query_id) + "," + str(model_number) + "," + str(parallel_estimation_time) + "," + str(parallel_runtime)
                     print(line)
                     f.write(line + "\n")
+        for model_number in cardinality_estimators:
+            if isinstance(cardinality_estimators[model_number], LearnedCardinalityEstimator):
+                cardinality_estimators[model_number].save_bitmap_cache(config_directory + "/" + str(model_number))
 
     baseline_runtimes(test_name, queries, path, plan_engine, file_name_addition="_parallel")
 
@@ -336,6 +522,7 @@ def load_and_get_runtimes(schema: GraphlikeSchema,
     # search experiment directory for subdirectories
     # each subdirectory is a setup
     training_results = []
+    model_paths = []
     for setup_name in os.listdir(experiment_path):
         if setup_name not in config_dict:
             continue
@@ -355,6 +542,7 @@ def load_and_get_runtimes(schema: GraphlikeSchema,
                 test_dict[model_id] = tests[0][1]
                 setup = TrainingSetup(schema, [], None, tests, config_dict[setup_name], 0)
                 training_results.append(TrainingResult(estimator, setup))
+                model_paths.append(model_path)
 
         # load cardinality file and build dict mapping queries to list of models with cardinality estimations
         card_file_path = experiment_path + "/" + setup_name + "/" + test_name + "_card_est.csv"
@@ -378,6 +566,8 @@ def load_and_get_runtimes(schema: GraphlikeSchema,
             for model_id in model_ids:
                 test_dict[model_id].append([query])
     final_runtime_test(schema, training_results, test_name, experiment_path + "/")
+    for training_result, model_path in zip(training_results, model_paths):
+        training_result.estimator.save_bitmap_cache(model_path)
 
 
 def baseline_runtimes(test_name: str, queries: List[Union[SQLQuery, Tuple[str, str]]], result_path: str, plan_engine: StubbornPlanEngine, file_name_addition: str = ""):
@@ -471,10 +661,22 @@ def load_train_test(query_db: QueryDB,
     return train_test(schema, train_and_validate, tests, device, config=config, semi_supervised=semi_supervised, validate_ratio=0)
 
 
+# shared by the encoders of all setups, the keys contain the encoder version
+predicate_cache = PredicateEncodingCache()
+
+
+def config_sampling_methods(config: Dict[str, Any]) -> Optional[Dict[str, SamplingMethod]]:
+    # table names mapped to method names, tables without an entry are sampled uniformly
+    if "sampling_methods" not in config:
+        return None
+    return {table_name: SamplingMethod[method_name] for table_name, method_name in config["sampling_methods"].items()}
+
+
 def build_encoder(schema: GraphlikeSchema, config: Dict[str, Any], training_queries: List[GraphlikeQuery]) -> Encoder:
     if isinstance(schema, SQLSchema):
+        sampling_methods = config_sampling_methods(config)
         if config["samples_random"]:
-            sampler = SQLSampler.build_sampler_random(schema, config["samples_separate"], config["bitmap_size"])
+            sampler = SQLSampler.build_sampler_random(schema, config["samples_separate"], config["bitmap_size"], sampling_methods=sampling_methods)
         else:
             queries = sum(training_queries, [])
             if "min_gain" in config:
@@ -482,12 +684,20 @@ def build_encoder(schema: GraphlikeSchema, config: Dict[str, Any], training_quer
             else:
                 min_gain = 0
             # sampler = SQLSampler.build_sampler_entropy(schema, config["samples_separate"], config["bitmap_size"], 10000, queries, min_gain=min_gain)
-            sampler = SQLSampler.build_sampler_fs(schema, config["bitmap_size"], 100000, 1000, 1000, queries)
+            sampler = SQLSampler.build_sampler_fs(schema, config["bitmap_size"], 100000, 1000, 1000, queries,
+                                                  num_processes=config["sampler_processes"] if "sampler_processes" in config else 0,
+                                                  sampling_methods=sampling_methods)
+        # the cache is saved with the estimator and reused when it is loaded
+        bitmap_cache_size = config["bitmap_cache_size"] if "bitmap_cache_size" in config else 100000
+        if bitmap_cache_size is not None:
+            sampler.set_bitmap_cache(BitmapCache(capacity=bitmap_cache_size))
     else:
         return NotImplementedError()
+    index_encoding = config["index_encoding"] if "index_encoding" in config else False
+    packed_samples = config["packed_samples"] if "packed_samples" in config else False
     if "eliminate_lesser" in config:
-        return Encoder(schema, sampler, eliminate_lesser=config["eliminate_lesser"])
-    return Encoder(schema, sampler)
+        return Encoder(schema, sampler, eliminate_lesser=config["eliminate_lesser"], index_encoding=index_encoding, packed_samples=packed_samples, predicate_cache=predicate_cache)
+    return Encoder(schema, sampler, index_encoding=index_encoding, packed_samples=packed_samples, predicate_cache=predicate_cache)
 
 
 def train_test(schema: GraphlikeSchema,
@@ -535,7 +745,9 @@ def train_test(schema: GraphlikeSchema,
                                                                         # CardRelOrMonotonicity(schema, value_picker),
                                                                         CardRelForeignKey(schema),
                                                                         CardRelInclusionExclusion(schema)],
-                                                                       device)
+                                                                       device,
+                                                                       num_processes=config["relation_processes"] if "relation_processes" in config else 0,
+                                                                       seed=config["seed"] if "seed" in config else None)
         else:
             raise NotImplementedError()
     else:
@@ -553,8 +765,9 @@ def train_test(schema: GraphlikeSchema,
 
     print("Encoding queries")
     print(datetime.datetime.now())
-    encoded_training_queries = encode(training_queries, model, device)
-    encoded_validation_queries = encode(validation_queries, model, device)
+    encoding_cache = EncodingCache(config["encoding_cache"]) if "encoding_cache" in config else None
+    encoded_training_queries = encode(training_queries, model, device, encoding_cache=encoding_cache)
+    encoded_validation_queries = encode(validation_queries, model, device, encoding_cache=encoding_cache)
 
     if card_rel_data_generator is not None:
         num_relations = batch_size
@@ -566,14 +779,27 @@ def train_test(schema: GraphlikeSchema,
         card_rel_gen = None
         selfsupervised_factor = 0
 
-    train(model,
-          encoded_training_queries,
-          encoded_validation_queries,
-          learning_rate=config["learning_rate"],
-          epochs=config["epochs"],
-          batch_size=batch_size,
-          card_rel_gen=card_rel_gen,
-          selfsupervised_factor=selfsupervised_factor)
+    try:
+        train(model,
+              encoded_training_queries,
+              encoded_validation_queries,
+              learning_rate=config["learning_rate"],
+              epochs=config["epochs"],
+              batch_size=batch_size,
+              card_rel_gen=card_rel_gen,
+              selfsupervised_factor=selfsupervised_factor,
+              prefetch_depth=config["prefetch_depth"] if "prefetch_depth" in config else 0,
+              seed=config["seed"] if "seed" in config else None)
+    except BaseException:
+        # the persistent relation workers must not outlive a failed training
+        if card_rel_data_generator is not None:
+            card_rel_data_generator.close(terminate=True)
+        raise
+    if isinstance(model, BulkJGMPCardinalityModel):
+        # a later training of the fine-tuned model updates all parameters again
+        model.unmask_sample_weights()
+    if card_rel_data_generator is not None:
+        card_rel_data_generator.close()
 
     print()
     print("Training Set")
@@ -593,9 +819,13 @@ def train_test(schema: GraphlikeSchema,
     for name, queries in tests:
         print()
         print(name)
-        encoded_test = encode(queries, model, device)
+        encoded_test = encode(queries, model, device, encoding_cache=encoding_cache)
         means.append(test(model, encoded_test))
 
+    if encoder.sampler() is not None and encoder.sampler().bitmap_cache() is not None:
+        print()
+        print("Bitmap cache: " + encoder.sampler().bitmap_cache().stats())
+
     if len(means) == 0:
         return 0, encoder, model
 
@@ -770,6 +1000,41 @@ def crossvalidation_experiment(query_db: QueryDB,
     experiment(schema, query_db, setups, tests, device, experiment_name)
 
 
+def refresh_sampler(schema: SQLSchema,
+                    old_sampler: SQLSampler,
+                    config: Dict[str, Any],
+                    bitmap_size: int,
+                    previous_queries: List[SQLQuery],
+                    new_queries: List[SQLQuery]) -> Tuple[SQLSampler, Optional[Dict[SQLTable, List[int]]]]:
+    sampling_methods = config_sampling_methods(config)
+    if "incremental_sampler" in config and config["incremental_sampler"]:
+        # only the instances of the new workload are evaluated against the candidate pool, old samples keep their columns
+        new_sampler = old_sampler.refresh_fs(new_queries, bitmap_size, 100000, 1000, 1000, previous_queries=previous_queries, sampling_methods=sampling_methods)
+        new_columns = new_sampler.new_columns() if "tune_new_samples_only" in config and config["tune_new_samples_only"] else None
+    else:
+        new_sampler = SQLSampler.build_sampler_fs(schema, bitmap_size, 100000, 1000, 1000, previous_queries + new_queries, old_sampler=old_sampler, sampling_methods=sampling_methods)
+        new_columns = None
+    new_sampler.set_bitmap_cache(old_sampler.bitmap_cache())
+    return new_sampler, new_columns
+
+
+def refresh_model(setup: TrainingSetup, model_path: str, device: torch.device) -> BulkJGMPCardinalityModel:
+    # a fresh copy of the earlier model, the earlier result itself is still evaluated with its own sampler
+    model = load_learned_estimator_sql(setup.schema, model_path, setup.config, device=device).cardinality_model()
+    assert(isinstance(model, BulkJGMPCardinalityModel))
+    old_sampler = model.encoder().sampler()
+    bitmap_size = setup.config["incremental_bitmap_size"] if "incremental_bitmap_size" in setup.config else old_sampler.bitmap_size() + old_sampler.bitmap_size() // 2
+    new_sampler, new_columns = refresh_sampler(setup.schema,
+                                               old_sampler,
+                                               setup.config,
+                                               bitmap_size,
+                                               flatten(setup.refresh_from.train_and_validate),
+                                               flatten(setup.train_and_validate))
+    model.encoder().set_sampler(new_sampler)
+    model.pad_sample_weights(new_sampler.bitmap_size(), new_columns=new_columns)
+    return model
+
+
 def increment_training_experiment(query_db: QueryDB,
                                   schema: GraphlikeSchema,
                                   training_set: str,
@@ -806,9 +1071,14 @@ def increment_training_experiment(query_db: QueryDB,
 
 
     setups = []
+    # with an incremental sampler, each subset size fine-tunes the model of the next smaller size of the same repetition
+    incremental = any("incremental_sampler" in config and config["incremental_sampler"] for config in configs)
+    if incremental:
+        training_query_sets = list(reversed(training_query_sets))
+    previous_setups = {}
     for query_set in training_query_sets:
         set_size = str(len(query_set[0][0]))
-        for queries, test_queries in query_set:
+        for repetition, (queries, test_queries) in enumerate(query_set):
             if subquery_mode == SubqueryMode.NONE:
                 training_queries = [[query] for query in queries]
             elif subquery_mode == SubqueryMode.BEST:
@@ -819,11 +1089,16 @@ def increment_training_experiment(query_db: QueryDB,
             additional_split_tests = []
             additional_split_tests.append((training_set + "_subqueries", [train_subqueries[query] for query in test_queries]))
             additional_split_tests.append((training_set, [[query] for query in test_queries]))
-            for config in configs:
+            for config_index, config in enumerate(configs):
                 config = config.copy()
                 config["name"] = config["name"] + "_" + set_size
                 generator = QueryGeneratorChoice(query_choices)
-                setups.append(TrainingSetup(schema, training_queries, generator, split_tests + additional_split_tests, config, 0))
+                refresh_from = None
+                if "incremental_sampler" in config and config["incremental_sampler"]:
+                    refresh_from = previous_setups.get((repetition, config_index))
+                setup = TrainingSetup(schema, training_queries, generator, split_tests + additional_split_tests, config, 0, refresh_from=refresh_from)
+                setups.append(setup)
+                previous_setups[(repetition, config_index)] = setup
 
     experiment_name = "increment-%s-%s" % (training_set, subquery_mode.name)
     experiment(schema, query_db, setups, tests, device, experiment_name)
@@ -921,23 +1196,23 @@ def workload_shift_experiment(query_db: QueryDB,
             pure_tune_estimator = load_learned_estimator_sql(schema, model_path, jgmp_config, device=device)
             pure_tune_model = pure_tune_estimator.cardinality_model()
             old_sampler = pure_tune_model.encoder().sampler()
-            new_sampler = SQLSampler.build_sampler_fs(schema, new_max_samples, 100000, 1000, 1000, combined_training_queries, old_sampler=old_sampler)
+            new_sampler, new_columns = refresh_sampler(schema, old_sampler, jgmp_config, new_max_samples, first_training_queries, second_training_queries)
             new_sampler_bitmap_size = new_sampler.bitmap_size()
             new_max_samples = new_sampler.bitmap_size()
             pure_tune_model.encoder().set_sampler(new_sampler)
-            pure_tune_model.pad_sample_weights(new_sampler_bitmap_size)
+            pure_tune_model.pad_sample_weights(new_sampler_bitmap_size, new_columns=new_columns)
             pure_tune_setup = TrainingSetup(schema, pure_training_best_subqueries, pure_query_generator, setup_tests, pure_tune_config, 0, old_model=pure_tune_model)
             setups.append(pure_tune_setup)
             combined_tune_estimator = load_learned_estimator_sql(schema, model_path, jgmp_config, device=device)
             combined_tune_model = combined_tune_estimator.cardinality_model()
             combined_tune_model.encoder().set_sampler(new_sampler)
-            combined_tune_model.pad_sample_weights(new_sampler_bitmap_size)
+            combined_tune_model.pad_sample_weights(new_sampler_bitmap_size, new_columns=new_columns)
             combined_tune_setup = TrainingSetup(schema, combined_training_best_subqueries, combined_query_generator, setup_tests, combined_tune_config, 0, old_model=combined_tune_model)
             setups.append(combined_tune_setup)
             equal_tune_estimator = load_learned_estimator_sql(schema, model_path, jgmp_config, device=device)
             equal_tune_model = equal_tune_estimator.cardinality_model()
             equal_tune_model.encoder().set_sampler(new_sampler)
-            equal_tune_model.pad_sample_weights(new_sampler_bitmap_size)
+            equal_tune_model.pad_sample_weights(new_sampler_bitmap_size, new_columns=new_columns)
             equal_tune_setup = TrainingSetup(schema, equal_training_best_subqueries, equal_query_generator, setup_tests, equal_tune_config, 0, old_model=equal_tune_model)
             setups.append(equal_tune_setup)
 
@@ -0,0 +1,148 @@
+from typing import Dict, List, Tuple, Union
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from data.wrap_value import value_string
+from query.graphlike_query import GraphlikeQuery
+from query.predicatable import Predicatable
+from query.query_edge import EdgeDirection, QueryEdge
+from query.query_node import QueryNode
+from schema.schema_edge import SchemaEdge
+from schema.schema_node import SchemaNode
+
+
+# tables in foreign key order, a flush never references rows of a later table
+TABLE_COLUMNS = [("queries", ["id", "set_id", "name"]),
+                 ("elements", ["id"]),
+                 ("nodes", ["id", "virtual"]),
+                 ("node_queries", ["node_id", "query_id"]),
+                 ("edges", ["id", "direction_id", "from_id", "to_id"]),
+                 ("element_labels", ["element_id", "label_id"]),
+                 ("disjunctions", ["id", "element_id"]),
+                 ("predicates", ["disjunction_id", "attribute_name", "operator_id", "value", "positive"]),
+                 ("node_cardinalities", ["node_id", "cardinality_estimator_id", "estimate"]),
+                 ("query_cardinalities", ["query_id", "cardinality_estimator_id", "estimate", "estimation_latency"])]
+
+
+class BulkQueryWriter:
+    def __init__(self,
+                 connection: psycopg2.extensions.connection,
+                 directions: Dict[str, int],
+                 operators: Dict[str, int],
+                 database_id: int,
+                 set_id: int,
+                 buffer_size: int = 10000) -> None:
+        self._connection = connection
+        self._directions = directions
+        self._operators = operators
+        self._database_id = database_id
+        self._set_id = set_id
+        self._buffer_size = buffer_size
+        self._rows: Dict[str, List[Tuple]] = {table: [] for table, _ in TABLE_COLUMNS}
+        self._num_rows = 0
+        self._ids: Dict[str, List[int]] = {"queries": [], "elements": [], "disjunctions": []}
+
+        cursor = self._connection.cursor()
+        cursor.execute("SELECT id, is_node_label, name FROM labels WHERE database_id = %s;", (database_id,))
+        self._labels = {(is_node_label, name): id for id, is_node_label, name in cursor.fetchall()}
+        cursor.execute("SELECT id, name FROM cardinality_estimators;")
+        self._estimators = {name: id for id, name in cursor.fetchall()}
+        cursor.close()
+
+    def _next_id(self, table: str) -> int:
+        if len(self._ids[table]) == 0:
+            cursor = self._connection.cursor()
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s);", (table, self._buffer_size))
+            self._ids[table] = [row[0] for row in reversed(cursor.fetchall())]
+            cursor.close()
+        return self._ids[table].pop()
+
+    def _add(self, table: str, row: Tuple):
+        self._rows[table].append(row)
+        self._num_rows += 1
+        if self._num_rows >= self._buffer_size:
+            self.flush()
+
+    def _label_id(self, label: Union[SchemaNode, SchemaEdge]) -> int:
+        key = (isinstance(label, SchemaNode), label.name())
+        if key not in self._labels:
+            cursor = self._connection.cursor()
+            cursor.execute("INSERT INTO labels (database_id, is_node_label, name) VALUES (%s, %s, %s) RETURNING id;", (self._database_id, key[0], key[1]))
+            self._labels[key] = cursor.fetchone()[0]
+            cursor.close()
+        return self._labels[key]
+
+    def _estimator_id(self, estimator_name: str) -> int:
+        if estimator_name not in self._estimators:
+            cursor = self._connection.cursor()
+            cursor.execute("INSERT INTO cardinality_estimators (name) VALUES (%s) RETURNING id;", (estimator_name,))
+            self._estimators[estimator_name] = cursor.fetchone()[0]
+            cursor.close()
+        return self._estimators[estimator_name]
+
+    def add_query(self,
+                  query: GraphlikeQuery,
+                  estimator_id: int,
+                  latencies: Dict[str, float] = {}
+                  ) -> Tuple[int, Dict[QueryNode, int]]:
+        query_id = self._next_id("queries")
+        self._add("queries", (query_id, self._set_id, query.name()))
+
+        node_ids = {}
+        for node in query.nodes():
+            node_ids[node] = self._add_node(node, query_id, estimator_id)
+
+        for from_node, edge, to_node in query.edges():
+            self._add_edge(edge, node_ids[from_node], node_ids[to_node])
+
+        cardinality_estimates = query.cardinality_estimates()
+        for estimator_name in cardinality_estimates:
+            latency = latencies[estimator_name] if estimator_name in latencies else None
+            self._add("query_cardinalities", (query_id, self._estimator_id(estimator_name), float(cardinality_estimates[estimator_name]), latency))
+
+        return query_id, node_ids
+
+    def _add_node(self, node: QueryNode, query_id: int, estimator_id: int) -> int:
+        node_id = self._next_id("elements")
+        self._add("elements", (node_id,))
+        self._add("nodes", (node_id, node.virtual()))
+        self._add("node_queries", (node_id, query_id))
+        for label in node.labels():
+            self._add("element_labels", (node_id, self._label_id(label)))
+        if isinstance(node, Predicatable):
+            self._add_predicatable(node, node_id)
+        self._add("node_cardinalities", (node_id, estimator_id, float(node.cardinality())))
+        return node_id
+
+    def _add_edge(self, edge: QueryEdge, from_id: int, to_id: int) -> int:
+        edge_id = self._next_id("elements")
+        self._add("elements", (edge_id,))
+        self._add("edges", (edge_id, self._directions[EdgeDirection.string(edge.direction())], from_id, to_id))
+        if isinstance(edge, Predicatable):
+            self._add_predicatable(edge, edge_id)
+        for label in edge.labels():
+            self._add("element_labels", (edge_id, self._label_id(label)))
+        return edge_id
+
+    def _add_predicatable(self, element: Predicatable, element_id: int):
+        for disjunction in element.predicates():
+            disjunction_id = self._next_id("disjunctions")
+            self._add("disjunctions", (disjunction_id, element_id))
+            for predicate in disjunction:
+                self._add("predicates", (disjunction_id,
+                                         predicate.attribute().name(),
+                                         self._operators[predicate.operator().symbol()],
+                                         value_string(predicate.value()),
+                                         predicate.positive()))
+
+    def flush(self):
+        cursor = self._connection.cursor()
+        for table, columns in TABLE_COLUMNS:
+            rows = self._rows[table]
+            if len(rows) == 0:
+                continue
+            execute_values(cursor, "INSERT INTO %s (%s) VALUES %%s;" % (table, ", ".join(columns)), rows, page_size=len(rows))
+            self._rows[table] = []
+        cursor.close()
+        self._num_rows = 0
@@ -1,6 +1,11 @@
 
-from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple, Union
+import hashlib
+import os
+import pickle
+import time
 import psycopg2
+from data.bulk_query_writer import BulkQueryWriter
 from data.wrap_value import wrap_value
 from query.graphlike_query import GraphlikeQuery
 from query.predicatable import Predicatable
@@ -19,7 +24,7 @@ import datetime
 
 
 class QueryDB:
-    def __init__(self, name: str, port: Optional[int] = None) -> None:
+    def __init__(self, name: str, port: Optional[int] = None, snapshot_directory: Optional[str] = None) -> None:
         if port is None:
             self._connection = psycopg2.connect(host="localhost", database=name, user="postgres", password="postgres")
         else:
@@ -29,6 +34,9 @@ class QueryDB:
         self._directions = self._get_name_dict("directions")
         self._operators = self._get_name_dict("comparison_operators")
         self._data_roles = self._get_name_dict("data_roles")
+        self._snapshot_directory = snapshot_directory
+        if snapshot_directory is not None:
+            os.makedirs(snapshot_directory, exist_ok=True)
 
     def _get_name_dict(self, table: str) -> Dict[str, id]:
         name_dict = {}
@@ -44,6 +52,59 @@ class QueryDB:
     def commit(self):
         self._connection.commit()
 
+    def snapshot_directory(self) -> Optional[str]:
+        return self._snapshot_directory
+
+    def set_snapshot_directory(self, snapshot_directory: Optional[str]):
+        self._snapshot_directory = snapshot_directory
+        if snapshot_directory is not None:
+            os.makedirs(snapshot_directory, exist_ok=True)
+
+    def checksum(self, name: str) -> str:
+        # read from the rows of the query set in the current transaction, so every committed write is seen
+        # nodes, edges, predicates and node cardinalities are only inserted and deleted together with their query, which changes the query count or largest id
+        # estimates can also be added to or updated for existing queries, the indexed estimates of the set are summed for them
+        cursor = self._connection.cursor()
+        cursor.execute("""SELECT qs.id, qs.database_id, qq.num_queries, qq.max_query_id, qqc.num_estimates, qqc.estimator_sum, qqc.estimate_sum
+                          FROM query_sets AS qs
+                          CROSS JOIN LATERAL (SELECT count(*) AS num_queries, max(q.id) AS max_query_id
+                                              FROM queries AS q
+                                              WHERE q.set_id = qs.id) AS qq
+                          CROSS JOIN LATERAL (SELECT count(*) AS num_estimates, sum(qc.cardinality_estimator_id) AS estimator_sum, sum(qc.estimate::numeric) AS estimate_sum
+                                              FROM queries AS q
+                                              JOIN query_cardinalities AS qc ON qc.query_id = q.id
+                                              WHERE q.set_id = qs.id) AS qqc
+                          WHERE qs.name = %s
+                          ORDER BY qs.id;""", (name,))
+        rows = cursor.fetchall()
+        cursor.close()
+        return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()
+
+    def _load_snapshot(self, key: Tuple, name: str, load_rows: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        if self._snapshot_directory is None:
+            return load_rows()
+        checksum = self.checksum(name)
+        filepath = os.path.join(self._snapshot_directory, hashlib.sha1(repr(key).encode("utf-8")).hexdigest() + ".snapshot")
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot["checksum"] == checksum and snapshot["key"] == key:
+                return snapshot["rows"]
+            print("Snapshot %s is outdated" % filepath)
+        rows = load_rows()
+        # write to a temporary file first so an interrupted run does not leave a truncated snapshot
+        with open(filepath + ".tmp", 'wb') as f:
+            pickle.dump({"key": key, "checksum": checksum, "rows": rows}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(filepath + ".tmp", filepath)
+        return rows
+
+    def _fetch_all(self, query: str) -> List[Tuple]:
+        cursor = self._connection.cursor()
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
     def get_query_set(self, query_id: int) -> Optional[str]:
         cursor = self._connection.cursor()
         query = "SELECT name FROM query_sets qs JOIN queries q ON q.set_id = qs.id WHERE q.id = %s;" % query_id
@@ -77,37 +138,116 @@ class QueryDB:
                              all_estimates: bool = False,
                              only_with_true_cardinality: bool = False
                              ) -> Tuple[Dict[int, GraphlikeQuery], Dict[int, QueryNode], Dict[GraphlikeQuery, str]]:
+        rows = self._load_snapshot(("query_set", name, estimator_id, cardinality, all_estimates),
+                                   name,
+                                   lambda: self._load_query_set_rows(estimator_id, name, cardinality, all_estimates))
+        return self._build_query_set_dict(schema, rows, only_with_true_cardinality)
+
+    def _load_query_set_rows(self,
+                             estimator_id: int,
+                             name: str,
+                             cardinality: bool,
+                             all_estimates: bool) -> Dict[str, Any]:
         set_id = self._get("query_sets", {"name": name})
-        cursor = self._connection.cursor()
         language_query = """SELECT ql.name
                             FROM query_sets AS qs
                             JOIN databases AS d ON d.id = qs.database_id
                             JOIN query_languages AS ql ON ql.id = d.language_id
                             WHERE qs.name = %s;""" % wrap_value(name)
-        cursor.execute(language_query)
-        language = cursor.fetchone()[0]
         name_query = """SELECT q.id, q.name
                         FROM query_sets AS qs
                         JOIN queries AS q ON q.set_id = qs.id
                         WHERE qs.name = %s;""" % wrap_value(name)
-        cursor.execute(name_query)
+        node_label_query = """SELECT n.id, l.id, l.name
+                              FROM labels AS l
+                              JOIN element_labels AS el ON el.label_id = l.id
+                              JOIN nodes AS n ON n.id = el.element_id
+                              JOIN node_queries AS nq ON nq.node_id = n.id
+                              JOIN queries AS q ON q.id = nq.query_id
+                              WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
+        edge_label_query = """SELECT e.id, l.id, l.name
+                              FROM labels AS l
+                              JOIN element_labels AS el ON el.label_id = l.id
+                              JOIN edges AS e ON e.id = el.element_id
+                              JOIN nodes AS n ON n.id = e.from_id
+                              JOIN node_queries AS nq ON nq.node_id = n.id
+                              JOIN queries AS q ON q.id = nq.query_id
+                              WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
+        node_predicate_query = """SELECT n.id, d.id, p.attribute_name, co.name, p.value, p.positive
+                                  FROM predicates AS p
+                                  JOIN disjunctions AS d ON d.id = p.disjunction_id
+                                  JOIN nodes AS n ON n.id = d.element_id
+                                  JOIN node_queries AS qn ON qn.node_id = n.id
+                                  JOIN queries AS q ON q.id = qn.query_id
+                                  JOIN comparison_operators AS co ON co.id = p.operator_id
+                                  WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
+        edge_predicate_query = """SELECT e.id, d.id, p.attribute_name, co.name, p.value, p.positive
+                                  FROM predicates AS p
+                                  JOIN disjunctions AS d ON d.id = p.disjunction_id
+                                  JOIN edges AS e ON e.id = d.element_id
+                                  JOIN nodes AS n ON n.id = e.from_id
+                                  JOIN node_queries AS qn ON qn.node_id = n.id
+                                  JOIN queries AS q ON q.id = qn.query_id
+                                  JOIN comparison_operators AS co ON co.id = p.operator_id
+                                  WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
+        node_query = """SELECT q.id, n.id, n.virtual, nc.estimate
+                        FROM nodes AS n
+                        JOIN node_queries AS nq ON nq.node_id = n.id
+                        JOIN queries AS q ON q.id = nq.query_id
+                        LEFT OUTER JOIN node_cardinalities AS nc ON nc.node_id = n.id AND cardinality_estimator_id = %d
+                        WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % (estimator_id, set_id)
+        edge_query = """SELECT q.id, e.from_id, e.id, e.to_id, d.name
+                        FROM edges AS e
+                        JOIN nodes AS n ON n.id = e.from_id
+                        JOIN node_queries AS nq ON nq.node_id = n.id
+                        JOIN queries AS q ON q.id = nq.query_id
+                        JOIN directions AS d ON d.id = e.direction_id
+                        WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
+        if all_estimates:
+            condition = ""
+        else:
+            condition = " AND qc.cardinality_estimator_id = 1"
+        cardinality_query = """SELECT q.id, ce.name, qc.estimate
+                               FROM queries AS q
+                               JOIN query_cardinalities AS qc ON qc.query_id = q.id
+                               JOIN cardinality_estimators AS ce ON ce.id = qc.cardinality_estimator_id
+                               WHERE q.set_id = %d AND q.subquery_of_id IS NULL%s;""" % (set_id, condition)
+
+        rows = {"language": self._fetch_all(language_query)[0][0],
+                "names": self._fetch_all(name_query),
+                "node_labels": self._fetch_all(node_label_query),
+                "edge_labels": self._fetch_all(edge_label_query),
+                "node_predicates": self._fetch_all(node_predicate_query),
+                "edge_predicates": self._fetch_all(edge_predicate_query),
+                "nodes": self._fetch_all(node_query),
+                "edges": self._fetch_all(edge_query)}
+        if cardinality:
+            rows["cardinalities"] = self._fetch_all(cardinality_query)
+        else:
+            rows["cardinalities"] = []
+        return rows
+
+    def _build_query_set_dict(self,
+                              schema: GraphlikeSchema,
+                              rows: Dict[str, Any],
+                              only_with_true_cardinality: bool
+                              ) -> Tuple[Dict[int, GraphlikeQuery], Dict[int, QueryNode], Dict[GraphlikeQuery, str]]:
+        language = rows["language"]
         names = {}
-        for id, name in cursor.fetchall():
+        for id, name in rows["names"]:
             if name is None:
                 names[id] = "unnamed query"
             else:
                 names[id] = name
-        cursor.close()
-        node_labels = self._load_node_labels(schema, set_id)
-        edge_labels = self._load_edge_labels(schema, set_id)
-        node_predicates = self._load_node_predicates(node_labels, set_id)
-        edge_predicates = self._load_edge_predicates(edge_labels, set_id)
-        query_nodes, nodes = self._load_nodes(set_id, node_labels, node_predicates, language, estimator_id)
-        edges = self._load_edges(set_id, nodes, edge_labels, edge_predicates, language)
-        if cardinality:
-            cardinalities = self._load_cardinalities(set_id, all_estimates)
-        else:
-            cardinalities = {}
+        node_labels = self._build_labels(schema.node, rows["node_labels"])
+        edge_labels = self._build_labels(schema.edge, rows["edge_labels"])
+        node_predicates = self._build_predicates(node_labels, rows["node_predicates"])
+        edge_predicates = self._build_predicates(edge_labels, rows["edge_predicates"])
+        query_nodes, nodes = self._build_nodes(rows["nodes"], node_labels, node_predicates, language)
+        edges = self._build_edges(rows["edges"], nodes, edge_labels, edge_predicates, language)
+        cardinalities = {}
+        for query_id, estimator, cardinality in rows["cardinalities"]:
+            cardinalities[(query_id, estimator)] = cardinality
 
         queries = {}
         query_names = {}
@@ -200,29 +340,15 @@ class QueryDB:
                                             int,
                                             Dict[GraphlikeQuery, str],
                                             Dict[GraphlikeQuery, Dict[FrozenSet[QueryNode], int]]]:
-        queries, nodes, query_names = self._load_query_set_dict(schema, estimator_id, name, True)
-        set_query = """SELECT qs.id, qs.database_id
-                       FROM query_sets AS qs
-                       WHERE qs.name = %s;""" % wrap_value(name)
-
-        group_query = """SELECT q.id, g.id, nq.node_id, qc.estimate
-                         FROM node_queries AS nq
-                         JOIN queries AS g ON g.id = nq.query_id
-                         JOIN queries AS q ON q.id = g.subquery_of_id
-                         JOIN query_sets AS qs ON qs.id = q.set_id
-                         JOIN query_cardinalities AS qc ON qc.query_id = g.id
-                         JOIN cardinality_estimators AS ce ON ce.id = qc.cardinality_estimator_id
-                         WHERE qs.name = %s AND q.subquery_of_id IS NULL AND ce.name = %s;""" % (wrap_value(name), wrap_value(query_cardinality_estimator))
-
-        cursor = self._connection.cursor()
-        cursor.execute(set_query)
-        set_id, database_id = cursor.fetchone()
-
-        cursor.execute(group_query)
+        rows = self._load_snapshot(("group_cardinalities", name, estimator_id, query_cardinality_estimator),
+                                   name,
+                                   lambda: self._load_group_cardinality_rows(estimator_id, name, query_cardinality_estimator))
+        queries, nodes, query_names = self._build_query_set_dict(schema, rows["query_set"], False)
+        set_id, database_id = rows["set"]
 
         groups = {}
         cardinalities = {}
-        for query_id, group_id, node_id, cardinality in cursor.fetchall():
+        for query_id, group_id, node_id, cardinality in rows["groups"]:
             if query_id not in groups:
                 groups[query_id] = {}
             if group_id not in groups[query_id]:
@@ -230,8 +356,6 @@ class QueryDB:
                 cardinalities[group_id] = cardinality
             groups[query_id][group_id].append(nodes[node_id])
 
-        cursor.close()
-
         node_dict = {}
         for node_id in nodes:
             node_dict[nodes[node_id]] = node_id
@@ -260,25 +384,36 @@ class QueryDB:
                     group_ids[queries[query_id]][group] = group_id
         return annotated_queries, query_dict, node_dict, group_cardinalities, set_id, database_id, query_names, group_ids
 
-    def _load_nodes(self,
-                    set_id: int,
-                    labels: Dict[int, List[SchemaNode]],
-                    predicates: Dict[int, List[Predicate]],
-                    language: str,
-                    estimator_id: int
-                    ) -> Tuple[Dict[int, List[SchemaNode]], Dict[int, SchemaNode]]:
-        cursor = self._connection.cursor()
+    def _load_group_cardinality_rows(self,
+                                     estimator_id: int,
+                                     name: str,
+                                     query_cardinality_estimator: str) -> Dict[str, Any]:
+        set_query = """SELECT qs.id, qs.database_id
+                       FROM query_sets AS qs
+                       WHERE qs.name = %s;""" % wrap_value(name)
 
-        node_query = """SELECT q.id, n.id, n.virtual, nc.estimate
-                        FROM nodes AS n
-                        JOIN node_queries AS nq ON nq.node_id = n.id
-                        JOIN queries AS q ON q.id = nq.query_id
-                        LEFT OUTER JOIN node_cardinalities AS nc ON nc.node_id = n.id AND cardinality_estimator_id = %d
-                        WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % (estimator_id, set_id)
-        cursor.execute(node_query)
+        group_query = """SELECT q.id, g.id, nq.node_id, qc.estimate
+                         FROM node_queries AS nq
+                         JOIN queries AS g ON g.id = nq.query_id
+                         JOIN queries AS q ON q.id = g.subquery_of_id
+                         JOIN query_sets AS qs ON qs.id = q.set_id
+                         JOIN query_cardinalities AS qc ON qc.query_id = g.id
+                         JOIN cardinality_estimators AS ce ON ce.id = qc.cardinality_estimator_id
+                         WHERE qs.name = %s AND q.subquery_of_id IS NULL AND ce.name = %s;""" % (wrap_value(name), wrap_value(query_cardinality_estimator))
+
+        return {"query_set": self._load_query_set_rows(estimator_id, name, True, False),
+                "set": tuple(self._fetch_all(set_query)[0]),
+                "groups": self._fetch_all(group_query)}
+
+    def _build_nodes(self,
+                     rows: List[Tuple[int, int, bool, Optional[float]]],
+                     labels: Dict[int, List[SchemaNode]],
+                     predicates: Dict[int, List[Predicate]],
+                     language: str
+                     ) -> Tuple[Dict[int, List[SchemaNode]], Dict[int, SchemaNode]]:
         nodes = {}
         query_nodes = {}
-        for query_id, node_id, virtual, estimate in cursor.fetchall():
+        for query_id, node_id, virtual, estimate in rows:
             node_labels = []
             if node_id in labels:
                 node_labels = labels[node_id]
@@ -326,26 +461,14 @@ class QueryDB:
                 raise NotImplementedError()
         return nodes
 
-    def _load_edges(self,
-                    set_id: int,
-                    nodes: Dict[int, QueryNode],
-                    labels: Dict[int, List[SchemaEdge]],
-                    predicates: Dict[int, List[Predicate]],
-                    language: str) -> Dict[int, List[Tuple[QueryNode, QueryEdge, QueryNode]]]:
-        cursor = self._connection.cursor()
-
-        edge_query = """SELECT q.id, e.from_id, e.id, e.to_id, d.name
-                        FROM edges AS e
-                        JOIN nodes AS n ON n.id = e.from_id
-                        JOIN node_queries AS nq ON nq.node_id = n.id
-                        JOIN queries AS q ON q.id = nq.query_id
-                        JOIN directions AS d ON d.id = e.direction_id
-                        WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
-
-        cursor.execute(edge_query)
-
+    def _build_edges(self,
+                     rows: List[Tuple[int, int, int, int, str]],
+                     nodes: Dict[int, QueryNode],
+                     labels: Dict[int, List[SchemaEdge]],
+                     predicates: Dict[int, List[Predicate]],
+                     language: str) -> Dict[int, List[Tuple[QueryNode, QueryEdge, QueryNode]]]:
         edges = {}
-        for query_id, from_id, edge_id, to_id, direction_name in cursor.fetchall():
+        for query_id, from_id, edge_id, to_id, direction_name in rows:
             edge_labels = []
             if edge_id in labels:
                 edge_labels = labels[edge_id]
@@ -362,8 +485,6 @@ class QueryDB:
                 edges[query_id] = []
             edges[query_id].append((nodes[from_id], edge, nodes[to_id]))
 
-        cursor.close()
-
         return edges
 
     def _load_edges_query(self,
@@ -406,29 +527,19 @@ class QueryDB:
 
         return edges
 
-    def _load_node_labels(self, schema: GraphlikeSchema, set_id: int) -> Dict[int, List[SchemaNode]]:
-        label_query = """SELECT n.id, l.id, l.name
-                         FROM labels AS l
-                         JOIN element_labels AS el ON el.label_id = l.id
-                         JOIN nodes AS n ON n.id = el.element_id
-                         JOIN node_queries AS nq ON nq.node_id = n.id
-                         JOIN queries AS q ON q.id = nq.query_id
-                         WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
-        cursor = self._connection.cursor()
-        cursor.execute(label_query)
-
-        label_dict: Dict[int, SchemaNode] = {}
-        labels: Dict[int, List[SchemaNode]] = {}
-        for element_id, label_id, label_name in cursor.fetchall():
+    def _build_labels(self,
+                      lookup: Callable[[str], Union[SchemaNode, SchemaEdge]],
+                      rows: List[Tuple[int, int, str]]) -> Dict[int, List[Union[SchemaNode, SchemaEdge]]]:
+        label_dict: Dict[int, Union[SchemaNode, SchemaEdge]] = {}
+        labels: Dict[int, List[Union[SchemaNode, SchemaEdge]]] = {}
+        for element_id, label_id, label_name in rows:
             if label_id not in label_dict:
-                label_dict[label_id] = schema.node(label_name)
+                label_dict[label_id] = lookup(label_name)
 
             if element_id not in labels:
                 labels[element_id] = []
             labels[element_id].append(label_dict[label_id])
 
-        cursor.close()
-
         return labels
 
     def _load_node_labels_query(self, schema: GraphlikeSchema, query_id: int) -> Dict[int, List[SchemaNode]]:
@@ -456,32 +567,6 @@ class QueryDB:
 
         return labels
 
-    def _load_edge_labels(self, schema: GraphlikeSchema, set_id: int) -> Dict[int, List[SchemaEdge]]:
-        label_query = """SELECT e.id, l.id, l.name
-                         FROM labels AS l
-                         JOIN element_labels AS el ON el.label_id = l.id
-                         JOIN edges AS e ON e.id = el.element_id
-                         JOIN nodes AS n ON n.id = e.from_id
-                         JOIN node_queries AS nq ON nq.node_id = n.id
-                         JOIN queries AS q ON q.id = nq.query_id
-                         WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
-        cursor = self._connection.cursor()
-        cursor.execute(label_query)
-
-        label_dict: Dict[int, SchemaEdge] = {}
-        labels: Dict[int, List[SchemaEdge]] = {}
-        for element_id, label_id, label_name in cursor.fetchall():
-            if label_id not in label_dict:
-                label_dict[label_id] = schema.edge(label_name)
-
-            if element_id not in labels:
-                labels[element_id] = []
-            labels[element_id].append(label_dict[label_id])
-
-        cursor.close()
-
-        return labels
-
     def _load_edge_labels_query(self, schema: GraphlikeSchema, query_id: int) -> Dict[int, List[SchemaEdge]]:
         label_query = """SELECT e.id, l.id, l.name
                          FROM labels AS l
@@ -508,23 +593,6 @@ class QueryDB:
 
         return labels
 
-    def _load_node_predicates(self,
-                              node_labels: Dict[int, List[SchemaNode]],
-                              set_id: int) -> Dict[int, List[List[Predicate]]]:
-        node_predicate_query = """SELECT n.id, d.id, p.attribute_name, co.name, p.value, p.positive
-                                  FROM predicates AS p
-                                  JOIN disjunctions AS d ON d.id = p.disjunction_id
-                                  JOIN nodes AS n ON n.id = d.element_id
-                                  JOIN node_queries AS qn ON qn.node_id = n.id
-                                  JOIN queries AS q ON q.id = qn.query_id
-                                  JOIN comparison_operators AS co ON co.id = p.operator_id
-                                  WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
-        cursor = self._connection.cursor()
-        cursor.execute(node_predicate_query)
-        predicate_dict = self._build_predicates(node_labels, cursor.fetchall())
-        cursor.close()
-        return predicate_dict
-
     def _load_node_predicates_query(self,
                                     node_labels: Dict[int, List[SchemaNode]],
                                     query_id: int) -> Dict[int, List[List[Predicate]]]:
@@ -542,24 +610,6 @@ class QueryDB:
         cursor.close()
         return predicate_dict
 
-    def _load_edge_predicates(self,
-                              edge_labels: Dict[int, List[SchemaNode]],
-                              set_id: int) -> Dict[int, List[List[Predicate]]]:
-        edge_predicate_query = """SELECT e.id, d.id, p.attribute_name, co.name, p.value, p.positive
-                                  FROM predicates AS p
-                                  JOIN disjunctions AS d ON d.id = p.disjunction_id
-                                  JOIN edges AS e ON e.id = d.element_id
-                                  JOIN nodes AS n ON n.id = e.from_id
-                                  JOIN node_queries AS qn ON qn.node_id = n.id
-                                  JOIN queries AS q ON q.id = qn.query_id
-                                  JOIN comparison_operators AS co ON co.id = p.operator_id
-                                  WHERE q.set_id = %d AND q.subquery_of_id IS NULL;""" % set_id
-        cursor = self._connection.cursor()
-        cursor.execute(edge_predicate_query)
-        predicate_dict = self._build_predicates(edge_labels, cursor.fetchall())
-        cursor.close()
-        return predicate_dict
-
     def _load_edge_predicates_query(self,
                                     edge_labels: Dict[int, List[SchemaNode]],
                                     query_id: int) -> Dict[int, List[List[Predicate]]]:
@@ -616,28 +666,6 @@ class QueryDB:
             elements[element_id] = disjunctions
         return elements
 
-    def _load_cardinalities(self, set_id: int, all: bool) -> Dict[Tuple[int, str], int]:
-        if all:
-            condition = ""
-        else:
-            condition = " AND qc.cardinality_estimator_id = 1"
-        label_query = """SELECT q.id, ce.name, qc.estimate
-                         FROM queries AS q
-                         JOIN query_cardinalities AS qc ON qc.query_id = q.id
-                         JOIN cardinality_estimators AS ce ON ce.id = qc.cardinality_estimator_id
-                         WHERE q.set_id = %d AND q.subquery_of_id IS NULL%s;""" % (set_id, condition)
-        cursor = self._connection.cursor()
-        cursor.execute(label_query)
-
-        cardinalities = {}
-        for query_id, estimator, cardinality in cursor.fetchall():
-            cardinalities[(query_id, estimator)] = cardinality
-
-        cursor.close()
-
-        return cardinalities
-
-
     def _load_cardinalities_query(self, query_id: int, all: bool) -> Dict[str, int]:
         if all:
             condition = ""
@@ -689,14 +717,23 @@ class QueryDB:
                      ) -> Tuple[int, int, List[Tuple[int, Dict[QueryNode, int]]]]:
         database_id = self._get("databases", {"name": database_name})
         set_id = self._get_or_create("query_sets", {"name": name, "database_id": database_id})
+        writer = BulkQueryWriter(self._connection, self._directions, self._operators, database_id, set_id)
         query_ids = []
-        for i, query in enumerate(queries):
-            if query in latencies:
-                query_ids.append(self.save_query(query, database_id, set_id, estimator_id, latencies=latencies[query]))
-            else:
-                query_ids.append(self.save_query(query, database_id, set_id, estimator_id))
-            print(i)
+        start = time.time()
+        try:
+            for i, query in enumerate(queries):
+                if query in latencies:
+                    query_ids.append(writer.add_query(query, estimator_id, latencies=latencies[query]))
+                else:
+                    query_ids.append(writer.add_query(query, estimator_id))
+                if (i + 1) % 1000 == 0:
+                    print("%d queries (%.1f queries/s)" % (i + 1, (i + 1) / (time.time() - start)))
+            writer.flush()
+        except BaseException:
+            self._connection.rollback()
+            raise
         self._connection.commit()
+        print("Saved %d queries (%.1f queries/s)" % (len(queries), len(queries) / max(time.time() - start, 1e-9)))
         return database_id, set_id, query_ids
 
     def save_query(self,
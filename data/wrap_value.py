@@ -1,5 +1,6 @@
 
 import datetime
+from typing import Optional
 
 
 def wrap_value(value) -> str:
@@ -13,3 +14,14 @@ def wrap_value(value) -> str:
         return "'%s'" % value.replace("'", "''")
     else:
         return str(value)
+
+
+def value_string(value) -> Optional[str]:
+    if value is None:
+        return None
+    elif isinstance(value, datetime.datetime):
+        return datetime.datetime.strftime(value, "%Y-%m-%d %H:%M:%S")
+    elif isinstance(value, datetime.date):
+        return datetime.datetime.strftime(value, "%Y-%m-%d")
+    else:
+        return str(value)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+
+class BitmapCache:
+    def __init__(self, capacity: int = 100000) -> None:
+        self._capacity = capacity
+        self._bitmaps: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def capacity(self) -> int:
+        return self._capacity
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+            self._bitmaps.move_to_end(key)
+            # callers must not modify the cached bitmap
+            bitmap = bitmap.view()
+            bitmap.flags.writeable = False
+        return bitmap
+
+    def put(self, key: str, bitmap: np.ndarray):
+        self._bitmaps[key] = bitmap.copy()
+        self._bitmaps.move_to_end(key)
+        while len(self._bitmaps) > self._capacity:
+            self._bitmaps.popitem(last=False)
+
+    def hits(self) -> int:
+        return self._hits
+
+    def misses(self) -> int:
+        return self._misses
+
+    def hit_rate(self) -> float:
+        if self._hits + self._misses == 0:
+            return 0
+        return self._hits / (self._hits + self._misses)
+
+    def stats(self) -> str:
+        return "%d hits, %d misses (%.2f hit rate), %d bitmaps" % (self._hits, self._misses, self.hit_rate(), len(self._bitmaps))
+
+    def clear(self):
+        self._bitmaps = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._bitmaps)
+
+    def save(self, filepath: str):
+        keys = list(self._bitmaps.keys())
+        bitmaps = [self._bitmaps[key] for key in keys]
+        offsets = np.cumsum([0] + [len(bitmap) for bitmap in bitmaps])
+        values = np.concatenate(bitmaps) if len(bitmaps) > 0 else np.zeros(0)
+        with open(filepath, 'wb') as f:
+            np.savez(f, keys=np.array(keys, dtype=str), offsets=offsets, values=values)
+
+    @staticmethod
+    def load(filepath: str, capacity: int = 100000) -> BitmapCache:
+        bitmap_cache = BitmapCache(capacity)
+        with np.load(filepath) as data:
+            keys = data["keys"]
+            offsets = data["offsets"]
+            values = data["values"]
+        for i, key in enumerate(keys):
+            bitmap_cache.put(str(key), values[offsets[i]:offsets[i + 1]])
+        return bitmap_cache
@@ -1,5 +1,7 @@
+from multiprocessing.pool import Pool
 from threading import Thread
 import torch
+import torch.multiprocessing
 from typing import List, Optional
 from torch import LongTensor, BoolTensor
 from torch_geometric.loader import DataLoader
@@ -14,6 +16,7 @@ from query_data.bulk_light_relation_query_data import BulkLightRelationQueryData
 from query_data.bulk_relation_query_data import BulkRelationQueryData
 from query_data.cardinality_relation_query_data import CardinalityRelationQueryData
 from query_data.graphlike_query_data import GraphlikeQueryData
+from schema.sql.sql_schema import SQLSchema
 import numpy as np
 
 
@@ -46,17 +49,72 @@ class CardinalityRelationDataGenerator:
                  encoder: Encoder,
                  relation_generators: List[CardinalityRelationGenerator],
                  device: torch.device,
-                 reuse_chance: float = 0.5) -> None:
+                 reuse_chance: float = 0.5,
+                 num_processes: int = 0,
+                 seed: Optional[int] = None) -> None:
         self._query_generator = query_generator
         self._encoder = encoder
         self._relation_generators = relation_generators
         self._device = device
         self._reuse_chance = reuse_chance
+        self._num_processes = num_processes
+        self._seed = seed
+        self._pool: Optional[Pool] = None
+
+    def num_processes(self) -> int:
+        return self._num_processes
+
+    def set_num_processes(self, num_processes: int):
+        if num_processes != self._num_processes:
+            self.close()
+        self._num_processes = num_processes
+
+    def close(self, terminate: bool = False):
+        if self._pool is not None:
+            if terminate:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # workers may still be busy if generation raised, they are not waited for
+        self.close(terminate=exc_type is not None)
+
+    def _generate_in_processes(self, method_name: str, num_relations: int) -> list:
+        if self._pool is None:
+            if self._seed is None:
+                seed = random.randrange(2**31)
+            else:
+                seed = self._seed
+            # workers are forked so that they inherit the generator, they open their own connections in initialize_relation_process
+            self._pool = torch.multiprocessing.get_context("fork").Pool(self._num_processes,
+                                                                         initializer=initialize_relation_process,
+                                                                         initargs=(self, seed))
+        num_divided = num_relations // self._num_processes
+        num_modulo = num_relations % self._num_processes
+        tasks = []
+        for i in range(self._num_processes):
+            if i < num_modulo:
+                tasks.append((method_name, num_divided + 1))
+            elif num_divided > 0:
+                tasks.append((method_name, num_divided))
+        results = self._pool.starmap(generate_relations_process, tasks)
+        relations = sum(results, [])
+        for relation in relations:
+            relation.to(self._device, non_blocking=True)
+        return relations
 
     def generate_cardinality_relations_parallel(self,
                                                 num_relations: int,
                                                 num_threads: int = 8
                                                 ) -> List[CardinalityRelationQueryData]:
+        if self._num_processes > 0:
+            return self._generate_in_processes("generate_cardinality_relations", num_relations)
         num_divided = num_relations // num_threads
         num_modulo = num_relations % num_threads
         results = [None] * num_threads
@@ -123,6 +181,8 @@ class CardinalityRelationDataGenerator:
                                                      num_relations: int,
                                                      num_threads: int = 8
                                                      ) -> List[BulkRelationQueryData]:
+        if self._num_processes > 0:
+            return self._generate_in_processes("generate_bulk_cardinality_relations", num_relations)
         num_divided = num_relations // num_threads
         num_modulo = num_relations % num_threads
         results = [None] * num_threads
@@ -161,6 +221,8 @@ class CardinalityRelationDataGenerator:
                                                            num_relations: int,
                                                            num_threads: int = 8
                                                            ) -> List[BulkRelationQueryData]:
+        if self._num_processes > 0:
+            return self._generate_in_processes("generate_bulk_light_cardinality_relations", num_relations)
         num_divided = num_relations // num_threads
         num_modulo = num_relations % num_threads
         results = [None] * num_threads
@@ -199,6 +261,8 @@ class CardinalityRelationDataGenerator:
                                                           num_relations: int,
                                                           num_threads: int = 8
                                                           ) -> List[BulkRelationQueryData]:
+        if self._num_processes > 0:
+            return self._generate_in_processes("generate_bulk_mscn_cardinality_relations", num_relations)
         num_divided = num_relations // num_threads
         num_modulo = num_relations % num_threads
         results = [None] * num_threads
@@ -246,4 +310,31 @@ def generate_bulk_light_relations(generator: CardinalityRelationDataGenerator, n
     results[result_index] = generator.generate_bulk_light_cardinality_relations(num_relations)
 
 def generate_bulk_mscn_relations(generator: CardinalityRelationDataGenerator, num_relations: int, results: List[Optional[List[BulkLightRelationQueryData]]], result_index: int):
-    results[result_index] = generator.generate_bulk_mscn_cardinality_relations(num_relations)
\ No newline at end of file
+    results[result_index] = generator.generate_bulk_mscn_cardinality_relations(num_relations)
+
+
+_process_generator: Optional[CardinalityRelationDataGenerator] = None
+_inherited_connections = []
+
+def initialize_relation_process(generator: CardinalityRelationDataGenerator, seed: int):
+    global _process_generator
+    worker_seed = seed + torch.multiprocessing.current_process()._identity[0]
+    random.seed(worker_seed)
+    np.random.seed(worker_seed % 2**32)
+    torch.manual_seed(worker_seed)
+
+    schemas = {relation_generator.schema() for relation_generator in generator._relation_generators}
+    schemas.add(generator._encoder.schema())
+    for schema in schemas:
+        if isinstance(schema, SQLSchema):
+            # the forked connection is shared with the parent, it must neither be used nor garbage collected here
+            _inherited_connections.append(schema.reconnect())
+    generator._query_generator.reconnect(worker_seed)
+    for relation_generator in generator._relation_generators:
+        relation_generator.reconnect(worker_seed)
+    generator._device = torch.device("cpu")
+    generator._pool = None
+    _process_generator = generator
+
+def generate_relations_process(method_name: str, num_relations: int) -> list:
+    return getattr(_process_generator, method_name)(num_relations)
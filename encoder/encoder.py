@@ -2,9 +2,10 @@ import hashlib
 import re
 from decimal import Decimal
 
-from torch import LongTensor, FloatTensor, BoolTensor
-from torch_geometric.data import HeteroData
+from torch import LongTensor, FloatTensor, BoolTensor, IntTensor
+from torch_geometric.data import Data, HeteroData
 
+from encoder.predicate_encoding_cache import PredicateEncodingCache
 from encoder.sampler import Sampler
 from query.sql.sql_query import SQLQuery
 from query.symmetry.cardinality_relation import CardinalityRelation, RelationType
@@ -18,7 +19,7 @@ from query_data.bulk_relation_query_data import BulkRelationQueryData
 from query_data.cardinality_query_data import CardinalityQueryData
 from query_data.graphlike_query_data import GraphlikeQueryData
 from schema.attribute import Attribute, NumericAttribute
-from schema.comparison_operator import OPERATORS
+from schema.comparison_operator import ComparisonOperator, OPERATORS
 from schema.data_type import EncodingType
 from query.query_node import QueryNode
 from query.query_edge import EdgeDirection, QueryEdge
@@ -36,6 +37,8 @@ import torch
 from enum import Enum
 from schema.sql.sql_foreign_key import SQLForeignKey
 from schema.sql.sql_schema import SQLSchema
+from schema.sql.sql_table import SQLTable
+from query.sql.sql_table_instance import SQLTableInstance
 
 
 class CostMode(Enum):
@@ -49,12 +52,26 @@ class Encoder:
                  sampler: Optional[Sampler] = None,
                  eliminate_lesser: bool = True,
                  num_buckets: int = 10,
-                 attribute_table_order: Optional[List[str]] = None
+                 attribute_table_order: Optional[List[str]] = None,
+                 index_encoding: bool = False,
+                 packed_samples: bool = False,
+                 predicate_cache: Optional[PredicateEncodingCache] = None
                  ) -> None:
         self._schema = schema
         self._sampler = sampler
         self._eliminate_lesser = eliminate_lesser
         self._num_buckets = num_buckets
+        # with index encoding, edge labels and MSCN attributes and operators are emitted as int32 ids for embedding layers
+        self._index_encoding = index_encoding
+        # with packed samples, the 0/1 part of sample bitmaps is stored as bits and the fused column separately
+        self._packed_samples = packed_samples
+        self._virtual_nodes: Dict[SQLTable, SQLTableInstance] = {}
+        if predicate_cache is None:
+            predicate_cache = PredicateEncodingCache()
+        self._predicate_cache = predicate_cache
+        self._predicate_version = None
+        # bucket of every character n-gram of LIKE patterns seen so far
+        self._ngram_buckets: Dict[str, int] = {}
 
         node_labels = []
         edge_labels = []
@@ -82,27 +99,70 @@ class Encoder:
         self.num_nodes, self.node_dict, self.node_index = Encoder.one_hot_encoding(node_labels, sort_key=lambda n: n.name())
         self.no_node_labels = np.zeros(self.num_nodes)
         self.all_node_labels = np.ones(self.num_nodes)
-        self.num_edges, self.edge_dict, _ = Encoder.one_hot_encoding(edge_labels, sort_key=lambda n: n.name())
+        self.num_edges, self.edge_dict, self.edge_index = Encoder.one_hot_encoding(edge_labels, sort_key=lambda n: n.name())
         self.no_edge_labels = np.zeros(self.num_edges)
         self.all_edge_labels = np.ones(self.num_edges)
         if isinstance(schema, SQLSchema):
             for attribute in attribute_nodes:
                 assert(len(attribute_nodes[attribute]) == 1)
             if attribute_table_order is None:
-                self.num_attributes, self.attribute_dict, _ = Encoder.one_hot_encoding(attributes, sort_key=lambda a: (a.name(), attribute_nodes[a][0].name()))
+                self.num_attributes, self.attribute_dict, self.attribute_index = Encoder.one_hot_encoding(attributes, sort_key=lambda a: (a.name(), attribute_nodes[a][0].name()))
             else:
                 table_order_dict = {table: i for i, table in enumerate(attribute_table_order)}
-                self.num_attributes, self.attribute_dict, _ = Encoder.one_hot_encoding(attributes, sort_key=lambda a: (table_order_dict[attribute_nodes[a][0].name()], a.name()))
+                self.num_attributes, self.attribute_dict, self.attribute_index = Encoder.one_hot_encoding(attributes, sort_key=lambda a: (table_order_dict[attribute_nodes[a][0].name()], a.name()))
         else:
             raise NotImplementedError()
         self.num_operators, self.operator_dict, _ = Encoder.one_hot_encoding(operators, sort_key=lambda o: o.symbol())
 
+    def schema(self) -> GraphlikeSchema:
+        return self._schema
+
     def sampler(self) -> Optional[Sampler]:
         return self._sampler
 
     def set_sampler(self, sampler: Sampler):
         self._sampler = sampler
 
+    def index_encoding(self) -> bool:
+        return self._index_encoding
+
+    def packed_samples(self) -> bool:
+        return self._packed_samples
+
+    def predicate_cache(self) -> PredicateEncodingCache:
+        return self._predicate_cache
+
+    def set_predicate_cache(self, predicate_cache: PredicateEncodingCache):
+        self._predicate_cache = predicate_cache
+
+    def predicate_version(self) -> str:
+        # everything predicate encodings depend on, encoders with the same version can share cached encodings
+        if self._predicate_version is None:
+            version_hash = hashlib.sha1()
+            version_hash.update(repr((self._num_buckets, self._index_encoding)).encode("utf-8"))
+            version_hash.update(repr(sorted((int(np.argmax(self.attribute_dict[attribute])), attribute.name()) for attribute in self.attribute_dict)).encode("utf-8"))
+            version_hash.update(repr(sorted((int(np.argmax(self.operator_dict[operator])), operator.symbol()) for operator in self.operator_dict)).encode("utf-8"))
+            self._predicate_version = version_hash.hexdigest()
+        return self._predicate_version
+
+    def config_hash(self) -> Optional[str]:
+        config_hash = hashlib.sha1()
+        config_hash.update(repr((self._eliminate_lesser, self._num_buckets)).encode("utf-8"))
+        if self._index_encoding:
+            config_hash.update(b"index_encoding")
+        if self._packed_samples:
+            config_hash.update(b"packed_samples")
+        for one_hot in [self.node_dict, self.edge_dict]:
+            config_hash.update(repr(sorted((int(np.argmax(one_hot[label])), label.name()) for label in one_hot)).encode("utf-8"))
+        config_hash.update(repr(sorted((int(np.argmax(self.attribute_dict[attribute])), attribute.name()) for attribute in self.attribute_dict)).encode("utf-8"))
+        config_hash.update(repr(sorted((int(np.argmax(self.operator_dict[operator])), operator.symbol()) for operator in self.operator_dict)).encode("utf-8"))
+        if self._sampler is not None:
+            sampler_version = self._sampler.version()
+            if sampler_version is None:
+                return None
+            config_hash.update(sampler_version.encode("utf-8"))
+        return config_hash.hexdigest()
+
     def attribute_encoding_size(self) -> int:
         return self.num_attributes
 
@@ -279,10 +339,31 @@ class Encoder:
                 array += self.edge_dict[label]
             return array
 
+    def encode_edge_label_id(self, labels: List[SchemaEdge]) -> int:
+        if len(labels) != 1:
+            # only single label edges, like SQL joins, have an id
+            raise ValueError()
+        return self.edge_index[labels[0]]
+
+    def _edge_label_tensor(self, edge_labels: List[Any]) -> torch.Tensor:
+        if self._index_encoding:
+            return torch.from_numpy(np.array(edge_labels, dtype=np.int32))
+        elif edge_labels == []:
+            return torch.empty((0, self.edge_encoding_size()))
+        else:
+            return torch.Tensor(np.stack(edge_labels))
+
     def encode_attribute(self, attribute: Attribute) -> np.ndarray:
         return self.attribute_dict[attribute]
 
     def encode_predicate(self, predicate: Predicate) -> np.ndarray:
+        key = (self.predicate_version(), "graph", predicate.attribute(), predicate.operator(), PredicateEncodingCache.value_key(predicate.value()), predicate.positive())
+        encoding = self._predicate_cache.get(key)
+        if encoding is None:
+            encoding = self._predicate_cache.put(key, self._encode_predicate(predicate))
+        return encoding
+
+    def _encode_predicate(self, predicate: Predicate) -> np.ndarray:
         attribute = predicate.attribute()
         operator = predicate.operator()
         value = predicate.value()
@@ -351,6 +432,9 @@ class Encoder:
         shared_node_conjunction_index = []
         my_batch = []
 
+        if self._sampler is not None:
+            self._sampler.prefetch(queries)
+
         node_count = 0
         shared_node_count = 0
         shared_disjunction_count = 0
@@ -386,17 +470,19 @@ class Encoder:
 
             for from_node in nodes:
                 for edge, to_node in query.edges_from(from_node):
-                    edge_labels.append(self.encode_edge_labels(edge.labels()))
+                    if self._index_encoding:
+                        edge_labels.append(self.encode_edge_label_id(edge.labels()))
+                    else:
+                        edge_labels.append(self.encode_edge_labels(edge.labels()))
                     edge_index.append((node_dict[from_node], node_dict[to_node]))
 
 
         node_index = torch.LongTensor(node_index)
         if edge_index == []:
             edge_index = torch.empty((2, 0), dtype=torch.int64)
-            edge_labels = torch.empty((0, self.edge_encoding_size()))
         else:
             edge_index = torch.LongTensor(np.transpose(np.stack(edge_index)))
-            edge_labels = torch.Tensor(np.stack(edge_labels))
+        edge_labels = self._edge_label_tensor(edge_labels)
         shared_node_labels = torch.LongTensor(np.stack(shared_node_labels))
         shared_node_cardinalities = torch.Tensor(shared_node_cardinalities)
         shared_node_samples = torch.Tensor(np.stack(shared_node_samples))
@@ -474,6 +560,9 @@ class Encoder:
         shared_node_samples = []
         my_batch = []
 
+        if self._sampler is not None:
+            self._sampler.prefetch(queries)
+
         node_count = 0
         shared_node_count = 0
         for query_count, query in enumerate(queries):
@@ -502,17 +591,19 @@ class Encoder:
 
             for from_node in nodes:
                 for edge, to_node in query.edges_from(from_node):
-                    edge_labels.append(self.encode_edge_labels(edge.labels()))
+                    if self._index_encoding:
+                        edge_labels.append(self.encode_edge_label_id(edge.labels()))
+                    else:
+                        edge_labels.append(self.encode_edge_labels(edge.labels()))
                     edge_index.append((node_dict[from_node], node_dict[to_node]))
 
 
         node_index = torch.LongTensor(node_index)
         if edge_index == []:
             edge_index = torch.empty((2, 0), dtype=torch.int64)
-            edge_labels = torch.empty((0, self.edge_encoding_size()))
         else:
             edge_index = torch.LongTensor(np.transpose(np.stack(edge_index)))
-            edge_labels = torch.Tensor(np.stack(edge_labels))
+        edge_labels = self._edge_label_tensor(edge_labels)
         shared_node_labels = torch.LongTensor(np.stack(shared_node_labels))
         shared_node_cardinalities = torch.Tensor(shared_node_cardinalities)
         shared_node_samples = torch.Tensor(np.stack(shared_node_samples))
@@ -536,7 +627,7 @@ class Encoder:
             else:
                 cardinalities.append(-1)
         cardinalities = torch.Tensor(cardinalities)
-        return BulkLightCardinalityQueryData(*base_encodings, cardinalities)
+        return self._pack_samples(self._add_message_edges(BulkLightCardinalityQueryData(*base_encodings, cardinalities)))
 
     def bulk_light_encode_relation(self, cardinality_relation: CardinalityRelation) -> BulkLightRelationQueryData:
         queries = []
@@ -557,7 +648,7 @@ class Encoder:
         right = LongTensor(np.stack(right))
         equal = BoolTensor(equal)
 
-        return BulkLightRelationQueryData(*base_encodings, left, right, equal)
+        return self._pack_samples(self._add_message_edges(BulkLightRelationQueryData(*base_encodings, left, right, equal)))
 
     def _bulk_mscn_encode_base(self,
                                queries: List[SQLQuery]
@@ -570,7 +661,8 @@ class Encoder:
                                           FloatTensor,  # shared_node_samples
                                           FloatTensor,  # shared_node_predicates
                                           LongTensor,  # shared_node_predicate_index
-                                          LongTensor  # my_batch
+                                          LongTensor,  # my_batch
+                                          Optional[IntTensor]  # shared_node_predicate_ids
                                           ]:
         shared_nodes = {}
         virtual_tables = {}
@@ -601,7 +693,8 @@ class Encoder:
                     else:
                         shared_nodes[node] = shared_node_count
                     shared_node_labels.append(self.node_index[node.table()])
-                    shared_node_label_vectors.append(self.encode_node_labels(node.labels()))
+                    if not self._index_encoding:
+                        shared_node_label_vectors.append(self.encode_node_labels(node.labels()))
                     shared_node_cardinalities.append(np.log(node.cardinality()))
                     if self._sampler is not None:
                         shared_node_samples.append(self._sampler.bitmap_padded(node))
@@ -627,26 +720,39 @@ class Encoder:
 
             for from_node in nodes:
                 for edge, to_node in query.edges_from(from_node):
-                    edge_labels.append(self.encode_edge_labels(edge.labels()))
+                    if self._index_encoding:
+                        edge_labels.append(self.encode_edge_label_id(edge.labels()))
+                    else:
+                        edge_labels.append(self.encode_edge_labels(edge.labels()))
                     edge_index.append((node_dict[from_node], node_dict[to_node]))
 
 
         node_index = torch.LongTensor(node_index)
         if edge_index == []:
             edge_index = torch.empty((2, 0), dtype=torch.int64)
-            edge_labels = torch.empty((0, self.edge_encoding_size()))
         else:
             edge_index = torch.LongTensor(np.transpose(np.stack(edge_index)))
-            edge_labels = torch.Tensor(np.stack(edge_labels))
+        edge_labels = self._edge_label_tensor(edge_labels)
         shared_node_labels = torch.LongTensor(np.stack(shared_node_labels))
-        shared_node_label_vectors = torch.Tensor(np.stack(shared_node_label_vectors))
+        if self._index_encoding:
+            # the model embeds shared_node_labels instead
+            shared_node_label_vectors = torch.empty((len(shared_node_labels), 0))
+        else:
+            shared_node_label_vectors = torch.Tensor(np.stack(shared_node_label_vectors))
         shared_node_cardinalities = torch.Tensor(shared_node_cardinalities)
         shared_node_samples = torch.Tensor(np.stack(shared_node_samples))
+        shared_node_predicate_ids = None
         if shared_node_predicates == []:
-            shared_node_predicates = torch.empty((0, self.mscn_predicate_size()))
+            shared_node_predicates = torch.empty((0, self.mscn_predicate_encoding_size()))
             shared_node_predicate_index = torch.empty((2, 0), dtype=torch.int64)
+            if self._index_encoding:
+                shared_node_predicate_ids = torch.empty((0, 2), dtype=torch.int32)
         else:
-            shared_node_predicates = torch.Tensor(np.stack(shared_node_predicates))
+            shared_node_predicates = np.stack(shared_node_predicates)
+            if self._index_encoding:
+                shared_node_predicate_ids = torch.from_numpy(shared_node_predicates[:, :2].astype(np.int32))
+                shared_node_predicates = shared_node_predicates[:, 2:]
+            shared_node_predicates = torch.Tensor(shared_node_predicates)
             shared_node_predicate_index = torch.LongTensor(np.transpose(np.stack(shared_node_predicate_index)))
         my_batch = torch.LongTensor(my_batch)
 
@@ -659,10 +765,11 @@ class Encoder:
                 shared_node_samples,
                 shared_node_predicates,
                 shared_node_predicate_index,
-                my_batch)
+                my_batch,
+                shared_node_predicate_ids)
 
     def bulk_mscn_encode_cardinality(self, queries: List[SQLQuery]) -> BulkMSCNCardinalityQueryData:
-        base_encodings = self._bulk_mscn_encode_base(queries)
+        *base_encodings, shared_node_predicate_ids = self._bulk_mscn_encode_base(queries)
         cardinalities = []
         for query in queries:
             cardinality_estimates = query.cardinality_estimates()
@@ -671,7 +778,7 @@ class Encoder:
             else:
                 cardinalities.append(-1)
         cardinalities = torch.Tensor(cardinalities)
-        return BulkMSCNCardinalityQueryData(*base_encodings, cardinalities)
+        return self._pack_samples(BulkMSCNCardinalityQueryData(*base_encodings, cardinalities, shared_node_predicate_ids=shared_node_predicate_ids))
 
     def bulk_mscn_encode_relation(self, cardinality_relation: CardinalityRelation) -> BulkMSCNRelationQueryData:
         queries = []
@@ -687,12 +794,374 @@ class Encoder:
             queries.append(query)
         equal = [cardinality_relation.type() == RelationType.EQUAL]
 
-        base_encodings = self._bulk_mscn_encode_base(queries)
+        *base_encodings, shared_node_predicate_ids = self._bulk_mscn_encode_base(queries)
         left = LongTensor(np.stack(left))
         right = LongTensor(np.stack(right))
         equal = BoolTensor(equal)
 
-        return BulkMSCNRelationQueryData(*base_encodings, left, right, equal)
+        return self._pack_samples(BulkMSCNRelationQueryData(*base_encodings, left, right, equal, shared_node_predicate_ids=shared_node_predicate_ids))
+
+    def _add_message_edges(self, data: Data) -> Data:
+        # the edges of both directions sorted by target node, so that messages can be aggregated with segment reductions
+        # message_edge is the edge of each message and message_reversed whether the message goes against the edge direction
+        edge_index = data.edge_index.numpy()
+        sources = np.concatenate([edge_index[0], edge_index[1]])
+        targets = np.concatenate([edge_index[1], edge_index[0]])
+        order = np.argsort(targets, kind="stable")
+        data.message_index = torch.from_numpy(np.stack([sources[order], targets[order]]))
+        data.message_edge = torch.from_numpy((order % edge_index.shape[1]).astype(np.int64))
+        data.message_reversed = torch.from_numpy(order >= edge_index.shape[1])
+        # the end of the messages of every node, the CSR pointer without its leading zero so that batches concatenate
+        data.message_ptr = torch.from_numpy(np.cumsum(np.bincount(targets, minlength=data.x.size(0))).astype(np.int64))
+        return data
+
+    def _pack_samples(self, data: Data) -> Data:
+        if not self._packed_samples:
+            return data
+        samples = data.shared_node_samples.numpy()
+        # at most one column per node holds the fraction of the fused samples, all others are 0 or 1
+        fused = (samples != 0) & (samples != 1)
+        fused_counts = np.sum(fused, axis=1)
+        if np.any(fused_counts > 1):
+            node = int(np.argmax(fused_counts > 1))
+            tables = {index: table for table, index in self.node_index.items()}
+            table = tables[int(data.shared_node_labels[node])]
+            raise ValueError("Cannot pack the samples of node " + str(node) + " (table " + str(table.name()) + "): "
+                             + str(int(fused_counts[node])) + " sample columns hold fractional values, at most one is allowed")
+        rows, columns = np.nonzero(fused)
+        fused_columns = np.full(len(samples), -1, dtype=np.int32)
+        fused_columns[rows] = columns
+        fused_values = np.zeros(len(samples), dtype=np.float32)
+        fused_values[rows] = samples[rows, columns]
+        data.shared_node_samples = torch.from_numpy(np.packbits(samples == 1, axis=1))
+        data.shared_node_fused_columns = torch.from_numpy(fused_columns)
+        data.shared_node_fused_values = torch.from_numpy(fused_values)
+        return data
+
+    def _cardinality_tensor(self, queries: List[SQLQuery]) -> FloatTensor:
+        cardinalities = []
+        for query in queries:
+            cardinality_estimates = query.cardinality_estimates()
+            if "true" in cardinality_estimates:
+                cardinalities.append(max(cardinality_estimates["true"], 1))
+            else:
+                cardinalities.append(-1)
+        return torch.Tensor(cardinalities)
+
+    def _bulk_encode_workload_base(self, workload: List[List[SQLQuery]], mscn: bool) -> List[tuple]:
+        # encodes many query groups at once, every group gives the same tensors as the per group base encoding
+        if self._sampler is not None:
+            self._sampler.prefetch([query for queries in workload for query in queries])
+
+        # counting pass
+        group_node_counts = np.zeros(len(workload), dtype=np.int64)
+        group_edge_counts = np.zeros(len(workload), dtype=np.int64)
+        for group_count, queries in enumerate(workload):
+            for query in queries:
+                group_node_counts[group_count] += len(query.nodes())
+                group_edge_counts[group_count] += len(query.edges())
+        node_offsets = np.concatenate([[0], np.cumsum(group_node_counts)])
+        edge_offsets = np.concatenate([[0], np.cumsum(group_edge_counts)])
+
+        node_index = np.empty(node_offsets[-1], dtype=np.int64)
+        my_batch = np.empty(node_offsets[-1], dtype=np.int64)
+        node_has_predicates = np.zeros(node_offsets[-1], dtype=bool)
+        # the feature row of every shared node, at most one per node
+        shared_features = np.empty(node_offsets[-1], dtype=np.int64)
+        shared_counts = np.zeros(len(workload), dtype=np.int64)
+        edge_index = np.empty((2, edge_offsets[-1]), dtype=np.int64)
+        edge_features = np.empty(edge_offsets[-1], dtype=np.int64)
+
+        # per table instance and per edge label features, computed once for the whole workload
+        feature_ids = {}
+        feature_labels = []
+        feature_label_vectors = []
+        feature_cardinalities = []
+        feature_samples = []
+        feature_predicates = []
+        feature_predicate_counts = []
+        edge_feature_ids = {}
+        edge_feature_rows = []
+
+        position = 0
+        edge_position = 0
+        for group_count, queries in enumerate(workload):
+            shared_nodes = {}
+            virtual_tables = {}
+            predicate_nodes = set()
+            shared_offset = node_offsets[group_count]
+            shared_node_count = 0
+            node_count = 0
+            for query_count, query in enumerate(queries):
+                nodes = query.nodes()
+                node_dict = {}
+                for node in nodes:
+                    virtual = node.virtual()
+                    if node not in shared_nodes and (not virtual or node.table() not in virtual_tables):
+                        if virtual:
+                            virtual_tables[node.table()] = shared_node_count
+                        else:
+                            shared_nodes[node] = shared_node_count
+                        # the mscn encoding does not pass the alias to the sampler
+                        alias = None if mscn else query.alias(node)
+                        if (node, alias) not in feature_ids:
+                            feature_ids[(node, alias)] = len(feature_labels)
+                            feature_labels.append(self.node_index[node.table()])
+                            feature_cardinalities.append(np.log(node.cardinality()))
+                            if self._sampler is not None:
+                                if mscn:
+                                    feature_samples.append(self._sampler.bitmap_padded(node))
+                                else:
+                                    feature_samples.append(self._sampler.bitmap_padded(node, alias))
+                            if mscn:
+                                if not self._index_encoding:
+                                    feature_label_vectors.append(self.encode_node_labels(node.labels()))
+                                predicates = self._encode_mscn_predicates(node.predicates())
+                                feature_predicates += predicates
+                                feature_predicate_counts.append(len(predicates))
+                        shared_features[shared_offset + shared_node_count] = feature_ids[(node, alias)]
+                        predicate_nodes.add(node)
+                        shared_node_count += 1
+                    if virtual:
+                        node_index[position] = virtual_tables[node.table()]
+                    else:
+                        node_index[position] = shared_nodes[node]
+                    node_has_predicates[position] = node in predicate_nodes
+                    my_batch[position] = query_count
+                    node_dict[node] = node_count
+                    node_count += 1
+                    position += 1
+
+                for from_node in nodes:
+                    for edge, to_node in query.edges_from(from_node):
+                        labels = tuple(edge.labels())
+                        if labels not in edge_feature_ids:
+                            edge_feature_ids[labels] = len(edge_feature_rows)
+                            if self._index_encoding:
+                                edge_feature_rows.append(self.encode_edge_label_id(list(labels)))
+                            else:
+                                edge_feature_rows.append(self.encode_edge_labels(list(labels)))
+                        edge_features[edge_position] = edge_feature_ids[labels]
+                        edge_index[0, edge_position] = node_dict[from_node]
+                        edge_index[1, edge_position] = node_dict[to_node]
+                        edge_position += 1
+            shared_counts[group_count] = shared_node_count
+        assert(edge_position == edge_offsets[-1])
+
+        feature_labels = np.array(feature_labels, dtype=np.int64)
+        feature_cardinalities = np.array(feature_cardinalities, dtype=np.float32)
+        if self._sampler is not None and len(feature_samples) > 0:
+            feature_samples = np.stack(feature_samples).astype(np.float32)
+        else:
+            feature_samples = np.zeros((len(feature_labels), 0), dtype=np.float32)
+        if mscn and not self._index_encoding and len(feature_label_vectors) > 0:
+            feature_label_vectors = np.stack(feature_label_vectors).astype(np.float32)
+        if self._index_encoding:
+            edge_feature_rows = np.array(edge_feature_rows, dtype=np.int32)
+        elif len(edge_feature_rows) > 0:
+            edge_feature_rows = np.stack(edge_feature_rows).astype(np.float32)
+        else:
+            edge_feature_rows = np.zeros((0, self.edge_encoding_size()), dtype=np.float32)
+        if mscn:
+            feature_predicate_counts = np.array(feature_predicate_counts, dtype=np.int64)
+            feature_predicate_starts = np.concatenate([[0], np.cumsum(feature_predicate_counts)[:-1]]).astype(np.int64)
+            if len(feature_predicates) > 0:
+                feature_predicates = np.stack(feature_predicates)
+
+        encodings = []
+        for group_count in range(len(workload)):
+            nodes = slice(node_offsets[group_count], node_offsets[group_count + 1])
+            edges = slice(edge_offsets[group_count], edge_offsets[group_count + 1])
+            features = shared_features[node_offsets[group_count]:node_offsets[group_count] + shared_counts[group_count]]
+
+            group_edge_index = torch.from_numpy(edge_index[:, edges].copy())
+            edge_labels = torch.from_numpy(edge_feature_rows[edge_features[edges]])
+            shared_node_labels = torch.from_numpy(feature_labels[features])
+            shared_node_cardinalities = torch.from_numpy(feature_cardinalities[features])
+            shared_node_samples = torch.from_numpy(feature_samples[features])
+            group_my_batch = torch.from_numpy(my_batch[nodes].copy())
+            if not mscn:
+                encodings.append((torch.from_numpy(node_index[nodes].copy()),
+                                  group_edge_index,
+                                  edge_labels,
+                                  shared_node_labels,
+                                  shared_node_cardinalities,
+                                  shared_node_samples,
+                                  group_my_batch))
+                continue
+
+            if self._index_encoding:
+                shared_node_label_vectors = torch.empty((len(features), 0))
+            else:
+                shared_node_label_vectors = torch.from_numpy(feature_label_vectors[features])
+            # the predicates of the shared nodes in order, and one (predicate, query) pair per predicate of every node occurrence
+            counts = feature_predicate_counts[features]
+            local_starts = np.cumsum(counts) - counts
+            num_predicates = int(counts.sum())
+            shared_node_predicate_ids = None
+            if num_predicates == 0:
+                shared_node_predicates = torch.empty((0, self.mscn_predicate_encoding_size()))
+                shared_node_predicate_index = torch.empty((2, 0), dtype=torch.int64)
+                if self._index_encoding:
+                    shared_node_predicate_ids = torch.empty((0, 2), dtype=torch.int32)
+            else:
+                rows = np.repeat(feature_predicate_starts[features] - local_starts, counts) + np.arange(num_predicates)
+                predicates = feature_predicates[rows]
+                if self._index_encoding:
+                    shared_node_predicate_ids = torch.from_numpy(predicates[:, :2].astype(np.int32))
+                    predicates = predicates[:, 2:]
+                shared_node_predicates = torch.from_numpy(predicates.astype(np.float32))
+                occurrences = node_has_predicates[nodes]
+                occurrence_shared = node_index[nodes][occurrences]
+                occurrence_counts = counts[occurrence_shared]
+                occurrence_total = int(occurrence_counts.sum())
+                occurrence_starts = np.cumsum(occurrence_counts) - occurrence_counts
+                predicate_index = np.empty((2, occurrence_total), dtype=np.int64)
+                predicate_index[0] = np.repeat(local_starts[occurrence_shared] - occurrence_starts, occurrence_counts) + np.arange(occurrence_total)
+                predicate_index[1] = np.repeat(my_batch[nodes][occurrences], occurrence_counts)
+                shared_node_predicate_index = torch.from_numpy(predicate_index)
+            encodings.append((torch.from_numpy(node_index[nodes].copy()),
+                              group_edge_index,
+                              edge_labels,
+                              shared_node_labels,
+                              shared_node_label_vectors,
+                              shared_node_cardinalities,
+                              shared_node_samples,
+                              shared_node_predicates,
+                              shared_node_predicate_index,
+                              group_my_batch,
+                              shared_node_predicate_ids))
+        return encodings
+
+    def bulk_light_encode_workload(self, workload: List[List[SQLQuery]]) -> List[BulkLightCardinalityQueryData]:
+        # same as bulk_light_encode_cardinality for every query group
+        encodings = self._bulk_encode_workload_base(workload, False)
+        return [self._pack_samples(self._add_message_edges(BulkLightCardinalityQueryData(*base_encodings, self._cardinality_tensor(queries)))) for base_encodings, queries in zip(encodings, workload)]
+
+    def bulk_mscn_encode_workload(self, workload: List[List[SQLQuery]]) -> List[BulkMSCNCardinalityQueryData]:
+        # same as bulk_mscn_encode_cardinality for every query group
+        data = []
+        for (*base_encodings, shared_node_predicate_ids), queries in zip(self._bulk_encode_workload_base(workload, True), workload):
+            data.append(self._pack_samples(BulkMSCNCardinalityQueryData(*base_encodings, self._cardinality_tensor(queries), shared_node_predicate_ids=shared_node_predicate_ids)))
+        return data
+
+    def _virtual_node(self, table: SQLTable) -> SQLTableInstance:
+        # one virtual node per table is enough, they all have the same encoding
+        if table not in self._virtual_nodes:
+            self._virtual_nodes[table] = SQLTableInstance(table, table.cardinality(), [], virtual=True)
+        return self._virtual_nodes[table]
+
+    def bulk_light_encode_lattice(self,
+                                  query: SQLQuery,
+                                  subsets: List[int],
+                                  cardinalities: Optional[List[int]] = None
+                                  ) -> BulkLightCardinalityQueryData:
+        # encodes the subqueries given as bitmasks over query.nodes() without building them, the result is the same as
+        # bulk_light_encode_cardinality on the subqueries of build_subquery with their nodes in the order of query
+        if self._sampler is not None:
+            self._sampler.prefetch([query])
+        nodes = query.nodes()
+        node_ids = {node: i for i, node in enumerate(nodes)}
+        root_edges = query.edges()
+        num_nodes = len(nodes)
+        num_edges = len(root_edges)
+        edge_from = np.array([node_ids[from_node] for from_node, _, _ in root_edges], dtype=np.int64)
+        edge_to = np.array([node_ids[to_node] for _, _, to_node in root_edges], dtype=np.int64)
+
+        # the edges leaving a subquery towards the same node and key attributes end in a virtual node if there are several
+        neighboring_ids = {}
+        neighboring_tables = []
+        edge_neighboring = []
+        for _, edge, to_node in root_edges:
+            neighboring_key = (to_node, frozenset(edge.foreign_key().primary_key_attributes()))
+            if neighboring_key not in neighboring_ids:
+                neighboring_ids[neighboring_key] = len(neighboring_ids)
+                neighboring_tables.append(to_node.table())
+            edge_neighboring.append(neighboring_ids[neighboring_key])
+        edge_neighboring = np.array(edge_neighboring, dtype=np.int64)
+
+        # shared node features, the query nodes come first and the virtual tables after them
+        virtual_tables = list(dict.fromkeys(neighboring_tables))
+        virtual_table_ids = {table: num_nodes + i for i, table in enumerate(virtual_tables)}
+        neighboring_entities = np.array([virtual_table_ids[table] for table in neighboring_tables], dtype=np.int64)
+        entity_nodes = [(node, query.alias(node)) for node in nodes] + [(self._virtual_node(table), None) for table in virtual_tables]
+        entity_labels = np.array([self.node_index[node.table()] for node, _ in entity_nodes], dtype=np.int64)
+        entity_cardinalities = np.array([np.log(node.cardinality()) for node, _ in entity_nodes], dtype=np.float32)
+        if self._sampler is not None:
+            entity_samples = np.stack([self._sampler.bitmap_padded(node, alias) for node, alias in entity_nodes]).astype(np.float32)
+        else:
+            entity_samples = np.zeros((len(entity_nodes), 0), dtype=np.float32)
+        if self._index_encoding:
+            edge_label_rows = np.array([self.encode_edge_label_id(edge.labels()) for _, edge, _ in root_edges], dtype=np.int32)
+        elif num_edges > 0:
+            edge_label_rows = np.stack([self.encode_edge_labels(edge.labels()) for _, edge, _ in root_edges]).astype(np.float32)
+        else:
+            edge_label_rows = np.zeros((0, self.edge_encoding_size()), dtype=np.float32)
+
+        masks = np.array(subsets, dtype=np.int64)
+        num_subsets = len(masks)
+        inside = ((masks[:, None] >> np.arange(num_nodes)) & 1).astype(bool)
+        edge_inside = inside[:, edge_from] & inside[:, edge_to]
+        leaving = inside[:, edge_from] & ~inside[:, edge_to]
+        leaving_subsets, leaving_edges = np.nonzero(leaving)
+        num_neighboring = len(neighboring_ids)
+        leaving_counts = np.zeros((num_subsets, num_neighboring), dtype=np.int64)
+        np.add.at(leaving_counts, (leaving_subsets, edge_neighboring[leaving_edges]), 1)
+        virtual = leaving_counts > 1
+        # virtual nodes are ordered by their first leaving edge
+        first_leaving = np.full((num_subsets, num_neighboring), num_edges, dtype=np.int64)
+        np.minimum.at(first_leaving, (leaving_subsets, edge_neighboring[leaving_edges]), leaving_edges)
+
+        # node occurrences, per subquery its nodes in query order followed by its virtual nodes
+        real_subsets, real_nodes = np.nonzero(inside)
+        virtual_subsets, virtual_neighboring = np.nonzero(virtual)
+        occurrence_subsets = np.concatenate([real_subsets, virtual_subsets])
+        occurrence_virtual = np.concatenate([np.zeros(len(real_subsets), dtype=np.int64), np.ones(len(virtual_subsets), dtype=np.int64)])
+        occurrence_order = np.concatenate([real_nodes, first_leaving[virtual_subsets, virtual_neighboring]])
+        occurrence_entities = np.concatenate([real_nodes, neighboring_entities[virtual_neighboring]])
+        order = np.lexsort((occurrence_order, occurrence_virtual, occurrence_subsets))
+        positions = np.empty(len(order), dtype=np.int64)
+        positions[order] = np.arange(len(order))
+        real_positions = np.zeros((num_subsets, num_nodes), dtype=np.int64)
+        real_positions[real_subsets, real_nodes] = positions[:len(real_subsets)]
+        virtual_positions = np.zeros((num_subsets, num_neighboring), dtype=np.int64)
+        virtual_positions[virtual_subsets, virtual_neighboring] = positions[len(real_subsets):]
+        occurrence_entities = occurrence_entities[order]
+        my_batch = occurrence_subsets[order]
+
+        # shared nodes in the order of their first occurrence
+        entities, first_occurrences = np.unique(occurrence_entities, return_index=True)
+        shared_entities = entities[np.argsort(first_occurrences)]
+        shared_ids = np.zeros(len(entity_nodes), dtype=np.int64)
+        shared_ids[shared_entities] = np.arange(len(shared_entities))
+        node_index = shared_ids[occurrence_entities]
+
+        # edges per subquery by their from node, edges inside the subquery before edges to virtual nodes
+        inner_subsets, inner_edges = np.nonzero(edge_inside)
+        outer_subsets, outer_edges = np.nonzero(leaving & virtual[:, edge_neighboring])
+        subquery_edges = np.concatenate([inner_edges, outer_edges])
+        edge_subsets = np.concatenate([inner_subsets, outer_subsets])
+        edge_virtual = np.concatenate([np.zeros(len(inner_edges), dtype=np.int64), np.ones(len(outer_edges), dtype=np.int64)])
+        edge_order = np.concatenate([inner_edges, first_leaving[outer_subsets, edge_neighboring[outer_edges]]])
+        edge_sources = real_positions[edge_subsets, edge_from[subquery_edges]]
+        edge_targets = np.concatenate([real_positions[inner_subsets, edge_to[inner_edges]],
+                                       virtual_positions[outer_subsets, edge_neighboring[outer_edges]]])
+        order = np.lexsort((subquery_edges, edge_order, edge_virtual, edge_from[subquery_edges], edge_subsets))
+        edge_index = np.stack([edge_sources[order], edge_targets[order]])
+
+        if cardinalities is None:
+            cardinalities = [-1] * num_subsets
+        else:
+            cardinalities = [max(cardinality, 1) for cardinality in cardinalities]
+        data = BulkLightCardinalityQueryData(torch.from_numpy(node_index),
+                                             torch.from_numpy(edge_index),
+                                             torch.from_numpy(edge_label_rows[subquery_edges[order]]),
+                                             torch.from_numpy(entity_labels[shared_entities]),
+                                             torch.from_numpy(entity_cardinalities[shared_entities]),
+                                             torch.from_numpy(entity_samples[shared_entities]),
+                                             torch.from_numpy(my_batch),
+                                             torch.Tensor(cardinalities))
+        return self._pack_samples(self._add_message_edges(data))
 
     def _encode_mscn_predicates(self, predicates: List[List[Predicate]]) -> List[np.array]:
         attribute_preds = {}
@@ -720,31 +1189,15 @@ class Encoder:
                     positive.append(predicate.positive())
                     comparison_operators.append(predicate.operator())
                     values.append(predicate.value())
-                if len(comparison_operators) == 1 and comparison_operators[0] == OPERATORS["IS"]:
-                    agg_positive = positive[0]
-                    value_encoding = self._encode_mscn_null()
-                    operator = 1
-                    predicate_encodings.append(self._encode_mscn_predicate(attribute, operator, value_encoding, agg_positive))
-                elif all(co == OPERATORS["LIKE"] for co in comparison_operators):
-                    agg_positive = all(positive)
-                    assert(all(p == agg_positive for p in positive))
-                    value_encoding = self._encode_mscn_like(values)
-                    operator = 2
-                    predicate_encodings.append(self._encode_mscn_predicate(attribute, operator, value_encoding, agg_positive))
-                elif all(co == OPERATORS["ILIKE"] for co in comparison_operators):
-                    agg_positive = all(positive)
-                    assert(all(p == agg_positive for p in positive))
-                    value_encoding = self._encode_mscn_like(values)
-                    operator = 3
-                    predicate_encodings.append(self._encode_mscn_predicate(attribute, operator, value_encoding, agg_positive))
-                elif all(co == OPERATORS["="] for co in comparison_operators) or not isinstance(attribute, NumericAttribute):
-                    agg_positive = all(positive)
-                    assert(all(p == agg_positive for p in positive))
-                    value_encoding = self._encode_mscn_categorical(values)
-                    operator = 0
-                    predicate_encodings.append(self._encode_mscn_predicate(attribute, operator, value_encoding, agg_positive))
-                else:
+                operator = self._mscn_operator(attribute, comparison_operators)
+                if operator == 4:
                     leftovers.append((positive, comparison_operators, values))
+                else:
+                    key = (self.predicate_version(), "mscn", attribute, tuple((co, PredicateEncodingCache.value_key(v), p) for p, co, v in zip(positive, comparison_operators, values)))
+                    encoding = self._predicate_cache.get(key)
+                    if encoding is None:
+                        encoding = self._predicate_cache.put(key, self._encode_mscn_disjunction(attribute, operator, positive, values))
+                    predicate_encodings.append(encoding)
             if len(leftovers) > 0:
                 value_ranges = [(0, 1)]
                 for positve, comparison_operators, values in leftovers:
@@ -791,18 +1244,56 @@ class Encoder:
                 predicate_encodings.append(self._encode_mscn_predicate(attribute, operator, value_encoding, agg_positive))
         return predicate_encodings
 
+    def _mscn_operator(self, attribute: Attribute, comparison_operators: List[ComparisonOperator]) -> int:
+        if len(comparison_operators) == 1 and comparison_operators[0] == OPERATORS["IS"]:
+            return 1
+        elif all(co == OPERATORS["LIKE"] for co in comparison_operators):
+            return 2
+        elif all(co == OPERATORS["ILIKE"] for co in comparison_operators):
+            return 3
+        elif all(co == OPERATORS["="] for co in comparison_operators) or not isinstance(attribute, NumericAttribute):
+            return 0
+        else:
+            # numeric ranges are merged over all disjunctions of the attribute
+            return 4
+
+    def _encode_mscn_disjunction(self, attribute: Attribute, operator: int, positive: List[bool], values: List[Any]) -> np.array:
+        if operator == 1:
+            agg_positive = positive[0]
+            value_encoding = self._encode_mscn_null()
+        else:
+            agg_positive = all(positive)
+            assert(all(p == agg_positive for p in positive))
+            if operator == 0:
+                value_encoding = self._encode_mscn_categorical(values)
+            else:
+                value_encoding = self._encode_mscn_like(values)
+        return self._encode_mscn_predicate(attribute, operator, value_encoding, agg_positive)
+
     def _encode_mscn_predicate(self, attribute: Attribute, operator: int, value_encoding: np.array, positive: bool):
-        attribute_encoding = self.encode_attribute(attribute)
-        operator_encoding = np.zeros((5,))
-        operator_encoding[operator] = 1
         if positive:
             positive_encoding = np.ones((1,))
         else:
             positive_encoding = np.zeros((1,))
+        if self._index_encoding:
+            # attribute and operator ids lead the row, they are split off into shared_node_predicate_ids
+            return np.concatenate([np.array([self.attribute_index[attribute], operator]), value_encoding, positive_encoding])
+        attribute_encoding = self.encode_attribute(attribute)
+        operator_encoding = np.zeros((5,))
+        operator_encoding[operator] = 1
         return np.concatenate([attribute_encoding, operator_encoding, value_encoding, positive_encoding])
 
     def mscn_predicate_size(self):
-        return self.attribute_encoding_size() + 5 + self._num_buckets + 1
+        return self.attribute_encoding_size() + self.mscn_operator_size() + self._num_buckets + 1
+
+    def mscn_operator_size(self):
+        return 5
+
+    def mscn_predicate_encoding_size(self):
+        # the width of shared_node_predicates, without the ids in index encoding
+        if self._index_encoding:
+            return self._num_buckets + 1
+        return self.mscn_predicate_size()
 
     def _merge_range(self,
                      value_ranges: List[Tuple[float, float]],
@@ -848,6 +1339,11 @@ class Encoder:
     def _deterministic_hash(self, string: str) -> int:
         return int(hashlib.sha1(str(string).encode("utf-8")).hexdigest(), 16)
 
+    def _ngram_bucket(self, ngram: str) -> int:
+        if ngram not in self._ngram_buckets:
+            self._ngram_buckets[ngram] = self._deterministic_hash(ngram) % (self._num_buckets - 2)
+        return self._ngram_buckets[ngram]
+
     def _encode_mscn_like(self, vals: List[str]) -> np.array:
         features = np.zeros((self._num_buckets,))
         char_buckets = self._num_buckets - 2
@@ -856,19 +1352,9 @@ class Encoder:
         pred_idx = self._deterministic_hash(regex_val) % char_buckets
         features[pred_idx] = 1
 
-        for v in regex_val:
-            pred_idx = self._deterministic_hash(str(v)) % char_buckets
-            features[pred_idx] = 1
-
-        for i, v in enumerate(regex_val):
-            if i != len(regex_val) - 1:
-                pred_idx = self._deterministic_hash(v + regex_val[i + 1]) % char_buckets
-                features[pred_idx] = 1
-
-        for i, v in enumerate(regex_val):
-            if i < len(regex_val) - 2:
-                pred_idx = self._deterministic_hash(v + regex_val[i + 1] + regex_val[i + 2]) % char_buckets
-                features[pred_idx] = 1
+        for n in range(1, 4):
+            for i in range(len(regex_val) - n + 1):
+                features[self._ngram_bucket(regex_val[i:i + n])] = 1
 
         features[self._num_buckets - 2]= len(regex_val)
 
@@ -1,8 +1,54 @@
+from __future__ import annotations
+import random
+import time
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+from data.wrap_value import wrap_value
+from encoder.sample_entry import SampleEntry, SampleRows
+from query.predicate import ArbitraryPredicate
+from query.query_utility import predicates_to_string
+from query.sql.sql_table_instance import SQLTableInstance
+from schema.sql.sql_schema import SQLSchema
+from schema.sql.sql_table import SQLTable
 
 
-from typing import Callable, List
-from encoder.sample_entry import SampleEntry
-from schema.sql.sql_table import SQLTable
+class SamplingMethod(Enum):
+    UNIFORM = 1
+    BERNOULLI = 2
+    SYSTEM = 3
+    RESERVOIR = 4
+
+
+class SamplingReport:
+    # requested and achieved rows and wall time per table, summed over all pulls of one sampler build
+    def __init__(self) -> None:
+        self._tables: Dict[str, list] = {}
+
+    def add(self, table: SQLTable, method: SamplingMethod, requested: int, achieved: int, seconds: float):
+        if table.name() not in self._tables:
+            self._tables[table.name()] = [method.name, 0, 0, 0, 0.0]
+        entry = self._tables[table.name()]
+        entry[1] += 1
+        entry[2] += requested
+        entry[3] += achieved
+        entry[4] += seconds
+
+    def merge(self, other: SamplingReport):
+        for table_name, (method_name, pulls, requested, achieved, seconds) in other._tables.items():
+            if table_name not in self._tables:
+                self._tables[table_name] = [method_name, 0, 0, 0, 0.0]
+            entry = self._tables[table_name]
+            entry[1] += pulls
+            entry[2] += requested
+            entry[3] += achieved
+            entry[4] += seconds
+
+    def tables(self) -> Dict[str, tuple]:
+        return {table_name: tuple(entry) for table_name, entry in self._tables.items()}
+
+    def __str__(self) -> str:
+        return "\n".join(["%s: %s sampling, %d pulls, %d of %d rows (%.2f s)" % (table_name, method_name, pulls, achieved, requested, seconds)
+                          for table_name, (method_name, pulls, requested, achieved, seconds) in sorted(self._tables.items())])
 
 
 class SampleBuffer:
@@ -18,13 +64,78 @@ class SampleBuffer:
         return samples
 
 
-def get_samples_sql(cursor, table: SQLTable, sample_number: int) -> List[SampleEntry]:
-    sample_query = sql_sample_query(table, sample_number)
-    cursor.execute(sample_query)
-    table_samples = []
-    for sample_row in cursor.fetchall():
-        table_samples.append(build_sql_sample(table, sample_row))
-    return table_samples
+def table_sampling_method(sampling_methods: Optional[Dict[str, SamplingMethod]], table: SQLTable) -> SamplingMethod:
+    if sampling_methods is None or table.name() not in sampling_methods:
+        return SamplingMethod.UNIFORM
+    return sampling_methods[table.name()]
+
+
+def get_samples_sql(cursor,
+                    table: SQLTable,
+                    sample_number: int,
+                    sampling_methods: Optional[Dict[str, SamplingMethod]] = None,
+                    report: Optional[SamplingReport] = None) -> List[SampleEntry]:
+    return SampleRows(table, table.attributes(), get_sample_rows_sql(cursor, table, sample_number, sampling_methods, report)).entries()
+
+
+def get_sample_rows_sql(cursor,
+                        table: SQLTable,
+                        sample_number: int,
+                        sampling_methods: Optional[Dict[str, SamplingMethod]] = None,
+                        report: Optional[SamplingReport] = None) -> list:
+    # sampling_methods maps table names to their sampling method, other tables are sampled uniformly
+    method = table_sampling_method(sampling_methods, table)
+    start = time.time()
+    if method == SamplingMethod.UNIFORM:
+        cursor.execute(sql_sample_query(table, sample_number))
+        rows = cursor.fetchall()
+    elif method == SamplingMethod.RESERVOIR:
+        rows = reservoir_sample_rows_sql(cursor, table, sample_number)
+    else:
+        rows = table_sample_rows_sql(cursor, table, sample_number, method)
+    if report is not None:
+        report.add(table, method, sample_number, len(rows), time.time() - start)
+    return rows
+
+
+def table_sample_rows_sql(cursor, table: SQLTable, sample_number: int, method: SamplingMethod, oversampling: float = 1.5, max_attempts: int = 4) -> list:
+    if table.cardinality() <= 0:
+        return reservoir_sample_rows_sql(cursor, table, sample_number)
+    column_string = ", ".join([attribute.name() for attribute in table.attributes()])
+    rate = min(100.0, 100.0 * oversampling * sample_number / table.cardinality())
+    for _ in range(max_attempts):
+        sample_query = "SELECT %s FROM %s TABLESAMPLE %s (%f);" % (column_string, table.name(), method.name, rate)
+        cursor.execute(sample_query)
+        rows = cursor.fetchall()
+        if len(rows) >= sample_number or rate >= 100.0:
+            # BERNOULLI keeps rows independently, so a random subset is still uniform, SYSTEM keeps whole pages
+            if len(rows) > sample_number:
+                rows = random.sample(rows, sample_number)
+            else:
+                random.shuffle(rows)
+            return rows
+        # the statistics underestimated the table, scale the rate by the missing fraction
+        rate = min(100.0, rate * max(2.0, oversampling * sample_number / max(len(rows), 1)))
+    return reservoir_sample_rows_sql(cursor, table, sample_number)
+
+
+def reservoir_sample_rows_sql(cursor, table: SQLTable, sample_number: int, fetch_size: int = 10000) -> list:
+    column_string = ", ".join([attribute.name() for attribute in table.attributes()])
+    # a named cursor streams the table from the server instead of materializing it on the client
+    named_cursor = cursor.connection.cursor(name="reservoir_%s_%d" % (table.name(), random.getrandbits(32)))
+    named_cursor.itersize = fetch_size
+    named_cursor.execute("SELECT %s FROM %s;" % (column_string, table.name()))
+    rows = []
+    for i, row in enumerate(named_cursor):
+        if i < sample_number:
+            rows.append(row)
+        else:
+            j = random.randint(0, i)
+            if j < sample_number:
+                rows[j] = row
+    named_cursor.close()
+    random.shuffle(rows)
+    return rows
 
 
 def build_sql_sample(table: SQLTable, sample_row) -> SampleEntry:
@@ -39,3 +150,39 @@ def sql_sample_query(table: SQLTable, sample_number: int) -> str:
     sample_query = "SELECT %s FROM %s ORDER BY RANDOM() LIMIT %d;" % (column_string, table.name(), sample_number)
     return sample_query
 
+
+def evaluate_arbitrary_predicates(schema: SQLSchema, samples: List[SampleEntry], table_instance: SQLTableInstance, alias: str, samples_per_query: int = 5000, begin: Optional[int] = None) -> Dict[SampleEntry, bool]:
+    if len(samples) == 0:
+        return {}
+    table = list(samples[0].labels())[0]
+    primary_key = table.key_columns()
+    if begin is None:
+        sample_partitions = [samples[i:i + samples_per_query] for i in range(0, len(samples), samples_per_query)]
+    else:
+        sample_partitions = [samples[begin:begin + samples_per_query]]
+    connection = schema.connection()
+    result = {}
+    # the keys are returned with the evaluation, IN neither keeps the order of the samples nor returns rows for missing keys
+    key_string = ", ".join(["%s.%s" % (alias, pk.name()) for pk in primary_key])
+    select_string = "SELECT %s, %s FROM %s AS %s" % (key_string, predicates_to_string(alias, table_instance.predicates()), table.name(), alias)
+    cursor = connection.cursor()
+    for samples in sample_partitions:
+        sample_strings = []
+        for sample in samples:
+            sample_key = [sample.value(column) for column in primary_key]
+            sample_strings.append("(" + ", ". join([wrap_value(value) for value in sample_key]) + ")")
+
+        in_string = "(" + ", ". join([pk.name() for pk in primary_key]) + ")" + " IN (" + ", ".join(sample_strings) + ")"
+        query = select_string + " WHERE " + in_string + ";"
+
+        cursor.execute(query)
+        evaluations = {tuple(row[:-1]): row[-1] for row in cursor.fetchall()}
+        for sample in samples:
+            eval = evaluations.get(tuple(sample.value(column) for column in primary_key))
+            result[sample] = eval is not None and eval
+    cursor.close()
+    return result
+
+
+def has_arbitrary_predicates(node: SQLTableInstance) -> bool:
+    return any(isinstance(predicate, ArbitraryPredicate) for disjunction in node.predicates() for predicate in disjunction)
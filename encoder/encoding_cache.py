@@ -0,0 +1,97 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
+from typing import List, Optional
+
+import numpy as np
+import torch
+from torch_geometric.data import Data
+
+from query.graphlike_query import GraphlikeQuery
+from query_data.bulk_light_cardinality_query_data import BulkLightCardinalityQueryData
+from query_data.bulk_mscn_cardinality_query_data import BulkMSCNCardinalityQueryData
+from query_data.bulk_cardinality_query_data import BulkCardinalityQueryData
+
+
+DATA_TYPES = {data_type.__name__: data_type for data_type in [BulkLightCardinalityQueryData,
+                                                              BulkMSCNCardinalityQueryData,
+                                                              BulkCardinalityQueryData]}
+
+
+class EncodingCache:
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(queries: List[List[GraphlikeQuery]], model_name: str, encoder_hash: str) -> Optional[str]:
+        query_ids = []
+        # the estimates are named by their estimator, relabelled queries or other node estimates get another key
+        labels = hashlib.sha1()
+        for query_group in queries:
+            group_ids = []
+            for query in query_group:
+                if query.id() is None:
+                    return None
+                group_ids.append(query.id())
+                labels.update(repr(sorted(query.cardinality_estimates().items())).encode("utf-8"))
+                labels.update(repr([node.cardinality() for node in query.nodes()]).encode("utf-8"))
+            query_ids.append(group_ids)
+        key_string = json.dumps([model_name, encoder_hash, query_ids, labels.hexdigest()])
+        return hashlib.sha1(key_string.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key)
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self._path(key), "index.json"))
+
+    def save(self, key: str, encoded_queries: List[Data]):
+        path = self._path(key)
+        os.makedirs(path, exist_ok=True)
+        attributes = {}
+        for data in encoded_queries:
+            for attribute in data.to_dict():
+                attributes[attribute] = None
+        index = {"types": [type(data).__name__ for data in encoded_queries], "attributes": {}, "objects": []}
+        for attribute in attributes:
+            if not all(isinstance(data[attribute], torch.Tensor) for data in encoded_queries):
+                # attributes that are not tensors are stored as they are
+                with open(os.path.join(path, attribute + ".pkl"), 'wb') as f:
+                    pickle.dump([data[attribute] for data in encoded_queries], f, protocol=pickle.HIGHEST_PROTOCOL)
+                index["objects"].append(attribute)
+                continue
+            values = [data[attribute].detach().cpu().numpy() for data in encoded_queries]
+            shapes = [list(value.shape) for value in values]
+            flat = np.concatenate([value.reshape(-1) for value in values])
+            np.save(os.path.join(path, attribute + ".npy"), flat)
+            index["attributes"][attribute] = shapes
+        # the index is written last, it marks the entry as complete
+        with open(os.path.join(path, "index.json"), 'w') as f:
+            json.dump(index, f)
+
+    def load(self, key: str) -> List[Data]:
+        path = self._path(key)
+        with open(os.path.join(path, "index.json"), 'r') as f:
+            index = json.load(f)
+        encoded_queries = []
+        for type_name in index["types"]:
+            data = Data.__new__(DATA_TYPES[type_name])
+            Data.__init__(data)
+            encoded_queries.append(data)
+        for attribute, shapes in index["attributes"].items():
+            # copy-on-write memory map, only the slices that are touched are read from disk
+            flat = np.load(os.path.join(path, attribute + ".npy"), mmap_mode="c")
+            offset = 0
+            for data, shape in zip(encoded_queries, shapes):
+                size = int(np.prod(shape))
+                data[attribute] = torch.from_numpy(flat[offset:offset + size].reshape(shape))
+                offset += size
+        for attribute in index["objects"] if "objects" in index else []:
+            with open(os.path.join(path, attribute + ".pkl"), 'rb') as f:
+                values = pickle.load(f)
+            for data, value in zip(encoded_queries, values):
+                data[attribute] = value
+        return encoded_queries
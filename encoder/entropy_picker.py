@@ -1,5 +1,7 @@
-
-from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from encoder.sample_columns import SampleColumns
+from query.predicatable import Predicatable
+from query.predicate import Predicate
 from query.query_node import QueryNode
 from encoder.sample_entry import SampleEntry
 import numpy as np
@@ -9,85 +11,119 @@ from schema.schema_node import SchemaNode
 
 class EntropyPicker:
     def __init__(self, node_lists: List[List[QueryNode]], min_gain: float = 0) -> None:
-        self._node_sets = [frozenset(node_list) for node_list in node_lists if len(node_list) > 0]
+        node_sets = []
+        for node_list in node_lists:
+            node_set = frozenset(node_list)
+            if len(node_set) > 0 and node_set not in node_sets:
+                node_sets.append(node_set)
         self._min_gain = min_gain
 
+        # every node set keeps its own members, the current partition is one class id per member
+        self._nodes: List[QueryNode] = []
+        node_ids = {}
+        member_nodes = []
+        member_classes = []
+        for class_id, node_set in enumerate(node_sets):
+            for node in node_set:
+                if node not in node_ids:
+                    node_ids[node] = len(self._nodes)
+                    self._nodes.append(node)
+                member_nodes.append(node_ids[node])
+                member_classes.append(class_id)
+        self._member_nodes = np.array(member_nodes, dtype=np.int64)
+        self._classes = np.array(member_classes, dtype=np.int64)
+        self._num_classes = len(node_sets)
+
+        self._label_members: Dict[SchemaNode, np.ndarray] = {}
+        for i, node_id in enumerate(member_nodes):
+            for label in self._nodes[node_id].labels():
+                if label not in self._label_members:
+                    self._label_members[label] = np.zeros(len(member_nodes), dtype=bool)
+                self._label_members[label][i] = True
+
+        self._contributions = np.array([0.0] + [EntropyPicker._entropy_contribution(size) for size in range(1, len(member_nodes) + 1)])
+        self._applicable: Dict[FrozenSet[SchemaNode], Tuple[List[int], List]] = {}
+
     def pick(self, samples: List[SampleEntry]) -> Tuple[Optional[SampleEntry], float]:
-        if len(self._node_sets) == 0:
+        if self._num_classes == 0 or len(samples) == 0:
             return None, 0
-        winner = None
 
-        maximum_gain = 0
-        label_index = EntropyPicker._label_index(self._node_sets)
-
-        for sample in samples:
-            node_set_sets = []
-            for label in sample.labels():
-                if label in label_index:
-                    node_set_sets.append(label_index[label])
+        hits = self._evaluate(samples)
+        sizes = np.bincount(self._classes, minlength=self._num_classes)
+        sample_classes = np.arange(len(samples))[:, None] * self._num_classes + self._classes[None, :]
+        hit_counts = np.bincount(sample_classes[hits], minlength=len(samples) * self._num_classes).reshape(len(samples), self._num_classes)
+        gains = self._contributions[sizes][None, :] - self._contributions[hit_counts] - self._contributions[sizes[None, :] - hit_counts]
+        gains[~self._relevant(samples)] = 0
+        gain = gains.sum(axis=1)
+
+        winner = int(np.argmax(gain))
+        maximum_gain = float(gain[winner])
+        if maximum_gain <= 0 or maximum_gain <= self._min_gain:
+            return None, 0
+        self._divide(hits[winner])
+        return samples[winner], maximum_gain
+
+    def _evaluate(self, samples: List[SampleEntry]) -> np.ndarray:
+        # each candidate is evaluated once against every node, column-wise per label set
+        label_groups: Dict[FrozenSet[SchemaNode], List[int]] = {}
+        for i, sample in enumerate(samples):
+            labels = frozenset(sample.labels())
+            if labels not in label_groups:
+                label_groups[labels] = []
+            label_groups[labels].append(i)
+
+        node_hits = np.zeros((len(samples), len(self._nodes)), dtype=bool)
+        for labels, indices in label_groups.items():
+            applicable, attributes = self._applicable_nodes(labels)
+            if len(applicable) == 0:
+                continue
+            columns = SampleColumns(attributes, [samples[i] for i in indices])
+            for node_id in applicable:
+                node = self._nodes[node_id]
+                if isinstance(node, Predicatable):
+                    node_hits[indices, node_id] = columns.evaluate_predicates(node)
                 else:
-                    node_set_sets.append(set())
-                    break
-            node_set_set = set.intersection(*node_set_sets)
-            gain = 0
-            for node_set in node_set_set:
-                gain += EntropyPicker._information_gain(node_set, sample)
-            if gain > maximum_gain and gain > self._min_gain:
-                winner = sample
-                maximum_gain = gain
-
-        if maximum_gain > 0:
-            self._node_sets = EntropyPicker._divide(self._node_sets, winner)
-
-        return winner, maximum_gain
-
-    @staticmethod
-    def _get_entropy(node_sets: List[FrozenSet[QueryNode]]) -> float:
-        entropy = 0
-        for node_set in node_sets:
-            entropy += EntropyPicker._entropy_contribution(node_set)
-
-        return entropy
-
-    @staticmethod
-    def _entropy_contribution(node_set: FrozenSet[QueryNode]) -> float:
-        return len(node_set) * np.log2(len(node_set))
-
-    @staticmethod
-    def _divide(node_sets: List[FrozenSet[QueryNode]], sample_entry: SampleEntry) -> List[FrozenSet[QueryNode]]:
-        new_node_sets = []
-        for node_set in node_sets:
-            hits, misses = EntropyPicker._divide_set(node_set, sample_entry)
-            for new_node_set in [hits, misses]:
-                if len(new_node_set) > 0:
-                    new_node_sets.append(frozenset(new_node_set))
-        return new_node_sets
-
-    @staticmethod
-    def _divide_set(node_set: FrozenSet[QueryNode], sample_entry: SampleEntry) -> Tuple[List[QueryNode], List[QueryNode]]:
-        hits = []
-        misses = []
-        for node in node_set:
-            if sample_entry.evaluate_sample(node):
-                hits.append(node)
-            else:
-                misses.append(node)
-        return hits, misses
-
-    @staticmethod
-    def _information_gain(node_set: FrozenSet[QueryNode], sample_entry: SampleEntry) -> float:
-        hits, misses = EntropyPicker._divide_set(node_set, sample_entry)
-        if len(hits) == 0 or len(misses) == 0:
-            return 0
-        return EntropyPicker._entropy_contribution(node_set) - EntropyPicker._entropy_contribution(hits) - EntropyPicker._entropy_contribution(misses)
+                    node_hits[indices, node_id] = True
+        return node_hits[:, self._member_nodes]
+
+    def _applicable_nodes(self, labels: FrozenSet[SchemaNode]) -> Tuple[List[int], List]:
+        if labels not in self._applicable:
+            applicable = []
+            attributes = {}
+            for node_id, node in enumerate(self._nodes):
+                if all(label in labels for label in node.labels()):
+                    applicable.append(node_id)
+                    if isinstance(node, Predicatable):
+                        for disjunction in node.predicates():
+                            for predicate in disjunction:
+                                if isinstance(predicate, Predicate):
+                                    attributes[predicate.attribute()] = None
+            self._applicable[labels] = (applicable, list(attributes))
+        return self._applicable[labels]
+
+    def _relevant(self, samples: List[SampleEntry]) -> np.ndarray:
+        # a partition only counts for a sample if it holds nodes of all sample labels
+        label_classes = {}
+        relevant = np.ones((len(samples), self._num_classes), dtype=bool)
+        for i, sample in enumerate(samples):
+            for label in sample.labels():
+                if label not in label_classes:
+                    if label in self._label_members:
+                        label_classes[label] = np.bincount(self._classes[self._label_members[label]], minlength=self._num_classes) > 0
+                    else:
+                        label_classes[label] = np.zeros(self._num_classes, dtype=bool)
+                relevant[i] &= label_classes[label]
+        return relevant
+
+    def _divide(self, member_hits: np.ndarray):
+        # every class splits into its hits and misses, empty parts are dropped
+        sizes = np.bincount(self._classes, minlength=self._num_classes)
+        hit_counts = np.bincount(self._classes[member_hits], minlength=self._num_classes)
+        parts = np.stack([hit_counts, sizes - hit_counts], axis=1).ravel() > 0
+        new_classes = np.cumsum(parts) - 1
+        self._classes = new_classes[2 * self._classes + (~member_hits)]
+        self._num_classes = int(np.sum(parts))
 
     @staticmethod
-    def _label_index(node_sets: List[FrozenSet[QueryNode]]) -> Dict[SchemaNode, Set[FrozenSet[QueryNode]]]:
-        label_index = {}
-        for node_set in node_sets:
-            for node in node_set:
-                for label in node.labels():
-                    if label not in label_index:
-                        label_index[label] = set()
-                    label_index[label].add(node_set)
-        return label_index
+    def _entropy_contribution(size: int) -> float:
+        return size * np.log2(size)
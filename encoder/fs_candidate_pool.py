@@ -0,0 +1,88 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+
+import numpy as np
+from encoder.encoder_util import evaluate_arbitrary_predicates, get_samples_sql, has_arbitrary_predicates, SamplingMethod, SamplingReport
+from encoder.sample_columns import SampleColumns
+from encoder.sample_entry import SampleEntry
+from query.sql.sql_table_instance import SQLTableInstance
+from schema.sql.sql_schema import SQLSchema
+from schema.sql.sql_table import SQLTable
+
+
+class FSCandidatePool:
+    # candidate samples of one table and their evaluations on every table instance seen so far
+    def __init__(self, table: SQLTable, candidates: List[SampleEntry]) -> None:
+        self._table = table
+        self._candidates = candidates
+        self._columns = SampleColumns(table.attributes(), candidates)
+        self._instances: List[SQLTableInstance] = []
+        self._aliases: Dict[SQLTableInstance, Optional[str]] = {}
+        self._instance_hashes = set()
+        self._bits: List[np.ndarray] = []
+
+    @staticmethod
+    def build(schema: SQLSchema,
+              table: SQLTable,
+              choice_number: int,
+              sampling_methods: Optional[Dict[str, SamplingMethod]] = None,
+              report: Optional[SamplingReport] = None) -> FSCandidatePool:
+        cursor = schema.connection().cursor()
+        candidates = get_samples_sql(cursor, table, choice_number, sampling_methods, report)
+        cursor.close()
+        return FSCandidatePool(table, candidates)
+
+    def table(self) -> SQLTable:
+        return self._table
+
+    def candidates(self) -> List[SampleEntry]:
+        return self._candidates
+
+    def instances(self) -> List[SQLTableInstance]:
+        return self._instances
+
+    def alias(self, table_instance: SQLTableInstance) -> Optional[str]:
+        return self._aliases[table_instance]
+
+    def contains(self, table_instance: SQLTableInstance) -> bool:
+        return table_instance.canonical_hash() in self._instance_hashes
+
+    def add_instances(self, schema: SQLSchema, table_instances: List[SQLTableInstance], aliases: Dict[SQLTableInstance, str]) -> int:
+        added = 0
+        for table_instance in table_instances:
+            canonical_hash = table_instance.canonical_hash()
+            if canonical_hash in self._instance_hashes:
+                continue
+            alias = aliases[table_instance] if table_instance in aliases else None
+            if has_arbitrary_predicates(table_instance):
+                evaluation = evaluate_arbitrary_predicates(schema, self._candidates, table_instance, alias)
+                bits = np.array([evaluation[candidate] for candidate in self._candidates], dtype=bool)
+            else:
+                bits = self._columns.evaluate_predicates(table_instance)
+            self._instance_hashes.add(canonical_hash)
+            self._instances.append(table_instance)
+            self._aliases[table_instance] = alias
+            self._bits.append(np.packbits(bits))
+            added += 1
+        return added
+
+    def evaluations(self) -> np.ndarray:
+        # instances x candidates
+        if len(self._bits) == 0:
+            return np.zeros((0, len(self._candidates)), dtype=bool)
+        return np.unpackbits(np.stack(self._bits), axis=1, count=len(self._candidates)).astype(bool)
+
+    def evaluate_samples(self, schema: SQLSchema, samples: List[SampleEntry]) -> np.ndarray:
+        # instances x samples, for samples that are not part of the pool
+        evaluations = np.zeros((len(self._instances), len(samples)), dtype=bool)
+        if len(samples) == 0:
+            return evaluations
+        columns = SampleColumns(self._table.attributes(), samples)
+        for i, table_instance in enumerate(self._instances):
+            if has_arbitrary_predicates(table_instance):
+                evaluation = evaluate_arbitrary_predicates(schema, samples, table_instance, self._aliases[table_instance])
+                evaluations[i] = [evaluation[sample] for sample in samples]
+            else:
+                evaluations[i] = columns.evaluate_predicates(table_instance)
+        return evaluations
+
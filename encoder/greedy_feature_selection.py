@@ -1,12 +1,83 @@
 
-from typing import Set
+from typing import Optional, Set
 import numpy as np
 
 
 # This is an implementation of the algorithm presented by Farahat et al. in "Efficient Greedy Feature Selection for Unsupervised Learning"
 
 
-def greedy_feature_selection(A: np.ndarray, k: int, regularization: float = 10e-5, old_sample_length: int = 0) -> Set[int]:
+def greedy_feature_selection(A: np.ndarray,
+                             k: int,
+                             regularization: float = 10e-5,
+                             old_sample_length: int = 0,
+                             dtype: type = np.float64,
+                             chunk_size: Optional[int] = None) -> Set[int]:
+    A = np.asarray(A, dtype=dtype)
+    shape = A.shape
+    assert(len(shape) == 2)
+    m, n = shape
+
+    S = set()
+    omega = np.zeros((k, n), dtype=dtype)
+
+    # chunked and single precision runs round differently from the reference, so near ties can select other columns
+    # the default double precision run keeps the reference's order of operations and selects the same columns
+    exact = dtype == np.float64 and chunk_size is None
+
+    # with a chunk size, ATA is never materialized and only needed column blocks are computed
+    if exact:
+        ATA = np.dot(A.T, A)
+        f = np.array([np.linalg.norm(ATA[:, i]) ** 2 for i in range(n)])
+        outer = np.empty((n, n))
+    elif chunk_size is None:
+        ATA = np.dot(A.T, A)
+        f = np.linalg.norm(ATA, axis=0) ** 2
+    else:
+        ATA = None
+        f = np.zeros(n, dtype=dtype)
+        for begin in range(0, n, chunk_size):
+            f[begin:begin + chunk_size] = np.linalg.norm(np.dot(A.T, A[:, begin:begin + chunk_size]), axis=0) ** 2
+    if exact:
+        g = np.array([np.linalg.norm(A[:, i]) ** 2 for i in range(n)])
+    else:
+        g = np.linalg.norm(A, axis=0) ** 2
+
+    for t in range(1, k + 1):
+        if np.max(f) <= 10**-10:
+            # if all values in score are 0, return S
+            return S
+        score = f / (g + regularization)
+        if dtype != np.float64 and len(S) > 0:
+            # in single precision the scores of selected columns do not cancel out to zero
+            score[list(S)] = -np.inf
+        if t <= old_sample_length:
+            l = t - 1
+        else:
+            l = np.argmax(score)
+            if l in S or np.max(score) <= 10**-10:
+                return S
+        S.add(l)
+        delta = A.T @ A[:, l] - np.sum(omega[:t - 1, l, None] * omega[:t - 1, :], axis=0)
+        omega[t - 1, :] = delta / np.linalg.norm(delta[l]) ** 0.5
+        omega_t = omega[t - 1, :]
+        if exact:
+            omega_sum = np.zeros(n)
+            for i in range(t - 1):
+                omega_sum += np.dot(np.outer(omega[i, :], omega_t, out=outer), omega[i, :])
+        else:
+            # sum_i outer(omega_i, omega_t) @ omega_i without forming the outer products
+            omega_sum = omega[:t - 1, :].T @ (omega[:t - 1, :] @ omega_t)
+        if ATA is None:
+            ATA_omega = A.T @ (A @ omega_t)
+        else:
+            ATA_omega = np.dot(ATA, omega_t)
+        f = f - 2 * (omega_t * (ATA_omega - omega_sum)) + np.linalg.norm(omega_t) ** 2 * (omega_t * omega_t)
+        g = g - (omega_t * omega_t)
+
+    return S
+
+
+def greedy_feature_selection_reference(A: np.ndarray, k: int, regularization: float = 10e-5, old_sample_length: int = 0) -> Set[int]:
     shape = A.shape
     assert(len(shape) == 2)
     m, n = shape
@@ -58,4 +129,26 @@ def test_feature_selection():
     print(S)
 
 
+def compare_feature_selection(trials: int = 100, seed: int = 0):
+    random = np.random.default_rng(seed)
+    mismatches = {"float64": 0, "chunked": 0, "float32": 0}
+    for _ in range(trials):
+        m = int(random.integers(5, 200))
+        n = int(random.integers(5, 300))
+        A = np.unique((random.random((n, m)) < random.random()).astype(float), axis=0).T
+        # beyond the rank of A all remaining scores are rounding noise
+        k = int(random.integers(1, np.linalg.matrix_rank(A) + 1))
+        old_sample_length = int(random.integers(0, k + 1)) if random.random() < 0.3 else 0
+        reference = greedy_feature_selection_reference(A, k, old_sample_length=old_sample_length)
+        if greedy_feature_selection(A, k, old_sample_length=old_sample_length) != reference:
+            mismatches["float64"] += 1
+        if greedy_feature_selection(A, k, old_sample_length=old_sample_length, chunk_size=64) != reference:
+            mismatches["chunked"] += 1
+        if greedy_feature_selection(A, k, old_sample_length=old_sample_length, dtype=np.float32) != reference:
+            mismatches["float32"] += 1
+    print("%d trials, mismatches: %s" % (trials, mismatches))
+    assert(mismatches["float64"] == 0)
+
+
 # test_feature_selection()
+# compare_feature_selection()
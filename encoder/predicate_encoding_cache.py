@@ -0,0 +1,58 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+
+class PredicateEncodingCache:
+    # encodings are shared between all users of the cache, so they are stored read only
+    def __init__(self, capacity: int = 100000) -> None:
+        self._capacity = capacity
+        self._encodings: OrderedDict[Hashable, np.ndarray] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def value_key(value: Any) -> Hashable:
+        # 1, 1.0 and True are equal keys but not equal encodings
+        return type(value), value
+
+    def capacity(self) -> int:
+        return self._capacity
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        encoding = self._encodings.get(key)
+        if encoding is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+            self._encodings.move_to_end(key)
+        return encoding
+
+    def put(self, key: Hashable, encoding: np.ndarray) -> np.ndarray:
+        encoding.setflags(write=False)
+        self._encodings[key] = encoding
+        self._encodings.move_to_end(key)
+        while len(self._encodings) > self._capacity:
+            self._encodings.popitem(last=False)
+        return encoding
+
+    def hits(self) -> int:
+        return self._hits
+
+    def misses(self) -> int:
+        return self._misses
+
+    def hit_rate(self) -> float:
+        if self._hits + self._misses == 0:
+            return 0
+        return self._hits / (self._hits + self._misses)
+
+    def clear(self):
+        self._encodings = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._encodings)
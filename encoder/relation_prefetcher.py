@@ -0,0 +1,59 @@
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Callable, Optional
+
+
+class RelationPrefetcher:
+    def __init__(self,
+                 generate: Callable[[int], list],
+                 chunk_size: int,
+                 depth: int = 4) -> None:
+        assert(chunk_size > 0 and depth > 0)
+        self._generate = generate
+        self._chunk_size = chunk_size
+        self._queue = Queue(maxsize=depth)
+        self._stop = Event()
+        self._leftover = []
+        self._thread: Optional[Thread] = None
+
+    def start(self):
+        assert(self._thread is None)
+        self._thread = Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        while not self._stop.is_set():
+            try:
+                chunk = self._generate(self._chunk_size)
+            except BaseException as e:
+                chunk = e
+            while not self._stop.is_set():
+                try:
+                    # the bounded queue blocks the producer once it is depth chunks ahead
+                    self._queue.put(chunk, timeout=0.1)
+                    break
+                except Full:
+                    continue
+            if isinstance(chunk, BaseException):
+                return
+
+    def take(self, num_relations: int) -> list:
+        relations = self._leftover
+        while len(relations) < num_relations:
+            chunk = self._queue.get()
+            if isinstance(chunk, BaseException):
+                raise chunk
+            relations += chunk
+        self._leftover = relations[num_relations:]
+        return relations[:num_relations]
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            while self._thread.is_alive():
+                try:
+                    self._queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+import re
+from typing import Any, Dict, List, Pattern
+
+import numpy as np
+from encoder.sample_entry import SampleEntry
+from query.predicatable import Predicatable
+from query.predicate import ArbitraryPredicate, Predicate
+from schema.attribute import Attribute
+
+
+class SampleColumn:
+    def __init__(self, values: List[Any]) -> None:
+        self._values = np.empty(len(values), dtype=object)
+        self._values[:] = values
+        self._null = np.array([value is None for value in values], dtype=bool)
+        self._non_null = np.flatnonzero(~self._null)
+
+        unique_dict = {}
+        inverse = np.empty(len(self._non_null), dtype=np.int64)
+        hashable = True
+        try:
+            for i, row in enumerate(self._non_null):
+                inverse[i] = unique_dict.setdefault(values[row], len(unique_dict))
+        except TypeError:
+            # unhashable values such as arrays, all predicates on this column are evaluated row-wise
+            hashable = False
+            unique_dict = {}
+        uniques = list(unique_dict)
+
+        self._ordered = False
+        self._strings = len(uniques) > 0 and all(isinstance(value, str) for value in uniques)
+        if hashable and not any(isinstance(value, str) for value in uniques):
+            try:
+                if all(value == value for value in uniques):
+                    order = sorted(range(len(uniques)), key=lambda i: uniques[i])
+                    ranks = np.empty(len(uniques), dtype=np.int64)
+                    ranks[order] = np.arange(len(uniques))
+                    uniques = [uniques[i] for i in order]
+                    inverse = ranks[inverse]
+                    self._ordered = True
+            except (TypeError, ArithmeticError):
+                pass
+        self._uniques = uniques
+        self._inverse = inverse
+        self._lower_uniques = [value.lower() for value in uniques] if self._strings else None
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def values(self) -> np.ndarray:
+        return self._values
+
+    def null_mask(self) -> np.ndarray:
+        return self._null
+
+    def evaluate(self, predicate: Predicate) -> np.ndarray:
+        operator = predicate.operator()
+        value = predicate.value()
+        symbol = operator.symbol()
+        if symbol == "IS" and value is None:
+            result = self._null.copy()
+        elif symbol == "IS":
+            result = self._evaluate_rows(predicate)
+        elif self._ordered and not isinstance(value, str) and symbol in ("=", "<", ">"):
+            try:
+                result = self._broadcast(self._evaluate_ordered(symbol, value))
+            except (TypeError, ArithmeticError):
+                result = self._evaluate_rows(predicate)
+        elif self._strings and isinstance(value, str) and symbol in ("LIKE", "ILIKE"):
+            if symbol == "LIKE":
+                pattern = _like_pattern(value)
+                unique_result = [pattern.search(unique) is not None for unique in self._uniques]
+            else:
+                pattern = _like_pattern(value.lower())
+                unique_result = [pattern.search(unique) is not None for unique in self._lower_uniques]
+            result = self._broadcast(np.array(unique_result, dtype=bool))
+        elif self._strings:
+            result = self._broadcast(np.fromiter((operator.compare(unique, value) for unique in self._uniques), dtype=bool, count=len(self._uniques)))
+        else:
+            result = self._evaluate_rows(predicate)
+        if predicate.positive():
+            return result
+        return ~result
+
+    def _evaluate_ordered(self, symbol: str, value: Any) -> np.ndarray:
+        ranks = np.arange(len(self._uniques))
+        if symbol == "<":
+            return ranks < bisect_left(self._uniques, value)
+        elif symbol == ">":
+            return ranks >= bisect_right(self._uniques, value)
+        low = bisect_left(self._uniques, value)
+        high = bisect_right(self._uniques, value)
+        if low >= high or not self._uniques[low] == value:
+            return np.zeros(len(self._uniques), dtype=bool)
+        return (ranks >= low) & (ranks < high)
+
+    def _broadcast(self, unique_result: np.ndarray) -> np.ndarray:
+        result = np.zeros(len(self._values), dtype=bool)
+        if len(self._non_null) > 0:
+            result[self._non_null] = unique_result[self._inverse]
+        return result
+
+    def _evaluate_rows(self, predicate: Predicate) -> np.ndarray:
+        operator = predicate.operator()
+        value = predicate.value()
+        return np.fromiter((operator.compare(row, value) for row in self._values), dtype=bool, count=len(self._values))
+
+
+class SampleColumns:
+    def __init__(self, attributes: List[Attribute], samples: List[SampleEntry]) -> None:
+        self._size = len(samples)
+        self._samples = samples
+        self._columns: Dict[Attribute, SampleColumn] = {}
+        for attribute in attributes:
+            self._columns[attribute] = SampleColumn([sample.value(attribute) for sample in samples])
+
+    def size(self) -> int:
+        return self._size
+
+    def column(self, attribute: Attribute) -> SampleColumn:
+        return self._columns[attribute]
+
+    def evaluate_predicates(self, predicatable: Predicatable) -> np.ndarray:
+        try:
+            return self._evaluate_predicates(predicatable)
+        except (TypeError, AttributeError, ArithmeticError):
+            # incomparable values, the row-wise evaluation short-circuits disjunctions
+            return np.array([sample.evaluate_sample_predicates(predicatable) for sample in self._samples], dtype=bool)
+
+    def _evaluate_predicates(self, predicatable: Predicatable) -> np.ndarray:
+        result = np.ones(self._size, dtype=bool)
+        for disjunction in predicatable.predicates():
+            dis_result = np.zeros(self._size, dtype=bool)
+            for predicate in disjunction:
+                if isinstance(predicate, ArbitraryPredicate):
+                    raise NotImplementedError
+                dis_result |= self._columns[predicate.attribute()].evaluate(predicate)
+            result &= dis_result
+        return result
+
+
+@lru_cache(maxsize=4096)
+def _like_pattern(value: str) -> Pattern:
+    return re.compile(re.escape(value).replace('%', '.*'))
@@ -2,6 +2,8 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Set
 
+import numpy as np
+
 from query.predicatable import Predicatable
 from query.predicate import ArbitraryPredicate
 from query.query_node import QueryNode
@@ -10,6 +12,8 @@ from schema.schema_node import SchemaNode
 
 
 class SampleEntry:
+    __slots__ = ("_labels", "_values")
+
     def __init__(self, labels: List[SchemaNode], values: Dict[Attribute, Any]) -> None:
         self._labels = set(labels)
         self._values = values
@@ -26,7 +30,7 @@ class SampleEntry:
 
     def evaluate_sample_labels(self, node: QueryNode) -> bool:
         for label in node.labels():
-            if label not in self._labels:
+            if label not in self.labels():
                 return False
         return True
 
@@ -37,7 +41,7 @@ class SampleEntry:
             for predicate in disjunction:
                 if isinstance(predicate, ArbitraryPredicate):
                     raise NotImplementedError
-                if predicate.operator().compare(self._values[predicate.attribute()], predicate.value()) == predicate.positive():
+                if predicate.operator().compare(self.value(predicate.attribute()), predicate.value()) == predicate.positive():
                     dis_result = True
                     break
             if not dis_result:
@@ -49,3 +53,80 @@ class SampleEntry:
             if not self.value(attribute) == other.value(attribute):
                 return False
         return True
+
+    def materialize(self) -> SampleEntry:
+        return self
+
+
+class SampleRows:
+    # the rows of one sampled table, stored column-wise in typed arrays instead of one dict per row
+    def __init__(self, table: SchemaNode, attributes: List[Attribute], rows: List[tuple]) -> None:
+        self._labels = {table}
+        self._attributes = attributes
+        self._attribute_index = {attribute: i for i, attribute in enumerate(attributes)}
+        self._columns = []
+        self._nulls = []
+        self._typed = []
+        for i in range(len(attributes)):
+            column, nulls, typed = SampleRows._build_column([row[i] for row in rows])
+            self._columns.append(column)
+            self._nulls.append(nulls)
+            self._typed.append(typed)
+        self._size = len(rows)
+
+    @staticmethod
+    def _build_column(values: List[Any]) -> tuple:
+        nulls = np.array([value is None for value in values], dtype=bool)
+        types = set([type(value) for value in values if value is not None])
+        # bool is a subclass of int, so the types are matched exactly
+        for python_type, dtype in [(int, np.int64), (float, np.float64), (bool, np.bool_)]:
+            if types == {python_type}:
+                try:
+                    column = np.array([python_type() if value is None else value for value in values], dtype=dtype)
+                except OverflowError:
+                    break
+                return column, nulls if nulls.any() else None, True
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column, None, False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def labels(self) -> Set[SchemaNode]:
+        return self._labels
+
+    def attributes(self) -> List[Attribute]:
+        return self._attributes
+
+    def value(self, row: int, attribute: Attribute):
+        assert(attribute in self._attribute_index)
+        i = self._attribute_index[attribute]
+        nulls = self._nulls[i]
+        if nulls is not None and nulls[row]:
+            return None
+        if self._typed[i]:
+            return self._columns[i][row].item()
+        return self._columns[i][row]
+
+    def entries(self) -> List[SampleRow]:
+        return [SampleRow(self, row) for row in range(self._size)]
+
+
+class SampleRow(SampleEntry):
+    __slots__ = ("_rows", "_row")
+
+    def __init__(self, rows: SampleRows, row: int) -> None:
+        self._rows = rows
+        self._row = row
+
+    def labels(self) -> Set[SchemaNode]:
+        return self._rows.labels()
+
+    def value(self, attribute: Attribute):
+        return self._rows.value(self._row, attribute)
+
+    def materialize(self) -> SampleEntry:
+        # a standalone copy does not keep the whole candidate pool alive
+        return SampleEntry(list(self.labels()), {attribute: self.value(attribute) for attribute in self._rows.attributes()})
+
@@ -1,9 +1,11 @@
 
 from __future__ import annotations
 from abc import abstractmethod
-from typing import Optional
+from typing import Dict, List, Optional
 
 import numpy as np
+from encoder.bitmap_cache import BitmapCache
+from query.graphlike_query import GraphlikeQuery
 from query.query_node import QueryNode
 
 
@@ -12,6 +14,7 @@ class Sampler:
         self._bitmap_size = bitmap_size
         self._bitmaps = {}
         self._bitmaps_padded = {}
+        self._bitmap_cache = None
 
     def bitmap_size(self) -> int:
         return self._bitmap_size
@@ -24,13 +27,43 @@ class Sampler:
 
     def bitmap(self, node: QueryNode, alias: Optional[str] = None) -> np.ndarray:
         if node not in self._bitmaps:
-            self._bitmaps[node] = self._bitmap(node, alias=alias)
+            key = None
+            if self._bitmap_cache is not None:
+                key = self._cache_key(node, alias=alias)
+            if key is None:
+                self._bitmaps[node] = self._bitmap(node, alias=alias)
+            else:
+                bitmap = self._bitmap_cache.get(key)
+                if bitmap is None:
+                    bitmap = self._bitmap(node, alias=alias)
+                    self._bitmap_cache.put(key, bitmap)
+                self._bitmaps[node] = bitmap
         return self._bitmaps[node]
 
+    def hetero_bitmap_sizes(self) -> Dict[str, int]:
+        # tables without an entry use the whole bitmap
+        return {}
+
+    def prefetch(self, queries: List[GraphlikeQuery]):
+        # samplers that need database round trips can compute the bitmaps of a whole workload at once
+        pass
+
     @abstractmethod
     def _bitmap(self, node: QueryNode, alias: Optional[str] = None) -> np.ndarray:
         pass
 
+    def _cache_key(self, node: QueryNode, alias: Optional[str] = None) -> Optional[str]:
+        return None
+
+    def version(self) -> Optional[str]:
+        return None
+
+    def bitmap_cache(self) -> Optional[BitmapCache]:
+        return self._bitmap_cache
+
+    def set_bitmap_cache(self, bitmap_cache: Optional[BitmapCache]):
+        self._bitmap_cache = bitmap_cache
+
     def reset(self):
         self._bitmaps = {}
         self._bitmaps_padded = {}
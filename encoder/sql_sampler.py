@@ -1,18 +1,26 @@
 
 
 from __future__ import annotations
+import base64
+import hashlib
 import json
 from random import sample
-from threading import Thread
-from typing import Dict, List, Optional
-
-from data.wrap_value import wrap_value
-from encoder.encoder_util import build_sql_sample, get_samples_sql, SampleBuffer, sql_sample_query
+import multiprocessing
+import os
+import pickle
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from encoder.encoder_util import build_sql_sample, evaluate_arbitrary_predicates, get_samples_sql, has_arbitrary_predicates, SampleBuffer, SamplingMethod, SamplingReport
 from encoder.entropy_picker import EntropyPicker
+from encoder.fs_candidate_pool import FSCandidatePool
 from encoder.greedy_feature_selection import greedy_feature_selection
+from encoder.sample_columns import SampleColumns
 from encoder.sample_entry import SampleEntry
 from encoder.sampler import Sampler
 import numpy as np
+from psycopg2.extras import execute_values
 from query.predicate import Predicate, ArbitraryPredicate
 from query.query_utility import predicates_to_string
 from query.sql.sql_query import SQLQuery
@@ -39,12 +47,31 @@ class SQLSampler(Sampler):
         else:
             self._fuse_from = {}
         self._hedge_fused = hedge_fused
+        self._version = None
+        self._sample_tables: Dict[SQLTable, Tuple[Any, str]] = {}
+        self._connection = None
+        self._connection_pid = None
+        self._new_columns: Dict[SQLTable, List[int]] = {}
+        self._candidate_pools: Dict[SQLTable, FSCandidatePool] = {}
+        self._sampling_report: Optional[SamplingReport] = None
         if separate:
             self._ones = {table: np.ones(self.hetero_bitmap_size(table)) for table in samples}
+            self._columns = {table: SampleColumns(table.attributes(), samples[table]) for table in samples}
 
     def samples(self) -> Dict[SQLTable, List[SampleEntry]]:
         return self._samples
 
+    def new_columns(self) -> Dict[SQLTable, List[int]]:
+        # bitmap positions of the samples added by the last refresh
+        return self._new_columns
+
+    def candidate_pools(self) -> Dict[SQLTable, FSCandidatePool]:
+        return self._candidate_pools
+
+    def sampling_report(self) -> Optional[SamplingReport]:
+        # the candidate pulls of the build or refresh that created this sampler
+        return self._sampling_report
+
     def hetero_bitmap_sizes(self) -> Dict[str, int]:
         return {table.name(): self.hetero_bitmap_size(table) for table in self._samples}
 
@@ -55,44 +82,140 @@ class SQLSampler(Sampler):
         else:
             return len(self._samples[table])
 
-    def _bitmap(self, node: SQLTableInstance, alias: Optional[str] = None) -> np.ndarray:
-        arbitrary = False
-        for disjunction in node.predicates():
-            for predicate in disjunction:
-                if isinstance(predicate, ArbitraryPredicate):
-                    arbitrary = True
-                    break
+    def version(self) -> str:
+        if self._version is None:
+            version_hash = hashlib.sha1()
+            version_hash.update(repr((self._separate,
+                                      sorted([(table.name(), self._fuse_from[table]) for table in self._fuse_from]),
+                                      self._hedge_fused)).encode("utf-8"))
+            for table in sorted(self._samples, key=lambda t: t.name()):
+                version_hash.update(table.name().encode("utf-8"))
+                for sample in self._samples[table]:
+                    for label in sorted(sample.labels(), key=lambda l: l.name()):
+                        version_hash.update(repr([sample.value(attribute) for attribute in label.attributes()]).encode("utf-8"))
+            self._version = version_hash.hexdigest()
+        return self._version
+
+    def _cache_key(self, node: SQLTableInstance, alias: Optional[str] = None) -> Optional[str]:
+        if has_arbitrary_predicates(node):
+            return "%s:%s:%s" % (self.version(), node.canonical_hash(), alias)
+        return "%s:%s" % (self.version(), node.canonical_hash())
 
+    def _bitmap(self, node: SQLTableInstance, alias: Optional[str] = None) -> np.ndarray:
         table = node.table()
-        if arbitrary:
+        if has_arbitrary_predicates(node):
             if not self._separate:
                 raise NotImplementedError
             if alias is None:
                 raise ValueError
-            eval_dict = evaluate_arbitrary_predicates(self._schema, self._samples[table], node, alias)
-            bits = [float(eval_dict[sample]) for sample in self._samples[table]]
+            bits = self._evaluate_arbitrary_nodes(table, [(node, alias)])[0]
         else:
             if self._separate:
                 if len(node.predicates()) == 0:
                     return self._ones[table]
-                bits = [float(sample.evaluate_sample_predicates(node)) for sample in self._samples[table]]
+                bits = self._columns[table].evaluate_predicates(node).astype(np.float64)
             else:
-                bits = [float(sample.evaluate_sample(node)) for sample in self._samples[table]]
+                bits = np.array([float(sample.evaluate_sample(node)) for sample in self._samples[table]])
+        return self._fuse(table, bits)
+
+    def _fuse(self, table: SQLTable, bits: np.ndarray) -> np.ndarray:
         if table not in self._fuse_from:
-            return np.array(bits)
+            return bits
         else:
             unfused = bits[:self._fuse_from[table]]
             fused = bits[self._fuse_from[table]:]
-            fused_average = sum(fused) / len(fused)
+            fused_average = float(np.sum(fused)) / len(fused)
             if self._hedge_fused and fused_average == 0 and len(self._samples[table]) < table.cardinality():
                 fused_average = 1 / (table.cardinality() - self._fuse_from[table])
-            combined = unfused + [fused_average]
-            return np.array(combined)
+            return np.append(unfused, fused_average)
+
+    def prefetch(self, queries: List[SQLQuery]):
+        pending: Dict[SQLTable, List[Tuple[SQLTableInstance, str, Optional[str]]]] = {}
+        seen = set()
+        for query in queries:
+            for node in query.nodes():
+                if node in self._bitmaps or node in seen or not has_arbitrary_predicates(node):
+                    continue
+                seen.add(node)
+                alias = query.alias(node)
+                if not self._separate or alias is None:
+                    # left to _bitmap, which raises for these
+                    continue
+                key = None
+                if self._bitmap_cache is not None:
+                    key = self._cache_key(node, alias=alias)
+                    bitmap = self._bitmap_cache.get(key)
+                    if bitmap is not None:
+                        self._bitmaps[node] = bitmap
+                        continue
+                if node.table() not in pending:
+                    pending[node.table()] = []
+                pending[node.table()].append((node, alias, key))
+
+        for table in pending:
+            evaluations = self._evaluate_arbitrary_nodes(table, [(node, alias) for node, alias, _ in pending[table]])
+            for (node, _, key), bits in zip(pending[table], evaluations):
+                bitmap = self._fuse(table, bits)
+                self._bitmaps[node] = bitmap
+                if key is not None:
+                    self._bitmap_cache.put(key, bitmap)
+
+    def _evaluation_connection(self):
+        # a dedicated autocommit connection keeps the temporary sample tables without committing the transactions of the schema connection
+        if self._connection is None or self._connection_pid != os.getpid() or self._connection.closed:
+            if self._connection is not None and self._connection_pid != os.getpid():
+                # the forked connection is shared with the parent, it must neither be used nor garbage collected here
+                _inherited_connections.append(self._connection)
+            self._connection = self._schema.new_connection()
+            self._connection.autocommit = True
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def _sample_table(self, table: SQLTable) -> str:
+        # the sample keys of each table are loaded into a temporary table once per session
+        connection = self._evaluation_connection()
+        if table in self._sample_tables and self._sample_tables[table][0] is connection:
+            return self._sample_tables[table][1]
+        sample_table = "jgmp_samples_%s_%s" % (table.name(), self.version()[:12])
+        key_names = [column.name() for column in table.key_columns()]
+        rows = [[position] + [sample.value(column) for column in table.key_columns()] for position, sample in enumerate(self._samples[table])]
+        cursor = connection.cursor()
+        cursor.execute("DROP TABLE IF EXISTS %s;" % sample_table)
+        cursor.execute("CREATE TEMPORARY TABLE %s AS SELECT 0 AS sample_position, %s FROM %s LIMIT 0;" % (sample_table, ", ".join(key_names), table.name()))
+        execute_values(cursor, "INSERT INTO %s (sample_position, %s) VALUES %%s;" % (sample_table, ", ".join(key_names)), rows, page_size=10000)
+        cursor.execute("ANALYZE %s;" % sample_table)
+        cursor.close()
+        self._sample_tables[table] = (connection, sample_table)
+        return sample_table
+
+    def _evaluate_arbitrary_nodes(self, table: SQLTable, nodes: List[Tuple[SQLTableInstance, str]], max_columns: int = 1000) -> List[np.ndarray]:
+        sample_table = self._sample_table(table)
+        key_names = [column.name() for column in table.key_columns()]
+        evaluations = []
+        cursor = self._evaluation_connection().cursor()
+        for begin in range(0, len(nodes), max_columns):
+            chunk = nodes[begin:begin + max_columns]
+            # every alias joins the sample keys once, each node becomes one boolean column
+            aliases = sorted(set([alias for _, alias in chunk]))
+            join_strings = []
+            for alias in aliases:
+                join_condition = " AND ".join(["%s.%s = jgmp_sample.%s" % (alias, key_name, key_name) for key_name in key_names])
+                join_strings.append("JOIN %s AS %s ON %s" % (table.name(), alias, join_condition))
+            column_strings = ["(%s)" % predicates_to_string(alias, node.predicates()) for node, alias in chunk]
+            query = "SELECT jgmp_sample.sample_position, %s FROM %s AS jgmp_sample %s;" % (", ".join(column_strings), sample_table, " ".join(join_strings))
+            cursor.execute(query)
+            bits = np.zeros((len(chunk), len(self._samples[table])))
+            for row in cursor.fetchall():
+                bits[:, row[0]] = [float(value is not None and value) for value in row[1:]]
+            evaluations += list(bits)
+        cursor.close()
+        return evaluations
 
     @staticmethod
-    def build_sampler_random(schema: SQLSchema, separate: bool, bitmap_size: int) -> SQLSampler:
+    def build_sampler_random(schema: SQLSchema, separate: bool, bitmap_size: int, sampling_methods: Optional[Dict[str, SamplingMethod]] = None) -> SQLSampler:
         connection = schema.connection()
         cursor = connection.cursor()
+        report = SamplingReport()
 
         if separate:
             sample_number = bitmap_size
@@ -103,7 +226,7 @@ class SQLSampler(Sampler):
 
         for table in schema.nodes():
             assert(isinstance(table, SQLTable))
-            table_samples[table] = get_samples_sql(cursor, table, sample_number)
+            table_samples[table] = get_samples_sql(cursor, table, sample_number, sampling_methods, report)
 
         cursor.close()
 
@@ -113,7 +236,10 @@ class SQLSampler(Sampler):
             merged = sum([table_samples[table] for table in schema.nodes()], [])
             bitmap_size = len(merged)
             samples = {table: merged for table in schema.nodes()}
-        return SQLSampler(schema, separate, bitmap_size, samples)
+        print(report)
+        sampler = SQLSampler(schema, separate, bitmap_size, samples)
+        sampler._sampling_report = report
+        return sampler
 
     @staticmethod
     def build_sampler_entropy(schema: SQLSchema,
@@ -122,9 +248,11 @@ class SQLSampler(Sampler):
                               choice_number: int,
                               queries: List[SQLQuery],
                               buffer_size: int = 100000,
-                              min_gain: float = 0) -> SQLSampler:
+                              min_gain: float = 0,
+                              sampling_methods: Optional[Dict[str, SamplingMethod]] = None) -> SQLSampler:
         connection = schema.connection()
         cursor = connection.cursor()
+        report = SamplingReport()
 
         print("Sampling started")
 
@@ -147,13 +275,13 @@ class SQLSampler(Sampler):
                 assert (isinstance(table, SQLTable))
                 samples[table] = []
                 entropy_picker = EntropyPicker([table_instances[table]], min_gain=min_gain)
-                sample_buffer = SampleBuffer(lambda t=table: get_samples_sql(cursor, t, buffer_size))
+                sample_buffer = SampleBuffer(lambda t=table: get_samples_sql(cursor, t, buffer_size, sampling_methods, report))
                 for i in range(bitmap_size):
                     sample_choices = sample_buffer.get_samples(choice_number)
                     sample, gain = entropy_picker.pick(sample_choices)
                     if sample is None:
                         break
-                    samples[table].append(sample)
+                    samples[table].append(sample.materialize())
                 print("%s: %d samples" % (table.name(), len(samples[table])))
             bitmap_size = max([len(samples[table]) for table in samples])
         else:
@@ -161,7 +289,7 @@ class SQLSampler(Sampler):
             tables = [table for table in table_instances if len(table_instances[table]) > 0]
             table_choices = choice_number // len(tables)
             samples = []
-            sample_buffers = {table: SampleBuffer(lambda t=table: get_samples_sql(cursor, t, buffer_size)) for table in tables}
+            sample_buffers = {table: SampleBuffer(lambda t=table: get_samples_sql(cursor, t, buffer_size, sampling_methods, report)) for table in tables}
             for i in range(bitmap_size):
                 sample_choices = []
                 for table in tables:
@@ -169,15 +297,18 @@ class SQLSampler(Sampler):
                 sample, gain = entropy_picker.pick(sample_choices)
                 if sample is None:
                     break
-                samples.append(sample)
+                samples.append(sample.materialize())
             bitmap_size = len(samples)
             print("%d samples" % len(samples))
             samples = {table: samples for table in schema.nodes()}
 
+        print(report)
         print("Sampling finished")
 
         cursor.close()
-        return SQLSampler(schema, separate, bitmap_size, samples)
+        sampler = SQLSampler(schema, separate, bitmap_size, samples)
+        sampler._sampling_report = report
+        return sampler
 
     @staticmethod
     def build_sampler_fs(schema: SQLSchema,
@@ -186,7 +317,9 @@ class SQLSampler(Sampler):
                          instance_number: int,
                          max_fs_choices: int,
                          queries: List[SQLQuery],
-                         old_sampler: Optional[SQLSampler] = None) -> SQLSampler:
+                         old_sampler: Optional[SQLSampler] = None,
+                         num_processes: int = 0,
+                         sampling_methods: Optional[Dict[str, SamplingMethod]] = None) -> SQLSampler:
         table_instances = {}
         aliases = {}
         arbitrary_table_instances = {}
@@ -204,7 +337,7 @@ class SQLSampler(Sampler):
                     aliases[table_instance] = query.alias(table_instance)
 
         for table in table_instances:
-            table_instances[table] = table_instances[table].union(sample(predicate_table_instances[table], min(instance_number, len(predicate_table_instances[table]))))
+            table_instances[table] = table_instances[table].union(sample(list(predicate_table_instances[table]), min(instance_number, len(predicate_table_instances[table]))))
             arbitrary_table_instances[table] = []
             for table_instance in table_instances[table]:
                 for disjunction in table_instance.predicates():
@@ -213,71 +346,87 @@ class SQLSampler(Sampler):
                             arbitrary_table_instances[table].append(table_instance)
                             break
 
-        cursor = schema.connection().cursor()
+        jobs = []
         samples = {}
         for table in table_instances:
             if len(table_instances[table]) <= 1:
                 samples[table] = []
                 print("%s: %d samples" % (table.name(), len(samples[table])))
                 continue
-            a_set = set()
-            a_list = []
-            candidate_dict = {}
-            if old_sampler is not None:
-                # TODO: add support for arbitrary predicates
-                old_samples = old_sampler.samples()[table]
-                for old_sample in old_samples:
-                    a = np.zeros(len(table_instances[table]))
-                    for j, table_instance in enumerate(table_instances[table]):
-                        a[j] = old_sample.evaluate_sample_predicates(table_instance)
-                    a_tuple = tuple(a)
-                    a_set.add(a_tuple)
-                    candidate_dict[len(a_list)] = old_sample
-                    a_list.append(a)
-                old_sample_length = len(old_samples)
-            else:
-                old_sample_length = 0
-            sample_query = sql_sample_query(table, choice_number)
-            cursor.execute(sample_query)
-            candidates = []
-            for sample_row in cursor.fetchall():
-                candidate = build_sql_sample(table, sample_row)
-                candidates.append(candidate)
-            arbitrary_evals = {}
-            for table_instance in arbitrary_table_instances[table]:
-                arbitrary_evals[table_instance] = {}
-            for i, candidate in enumerate(candidates):
-                a = np.zeros(len(table_instances[table]))
-                for j, table_instance in enumerate(table_instances[table]):
-                    if table_instance in arbitrary_evals:
-                        if candidate not in arbitrary_evals[table_instance]:
-                            arbitrary_evals[table_instance] = evaluate_arbitrary_predicates(schema, candidates, table_instance, aliases[table_instance], begin=i)
-                        a[j] = arbitrary_evals[table_instance][candidate]
-                    else:
-                        a[j] = candidate.evaluate_sample_predicates(table_instance)
-                # check if a is all zeros or all ones
-                a_sum = np.sum(a)
-                if a_sum == 0 or a_sum == len(a):
-                    continue
-                a_tuple = tuple(a)
-                if a_tuple not in a_set:
-                    a_set.add(a_tuple)
-                    candidate_dict[len(a_list)] = candidate
-                    a_list.append(a)
-                    if len(a_list) >= max_fs_choices:
-                        break
-            if len(a_set) == 0:
-                samples[table] = []
-            else:
-                A = np.array(list(a_set)).T
-                sample_ids = greedy_feature_selection(A, min(bitmap_size, len(a_set)), old_sample_length=old_sample_length)
-                samples[table] = [candidate_dict[i] for i in sample_ids]
-            print("%s: %d samples" % (table.name(), len(samples[table])))
-        cursor.close()
-        bitmap_size = max([len(samples[table]) for table in samples])
-        return SQLSampler(schema, True, bitmap_size, samples)
+            old_samples = old_sampler.samples()[table] if old_sampler is not None else []
+            jobs.append((table, list(table_instances[table]), arbitrary_table_instances[table], old_samples))
+
+        job_kwargs = {"aliases": aliases, "choice_number": choice_number, "max_fs_choices": max_fs_choices, "bitmap_size": bitmap_size, "sampling_methods": sampling_methods}
+        pool = None
+        if num_processes > 0 and len(jobs) > 1:
+            # initargs of a fork pool are inherited, only job positions and raw sample rows cross process boundaries
+            pool = multiprocessing.get_context("fork").Pool(min(num_processes, len(jobs)), initializer=initialize_fs_process, initargs=(schema, jobs, job_kwargs))
+            results = pool.imap_unordered(select_fs_samples_process, range(len(jobs)))
+        else:
+            results = (select_fs_samples_job(schema, jobs, job_kwargs, i) for i in range(len(jobs)))
+        report = SamplingReport()
+        try:
+            for i, sample_keys, seconds, job_report in results:
+                report.merge(job_report)
+                table, _, _, old_samples = jobs[i]
+                samples[table] = [old_samples[key] if isinstance(key, int) else build_sql_sample(table, key) for key in sample_keys]
+                print("%s: %d samples (%.2f s)" % (table.name(), len(samples[table]), seconds))
+        finally:
+            # all results are consumed at this point unless a worker raised
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        samples = {table: samples[table] for table in table_instances}
+
+        print(report)
 
-    def save(self, filepath: str):
+        bitmap_size = max([len(samples[table]) for table in samples])
+        sampler = SQLSampler(schema, True, bitmap_size, samples)
+        sampler._sampling_report = report
+        return sampler
+
+    def refresh_fs(self,
+                   queries: List[SQLQuery],
+                   bitmap_size: int,
+                   choice_number: int,
+                   instance_number: int,
+                   max_fs_choices: int,
+                   previous_queries: List[SQLQuery] = [],
+                   sampling_methods: Optional[Dict[str, SamplingMethod]] = None) -> SQLSampler:
+        # the old samples keep their bitmap positions, new samples are appended up to bitmap_size per table
+        assert(self._separate and len(self._fuse_from) == 0)
+        samples = {}
+        new_columns = {}
+        candidate_pools = dict(self._candidate_pools)
+        report = SamplingReport()
+        for table in self._samples:
+            old_samples = self._samples[table]
+            if table not in candidate_pools:
+                # the first refresh pulls the candidate pool and evaluates the instances of the previous workload
+                candidate_pools[table] = FSCandidatePool.build(self._schema, table, choice_number, sampling_methods, report)
+                previous_instances, previous_aliases = refresh_table_instances(candidate_pools[table], previous_queries, instance_number)
+                candidate_pools[table].add_instances(self._schema, previous_instances, previous_aliases)
+            pool = candidate_pools[table]
+            start = time.time()
+            table_instances, aliases = refresh_table_instances(pool, queries, instance_number)
+            added = pool.add_instances(self._schema, table_instances, aliases)
+
+            new_samples = []
+            if bitmap_size > len(old_samples) and len(pool.instances()) > 0:
+                new_ids = select_refresh_samples(pool.evaluate_samples(self._schema, old_samples), pool.evaluations(), bitmap_size - len(old_samples), max_fs_choices)
+                new_samples = [pool.candidates()[i].materialize() for i in new_ids]
+            samples[table] = old_samples + new_samples
+            new_columns[table] = list(range(len(old_samples), len(samples[table])))
+            print("%s: %d new instances, %d + %d samples (%.2f s)" % (table.name(), added, len(old_samples), len(new_samples), time.time() - start))
+
+        print(report)
+        sampler = SQLSampler(self._schema, True, max([len(samples[table]) for table in samples]), samples)
+        sampler._new_columns = new_columns
+        sampler._candidate_pools = candidate_pools
+        sampler._sampling_report = report
+        return sampler
+
+    def save(self, filepath: str, embed_rows: bool = True):
         if self._separate:
             save_samples = self._samples
             sample_order = {}  # not needed
@@ -312,6 +461,8 @@ class SQLSampler(Sampler):
                      "hedge_fused": self._hedge_fused}
         if not self._separate:
             json_data["sample_order"] = sample_order
+        if embed_rows:
+            json_data["rows"] = {table.name(): encode_sample_columns(table, save_samples[table]) for table in save_samples}
         with open(filepath, 'w') as f:
             json.dump(json_data, f)
 
@@ -327,17 +478,17 @@ class SQLSampler(Sampler):
         fuse_from = {schema.node(table_name): fuse_from_name[table_name] for table_name in fuse_from_name}
         hedge_fused = json_data["hedge_fused"]
 
-        cursor = schema.connection().cursor()
-
         samples = {}
-        for table_name in sample_keys:
-            table = schema.node(table_name)
-            samples[table] = []
-            for sample in sample_keys[table_name]:
-                sample_query = "SELECT * FROM %s WHERE %s;" % (table_name, " AND ".join("%s = %s" % (key, str(value)) for key, value in zip(keys[table_name], sample)))
-                cursor.execute(sample_query)
-                sample_row = cursor.fetchone()
-                samples[table].append(build_sql_sample(table, sample_row))
+        if "rows" in json_data:
+            for table_name in json_data["rows"]:
+                table = schema.node(table_name)
+                samples[table] = decode_sample_columns(table, json_data["rows"][table_name])
+        else:
+            cursor = schema.connection().cursor()
+            for table_name in sample_keys:
+                table = schema.node(table_name)
+                samples[table] = fetch_samples_by_key(cursor, table, keys[table_name], sample_keys[table_name])
+            cursor.close()
         if not separate:
             sample_order = json_data["sample_order"]
             merged = [None] * bitmap_size
@@ -348,69 +499,161 @@ class SQLSampler(Sampler):
             for table in samples:
                 samples[table] = merged
 
-        cursor.close()
-
         return SQLSampler(schema, separate, bitmap_size, samples, fuse_from=fuse_from, hedge_fused=hedge_fused)
 
-def get_fs_samples(schema: SQLSchema, table: SQLTable, table_instances: List[SQLTableInstance], choice_number: int, max_fs_choices: int, bitmap_size: int, result: List[SampleEntry]):
-    cursor = schema.connection().cursor()
-    sample_query = sql_sample_query(table, choice_number)
-    cursor.execute(sample_query)
+
+def encode_sample_columns(table: SQLTable, samples: List[SampleEntry]) -> Dict[str, Any]:
+    attributes = table.attributes()
+    columns = [[sample.value(attribute) for sample in samples] for attribute in attributes]
+    # pickle keeps the python types of the values (Decimal, date, ...), zlib and base64 make it fit into the json file
+    data = base64.b64encode(zlib.compress(pickle.dumps(columns, protocol=pickle.HIGHEST_PROTOCOL))).decode("ascii")
+    return {"attributes": [attribute.name() for attribute in attributes], "data": data}
+
+
+def decode_sample_columns(table: SQLTable, encoded: Dict[str, Any]) -> List[SampleEntry]:
+    columns = pickle.loads(zlib.decompress(base64.b64decode(encoded["data"])))
+    column_dict = dict(zip(encoded["attributes"], columns))
+    attribute_columns = [column_dict[attribute.name()] for attribute in table.attributes()]
+    num_samples = len(columns[0]) if len(columns) > 0 else 0
+    return [build_sql_sample(table, [column[i] for column in attribute_columns]) for i in range(num_samples)]
+
+
+def fetch_samples_by_key(cursor, table: SQLTable, key_names: List[str], sample_keys: List[List[Any]]) -> List[SampleEntry]:
+    if len(sample_keys) == 0:
+        return []
+    attribute_names = [attribute.name() for attribute in table.attributes()]
+    column_string = ", ".join(attribute_names)
+    if len(key_names) == 1:
+        sample_query = "SELECT %s FROM %s WHERE %s = ANY(%%s);" % (column_string, table.name(), key_names[0])
+        cursor.execute(sample_query, ([sample_key[0] for sample_key in sample_keys],))
+    else:
+        sample_query = "SELECT %s FROM %s WHERE (%s) IN %%s;" % (column_string, table.name(), ", ".join(key_names))
+        cursor.execute(sample_query, (tuple(tuple(sample_key) for sample_key in sample_keys),))
+    key_positions = [attribute_names.index(key_name) for key_name in key_names]
+    rows = {tuple(row[position] for position in key_positions): row for row in cursor.fetchall()}
+    return [build_sql_sample(table, rows[tuple(sample_key)]) for sample_key in sample_keys]
+
+
+def select_fs_samples(schema: SQLSchema,
+                      table: SQLTable,
+                      table_instances: List[SQLTableInstance],
+                      arbitrary_table_instances: List[SQLTableInstance],
+                      aliases: Dict[SQLTableInstance, str],
+                      choice_number: int,
+                      max_fs_choices: int,
+                      bitmap_size: int,
+                      old_samples: List[SampleEntry] = [],
+                      sampling_methods: Optional[Dict[str, SamplingMethod]] = None,
+                      report: Optional[SamplingReport] = None) -> List[SampleEntry]:
     a_set = set()
     a_list = []
     candidate_dict = {}
-    for sample_row in cursor.fetchall():
-        candidate = build_sql_sample(table, sample_row)
+    # TODO: add support for arbitrary predicates
+    for old_sample in old_samples:
         a = np.zeros(len(table_instances))
         for j, table_instance in enumerate(table_instances):
-            a[j] = candidate.evaluate_sample_predicates(table_instance)
+            a[j] = old_sample.evaluate_sample_predicates(table_instance)
+        a_tuple = tuple(a)
+        a_set.add(a_tuple)
+        candidate_dict[len(a_list)] = old_sample
+        a_list.append(a)
+    old_sample_length = len(old_samples)
+
+    cursor = schema.connection().cursor()
+    candidates = get_samples_sql(cursor, table, choice_number, sampling_methods, report)
+    cursor.close()
+    arbitrary_evals = {}
+    for table_instance in arbitrary_table_instances:
+        arbitrary_evals[table_instance] = {}
+    for i, candidate in enumerate(candidates):
+        a = np.zeros(len(table_instances))
+        for j, table_instance in enumerate(table_instances):
+            if table_instance in arbitrary_evals:
+                if candidate not in arbitrary_evals[table_instance]:
+                    arbitrary_evals[table_instance] = evaluate_arbitrary_predicates(schema, candidates, table_instance, aliases[table_instance], begin=i)
+                a[j] = arbitrary_evals[table_instance][candidate]
+            else:
+                a[j] = candidate.evaluate_sample_predicates(table_instance)
         # check if a is all zeros or all ones
         a_sum = np.sum(a)
         if a_sum == 0 or a_sum == len(a):
             continue
         a_tuple = tuple(a)
         if a_tuple not in a_set:
-            a_set.add(tuple(a))
+            a_set.add(a_tuple)
             candidate_dict[len(a_list)] = candidate
             a_list.append(a)
             if len(a_list) >= max_fs_choices:
                 break
     if len(a_set) == 0:
-        return
-    else:
-        A = np.array(list(a_set)).T
-        sample_ids = greedy_feature_selection(A, min(bitmap_size, len(a_set)))
-        for i in sample_ids:
-            result.append(candidate_dict[i])
-    cursor.close()
+        return []
+    # columns follow a_list, so the first old_sample_length columns are the old samples
+    A = np.array(a_list).T
+    sample_ids = greedy_feature_selection(A, min(bitmap_size, len(a_set)), old_sample_length=old_sample_length)
+    return [candidate_dict[i] for i in sample_ids]
+
+
+def refresh_table_instances(pool: FSCandidatePool, queries: List[SQLQuery], instance_number: int) -> Tuple[List[SQLTableInstance], Dict[SQLTableInstance, str]]:
+    table_instances = {}
+    aliases = {}
+    for query in queries:
+        for table_instance in query.nodes():
+            assert (isinstance(table_instance, SQLTableInstance))
+            if table_instance.table() == pool.table() and len(table_instance.predicates()) > 0 and not pool.contains(table_instance):
+                table_instances[table_instance.canonical_hash()] = table_instance
+                aliases[table_instance] = query.alias(table_instance)
+    table_instances = list(table_instances.values())
+    return sample(table_instances, min(instance_number, len(table_instances))), aliases
+
+
+def select_refresh_samples(old_evaluations: np.ndarray, candidate_evaluations: np.ndarray, num_new_samples: int, max_fs_choices: int) -> List[int]:
+    # like select_fs_samples, candidates that split no instance or repeat an earlier column are skipped
+    column_sums = np.sum(candidate_evaluations, axis=0)
+    splitting = np.flatnonzero((column_sums > 0) & (column_sums < candidate_evaluations.shape[0]))
+    columns = np.packbits(candidate_evaluations[:, splitting].T, axis=1)
+    columns = np.ascontiguousarray(columns).view(np.dtype((np.void, columns.shape[1]))).ravel()
+    _, first = np.unique(columns, return_index=True)
+    first = np.sort(first)
+    old_columns = set([column.tobytes() for column in np.packbits(old_evaluations.T, axis=1)])
+    choices = [int(splitting[i]) for i in first if columns[i].tobytes() not in old_columns][:max_fs_choices]
+    if len(choices) == 0:
+        return []
+    old_sample_length = old_evaluations.shape[1]
+    A = np.concatenate([old_evaluations, candidate_evaluations[:, choices]], axis=1).astype(np.float64)
+    selected = greedy_feature_selection(A, min(old_sample_length + num_new_samples, A.shape[1]), old_sample_length=old_sample_length)
+    # old samples stay in place even if the selection stopped before reaching all of them
+    return [choices[i - old_sample_length] for i in sorted(selected) if i >= old_sample_length]
+
+
+FSJob = Tuple[SQLTable, List[SQLTableInstance], List[SQLTableInstance], List[SampleEntry]]
+
+# set per worker by initialize_fs_process
+_fs_worker_state: Optional[Tuple[SQLSchema, List[FSJob], Dict[str, Any]]] = None
+_inherited_connections = []
+
+
+def select_fs_samples_job(schema: SQLSchema, jobs: List[FSJob], job_kwargs: Dict[str, Any], job_index: int) -> Tuple[int, List[Union[int, tuple]], float, SamplingReport]:
+    table, table_instances, arbitrary_table_instances, old_samples = jobs[job_index]
+    start = time.time()
+    report = SamplingReport()
+    selected = select_fs_samples(schema, table, table_instances, arbitrary_table_instances, old_samples=old_samples, report=report, **job_kwargs)
+    old_sample_ids = {id(old_sample): i for i, old_sample in enumerate(old_samples)}
+    sample_keys = []
+    for sample in selected:
+        if id(sample) in old_sample_ids:
+            sample_keys.append(old_sample_ids[id(sample)])
+        else:
+            sample_keys.append(tuple(sample.value(attribute) for attribute in table.attributes()))
+    return job_index, sample_keys, time.time() - start, report
 
 
-def evaluate_arbitrary_predicates(schema: SQLSchema, samples: List[SampleEntry], table_instance: SQLTableInstance, alias: str, samples_per_query: int = 5000, begin: Optional[int] = None) -> Dict[SampleEntry, bool]:
-    if len(samples) == 0:
-        return {}
-    table = list(samples[0].labels())[0]
-    primary_key = table.key_columns()
-    if begin is None:
-        sample_partitions = [samples[i:i + samples_per_query] for i in range(0, len(samples), samples_per_query)]
-    else:
-        sample_partitions = [samples[begin:begin + samples_per_query]]
-    connection = schema.connection()
-    result = {}
-    select_string = "SELECT %s FROM %s AS %s" % (predicates_to_string(alias, table_instance.predicates()), table.name(), alias)
-    cursor = connection.cursor()
-    for samples in sample_partitions:
-        sample_strings = []
-        for sample in samples:
-            sample_key = [sample.value(column) for column in primary_key]
-            sample_strings.append("(" + ", ". join([wrap_value(value) for value in sample_key]) + ")")
-
-        in_string = "(" + ", ". join([pk.name() for pk in primary_key]) + ")" + " IN (" + ", ".join(sample_strings) + ")"
-        query = select_string + " WHERE " + in_string + ";"
-
-        cursor.execute(query)
-        for sample, row in zip(samples, cursor.fetchall()):
-            eval = row[0]
-            result[sample] = eval is not None and eval
-    cursor.close()
-    return result
+def initialize_fs_process(schema: SQLSchema, jobs: List[FSJob], job_kwargs: Dict[str, Any]):
+    global _fs_worker_state
+    # the forked connection is shared with the parent, it must neither be used nor garbage collected here
+    _inherited_connections.append(schema.reconnect())
+    _fs_worker_state = (schema, jobs, job_kwargs)
+
 
+def select_fs_samples_process(job_index: int) -> Tuple[int, List[Union[int, tuple]], float, SamplingReport]:
+    schema, jobs, job_kwargs = _fs_worker_state
+    return select_fs_samples_job(schema, jobs, job_kwargs, job_index)
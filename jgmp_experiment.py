@@ -25,12 +25,14 @@ def main():
     parser.add_argument('--subplan_query_mode', type=str, default='pg_selected', choices=['all', 'pg_selected'])
     # competitors
     parser.add_argument('--competitors', type=str, default='default', choices=['default', 'fs-ablation'])
+    # query set snapshots
+    parser.add_argument('--snapshot_directory', type=str, default=None)
 
     args = parser.parse_args()
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
-    query_db = QueryDB("query-optimization", port=args.port)
+    query_db = QueryDB("query-optimization", port=args.port, snapshot_directory=args.snapshot_directory)
 
     if args.subplan_query_mode == 'all':
         subplan_query_mode = SubqueryMode.ALL
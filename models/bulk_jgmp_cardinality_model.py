@@ -9,12 +9,15 @@ from encoder.encoder import Encoder
 from loss.logarithmic_mse import LogarithmicMSE
 from models.cardinality_model import CardinalityModel
 from models.multi_head_attention_conv_index import MultiHeadAttentionConvIndex
-from models.util import build_layer_stack, MultiHeadAggregation
+from models.util import build_layer_stack, grouped_sample_projection, label_ids, MultiHeadAggregation, table_bitmap_sizes, unpack_samples
 from query.graphlike_query import GraphlikeQuery
+from query.sql.sql_query import SQLQuery
 from query_data.bulk_light_query_data import BulkLightQueryData
-from typing import List, Tuple, Any, Dict
+from schema.schema_node import SchemaNode
+from typing import List, Optional, Tuple, Any, Dict
 from torch.nn.modules.linear import Linear
-from torch.nn import Module, Parameter, ModuleList
+from torch import Tensor
+from torch.nn import Embedding, Module, Parameter, ModuleList
 import torch
 
 
@@ -40,17 +43,27 @@ class BulkJGMPCardinalityModel(CardinalityModel):
 
         self._sample_weights = kaiming_uniform_(Parameter(torch.empty((encoder.node_label_encoding_size(), sample_layer_size, encoder.sampler().bitmap_size()))), a=math.sqrt(5))
         self._sample_bias = kaiming_uniform_(Parameter(torch.empty((encoder.node_label_encoding_size(), sample_layer_size))), a=math.sqrt(5))
+        self._bitmap_sizes = table_bitmap_sizes(encoder.sampler(), encoder.node_index)
+        self._sample_mask_handle = None
         if use_pg_estimates:
             node_size = sample_layer_size + 1
         else:
             node_size = sample_layer_size
         self._node_layers, node_size = build_layer_stack(node_size, node_layer_sizes)
 
+        self._index_encoding = encoder.index_encoding()
+        self._packed_samples = encoder.packed_samples()
+        if self._index_encoding:
+            # starts as the one-hot encoding of the dense mode
+            self._edge_label_embedding = Embedding.from_pretrained(torch.eye(encoder.edge_encoding_size()), freeze=False)
+
         if encode_fk_direction:
             edge_size = encoder.edge_encoding_size() + 1
         else:
             edge_size = 2 * encoder.edge_encoding_size()
         self._edge_layers, edge_size = build_layer_stack(edge_size, edge_layer_sizes)
+        # edge embeddings of every label, natural directions followed by reversed directions, see freeze_for_inference
+        self.register_buffer("_frozen_edges", None, persistent=False)
 
         self._graph_layers = ModuleList()
         node_sizes = [node_size]
@@ -78,12 +91,19 @@ class BulkJGMPCardinalityModel(CardinalityModel):
     def bulk_encode(self, queries: List[GraphlikeQuery]):
         return [self._encoder.bulk_light_encode_cardinality(queries)]
 
+    def bulk_encode_workload(self, workload: List[List[GraphlikeQuery]]):
+        return self._encoder.bulk_light_encode_workload(workload)
+
+    def bulk_encode_lattice(self, query: SQLQuery, subsets: List[int], cardinalities: Optional[List[int]] = None):
+        return [self._encoder.bulk_light_encode_lattice(query, subsets, cardinalities)]
+
     def forward(self, data: BulkLightQueryData):
-        # retrieve sample_weights based on the label of the table
+        if self._packed_samples:
+            shared_node_samples = unpack_samples(data.shared_node_samples, data.shared_node_fused_columns, data.shared_node_fused_values, self._sample_weights.size(2))
+        else:
+            shared_node_samples = data.shared_node_samples
         # sample bitmaps between different tables are not semantically related so they should be processed by different sets of weights
-        sample_weights = torch.index_select(self._sample_weights, 0, data.shared_node_labels)
-        sample_biases = torch.index_select(self._sample_bias, 0, data.shared_node_labels)
-        samples = torch.matmul(sample_weights, data.shared_node_samples.unsqueeze(dim=2)).squeeze() + sample_biases
+        samples = grouped_sample_projection(self._sample_weights, self._sample_bias, data.shared_node_labels, shared_node_samples, self._bitmap_sizes)
 
         if self._use_pg_estimates:
             # append pg estimates to samples
@@ -98,22 +118,36 @@ class BulkJGMPCardinalityModel(CardinalityModel):
         # this allows us to compute different node embeddings based on the structure of the subplan-queries
         nodes = torch.index_select(shared_nodes, 0, data.x)
 
-        if self._encode_fk_direction:
-            natural_edges = torch.nn.functional.pad(data.edge_attr, (0,1), "constant", 1)
-            reversed_edges = torch.nn.functional.pad(data.edge_attr, (0,1), "constant", 0)
+        edge_ids = None
+        if self._frozen_edges is not None:
+            edge_ids = label_ids(data.edge_attr, self._index_encoding)
+        if edge_ids is not None:
+            num_labels = self._frozen_edges.size(0) // 2
+            if "message_ptr" in data:
+                edge_ids = torch.index_select(edge_ids, 0, data.message_edge) + data.message_reversed * num_labels
+            else:
+                edge_ids = torch.cat([edge_ids, edge_ids + num_labels])
+            edges = torch.nn.functional.embedding(edge_ids, self._frozen_edges)
         else:
-            padding = torch.zeros_like(data.edge_attr)
-            natural_edges = torch.cat([data.edge_attr, padding], dim=1)
-            reversed_edges = torch.cat([padding, data.edge_attr], dim=1)
-        for layer in self._edge_layers:
-            natural_edges = layer(natural_edges)
-            reversed_edges = layer(reversed_edges)
-        edges = torch.cat([natural_edges, reversed_edges])
-        edge_index = torch.cat([data.edge_index, torch.flip(data.edge_index, [0])], dim=1)
+            if self._index_encoding:
+                edge_labels = self._edge_label_embedding(data.edge_attr)
+            else:
+                edge_labels = data.edge_attr
+            natural_edges, reversed_edges = self._embed_edges(edge_labels)
+            edges = torch.cat([natural_edges, reversed_edges])
+            if "message_ptr" in data:
+                edges = torch.index_select(edges, 0, data.message_edge + data.message_reversed * data.edge_index.size(1))
+        if "message_ptr" in data:
+            # the encoder already sorted the edges of both directions by target
+            edge_index = data.message_index
+            ptr = torch.nn.functional.pad(data.message_ptr, (1, 0), "constant", 0)
+        else:
+            edge_index = torch.cat([data.edge_index, torch.flip(data.edge_index, [0])], dim=1)
+            ptr = None
 
         skip_nodes = [nodes]
         for layer in self._graph_layers:
-            nodes = layer(nodes, edge_index, edges)
+            nodes = layer(nodes, edge_index, edges, ptr=ptr)
             skip_nodes.append(nodes)
         if self._skip_connections:
             nodes = torch.cat(skip_nodes, 1)
@@ -123,6 +157,32 @@ class BulkJGMPCardinalityModel(CardinalityModel):
             graphs = layer(graphs)
         return torch.exp(torch.flatten(graphs))
 
+    def _embed_edges(self, edge_labels: Tensor) -> Tuple[Tensor, Tensor]:
+        if self._encode_fk_direction:
+            natural_edges = torch.nn.functional.pad(edge_labels, (0,1), "constant", 1)
+            reversed_edges = torch.nn.functional.pad(edge_labels, (0,1), "constant", 0)
+        else:
+            padding = torch.zeros_like(edge_labels)
+            natural_edges = torch.cat([edge_labels, padding], dim=1)
+            reversed_edges = torch.cat([padding, edge_labels], dim=1)
+        for layer in self._edge_layers:
+            natural_edges = layer(natural_edges)
+            reversed_edges = layer(reversed_edges)
+        return natural_edges, reversed_edges
+
+    def freeze_for_inference(self):
+        # the edge layers only see a label and a direction, so their output is looked up instead of recomputed per edge
+        super().freeze_for_inference()
+        with torch.no_grad():
+            if self._index_encoding:
+                edge_labels = self._edge_label_embedding.weight
+            else:
+                edge_labels = torch.eye(self._encoder.edge_encoding_size(), device=self._sample_bias.device)
+            self._frozen_edges = torch.cat(self._embed_edges(edge_labels))
+
+    def unfreeze(self):
+        self._frozen_edges = None
+
     @staticmethod
     def from_config(encoder: Encoder, config: Dict[str, Any]) -> BulkJGMPCardinalityModel:
         if "use_pg_estimates" not in config:
@@ -145,5 +205,25 @@ class BulkJGMPCardinalityModel(CardinalityModel):
     def config_space() -> Dict[str, Any]:
         raise NotImplementedError()
 
-    def pad_sample_weights(self, new_bitmap_size: int):
+    def pad_sample_weights(self, new_bitmap_size: int, new_columns: Optional[Dict[SchemaNode, List[int]]] = None):
+        self.unmask_sample_weights()
         self._sample_weights = Parameter(torch.nn.functional.pad(self._sample_weights, (0, new_bitmap_size - self._sample_weights.size(2)), "constant", 0))
+        self._bitmap_sizes = table_bitmap_sizes(self._encoder.sampler(), self._encoder.node_index)
+        if new_columns is not None:
+            # fine-tuning only updates the weights of new sample columns until unmask_sample_weights
+            # all other parameters are frozen and the gradients of old columns are masked
+            # with weight decay, the optimizer would still move the masked weights
+            mask = torch.zeros_like(self._sample_weights, requires_grad=False)
+            for table, columns in new_columns.items():
+                mask[self._encoder.node_index[table], :, columns] = 1
+            for parameter in self.parameters():
+                parameter.requires_grad_(False)
+            self._sample_weights.requires_grad_(True)
+            self._sample_mask_handle = self._sample_weights.register_hook(lambda grad: grad * mask.to(grad.device))
+
+    def unmask_sample_weights(self):
+        if self._sample_mask_handle is not None:
+            self._sample_mask_handle.remove()
+            self._sample_mask_handle = None
+            for parameter in self.parameters():
+                parameter.requires_grad_(True)
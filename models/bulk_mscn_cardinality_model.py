@@ -15,9 +15,9 @@ from query.graphlike_query import GraphlikeQuery
 from query.predicate import ArbitraryPredicate
 from query_data.bulk_mscn_query_data import BulkMSCNQueryData
 from encoder.encoder import Encoder
-from torch.nn import Module, Linear, Parameter
+from torch.nn import Embedding, Module, Linear, Parameter
 import torch
-from models.util import build_layer_stack, MultiHeadAggregation
+from models.util import build_layer_stack, grouped_sample_projection, label_ids, MultiHeadAggregation, table_bitmap_sizes, unpack_samples
 
 
 class BulkMSCNCardinalityModel(CardinalityModel):
@@ -39,12 +39,25 @@ class BulkMSCNCardinalityModel(CardinalityModel):
             activation = torch.nn.LeakyReLU()
         assert(aggregation in ["mean", "multihead"])
 
+        self._index_encoding = encoder.index_encoding()
+        if self._index_encoding:
+            # the embeddings start as the one-hot encodings of the dense mode
+            self._node_label_embedding = Embedding.from_pretrained(torch.eye(encoder.node_label_encoding_size()), freeze=False)
+            self._edge_label_embedding = Embedding.from_pretrained(torch.eye(encoder.edge_encoding_size()), freeze=False)
+            self._attribute_embedding = Embedding.from_pretrained(torch.eye(encoder.attribute_encoding_size()), freeze=False)
+            self._operator_embedding = Embedding.from_pretrained(torch.eye(encoder.mscn_operator_size()), freeze=False)
+
+        self._packed_samples = encoder.packed_samples()
+        if self._packed_samples:
+            self._bitmap_size = encoder.sampler().bitmap_size()
+
         self._independent_samples = independent_samples
         if independent_samples:
             assert(independent_sample_size is not None)
             self._independent_sample_size = independent_sample_size
             self._sample_weights = kaiming_uniform_(Parameter(torch.empty((encoder.node_label_encoding_size(), independent_sample_size, encoder.sampler().bitmap_size()))), a=math.sqrt(5))
             self._sample_bias = kaiming_uniform_(Parameter(torch.empty((encoder.node_label_encoding_size(), independent_sample_size))), a=math.sqrt(5))
+            self._bitmap_sizes = table_bitmap_sizes(encoder.sampler(), encoder.node_index)
             table_size = independent_sample_size + 1
         else:
             table_size = encoder.node_encoding_size()
@@ -58,6 +71,8 @@ class BulkMSCNCardinalityModel(CardinalityModel):
         else:
             raise NotImplementedError()
         self._join_layers, _ = build_layer_stack(encoder.edge_encoding_size(), [hidden_units] * 2, activation=activation)
+        # join embeddings of every edge label, see freeze_for_inference
+        self.register_buffer("_frozen_joins", None, persistent=False)
         if aggregation == "mean":
             self._join_aggregation = MeanAggregation()
             join_size = hidden_units
@@ -89,31 +104,54 @@ class BulkMSCNCardinalityModel(CardinalityModel):
     def bulk_encode(self, queries: List[GraphlikeQuery]):
         return [self._encoder.bulk_mscn_encode_cardinality(queries)]
 
+    def bulk_encode_workload(self, workload: List[List[GraphlikeQuery]]):
+        return self._encoder.bulk_mscn_encode_workload(workload)
+
     def forward(self,
                 data: BulkMSCNQueryData
                 ) -> FloatTensor:
         num_queries = data.my_batch[-1] + 1
 
+        if self._packed_samples:
+            shared_node_samples = unpack_samples(data.shared_node_samples, data.shared_node_fused_columns, data.shared_node_fused_values, self._bitmap_size)
+        else:
+            shared_node_samples = data.shared_node_samples
         if self._independent_samples:
-            sample_weights = torch.index_select(self._sample_weights, 0, data.shared_node_labels)
-            sample_biases = torch.index_select(self._sample_bias, 0, data.shared_node_labels)
-            sample_embedding = torch.matmul(sample_weights, data.shared_node_samples.unsqueeze(dim=2)).squeeze() + sample_biases
+            sample_embedding = grouped_sample_projection(self._sample_weights, self._sample_bias, data.shared_node_labels, shared_node_samples, self._bitmap_sizes)
             shared_table_embeddings = torch.cat([sample_embedding, data.shared_node_cardinalities.unsqueeze(dim=1)], dim=1)
         else:
-            shared_table_embeddings = torch.cat([data.shared_node_label_vectors, data.shared_node_samples, data.shared_node_cardinalities.unsqueeze(dim=1)], dim=1)
+            if self._index_encoding:
+                shared_node_label_vectors = self._node_label_embedding(data.shared_node_labels)
+            else:
+                shared_node_label_vectors = data.shared_node_label_vectors
+            shared_table_embeddings = torch.cat([shared_node_label_vectors, shared_node_samples, data.shared_node_cardinalities.unsqueeze(dim=1)], dim=1)
         for layer in self._table_layers:
             shared_table_embeddings = layer(shared_table_embeddings)
         table_embeddings = torch.index_select(shared_table_embeddings, 0, data.x)
         table_aggregates = self._table_aggregation(table_embeddings, data.my_batch, dim_size=num_queries)
 
-        join_embeddings = data.edge_attr
-        for layer in self._join_layers:
-            join_embeddings = layer(join_embeddings)
+        edge_ids = None
+        if self._frozen_joins is not None:
+            edge_ids = label_ids(data.edge_attr, self._index_encoding)
+        if edge_ids is not None:
+            join_embeddings = torch.nn.functional.embedding(edge_ids, self._frozen_joins)
+        else:
+            if self._index_encoding:
+                join_embeddings = self._edge_label_embedding(data.edge_attr)
+            else:
+                join_embeddings = data.edge_attr
+            for layer in self._join_layers:
+                join_embeddings = layer(join_embeddings)
         join_batch = torch.index_select(data.my_batch, 0, data.edge_index[0])
         join_aggregates = self._join_aggregation(join_embeddings, join_batch, dim_size=num_queries)
 
         if self._include_predicates:
-            shared_predicate_embeddings = data.shared_node_predicates
+            if self._index_encoding:
+                shared_predicate_embeddings = torch.cat([self._attribute_embedding(data.shared_node_predicate_ids[:, 0]),
+                                                         self._operator_embedding(data.shared_node_predicate_ids[:, 1]),
+                                                         data.shared_node_predicates], dim=1)
+            else:
+                shared_predicate_embeddings = data.shared_node_predicates
             for layer in self._predicate_layers:
                 shared_predicate_embeddings = layer(shared_predicate_embeddings)
             predicate_embeddings = torch.index_select(shared_predicate_embeddings, 0, data.shared_node_predicate_index[0])
@@ -128,6 +166,21 @@ class BulkMSCNCardinalityModel(CardinalityModel):
         cardinality = torch.exp(log_cardinality)
         return cardinality
 
+    def freeze_for_inference(self):
+        # the join layers only see an edge label, so their output is looked up instead of recomputed per join
+        super().freeze_for_inference()
+        with torch.no_grad():
+            if self._index_encoding:
+                join_embeddings = self._edge_label_embedding.weight
+            else:
+                join_embeddings = torch.eye(self._encoder.edge_encoding_size(), device=self._final_layer.weight.device)
+            for layer in self._join_layers:
+                join_embeddings = layer(join_embeddings)
+            self._frozen_joins = join_embeddings
+
+    def unfreeze(self):
+        self._frozen_joins = None
+
     @staticmethod
     def from_config(encoder: Encoder, config: Dict[str, Any]) -> BulkMSCNCardinalityModel:
         return BulkMSCNCardinalityModel(encoder,
@@ -36,6 +36,24 @@ class CardinalityModel(Module):
             encodings.append(self.encode(query, cardinality))
         return encodings
 
+    def bulk_encode_workload(self, workload: List[List[GraphlikeQuery]]):
+        encodings = []
+        for queries in workload:
+            encodings += self.bulk_encode(queries)
+        return encodings
+
+    def freeze_for_inference(self):
+        # precomputes the parts of the model that only depend on discrete labels, switching back to training discards them
+        self.eval()
+
+    def train(self, mode: bool = True):
+        if mode:
+            self.unfreeze()
+        return super().train(mode)
+
+    def unfreeze(self):
+        pass
+
     def loss(self, data) -> FloatTensor:
         out = self.forward(data)
         labels = data.cardinality
@@ -1,3 +1,5 @@
+from typing import Optional
+
 import torch
 from torch import Tensor
 from torch.nn import Linear, Module
@@ -24,12 +26,14 @@ class MultiHeadAttentionConvIndex(Module):
     def forward(self,
                 x: Tensor,
                 edge_index: Adj,
-                edge_attr: Tensor = None) -> Tensor:
+                edge_attr: Tensor = None,
+                ptr: Optional[Tensor] = None) -> Tensor:
         x_j = torch.index_select(x, 0, edge_index[0])
         message = torch.cat([x_j, edge_attr], dim=-1)
         message = self._pre_layer(message)
         message = leaky_relu(message)
-        messages = self._aggr(message, edge_index[1], dim_size=x.size()[0])
+        # with ptr, the edges are sorted by target and the aggregation uses segment reductions
+        messages = self._aggr(message, edge_index[1], ptr=ptr, dim_size=x.size()[0])
         out = torch.cat([x, messages], dim=-1)
         out = self._out_layer(out)
         out = leaky_relu(out)
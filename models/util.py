@@ -2,10 +2,11 @@ from enum import Enum
 import torch
 import torch_scatter
 from torch import FloatTensor, LongTensor, Tensor
-from typing import List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 
 from torch.nn import Linear, Module, ModuleList
 from torch_geometric.nn import AttentionalAggregation, SumAggregation, MaxAggregation, Aggregation
+from torch_geometric.utils import softmax
 
 
 class AggregationType(Enum):
@@ -31,8 +32,12 @@ class ResizeAggregation(Aggregation):
 
 
 class MultiHeadAggregation(Aggregation):
-    def __init__(self, input_size: int, output_size_per_head: int, num_heads: int, count: bool):
+    def __init__(self, input_size: int, output_size_per_head: int, num_heads: int, count: bool, fused: bool = True):
         super(MultiHeadAggregation, self).__init__()
+        self._num_heads = num_heads
+        self._output_size_per_head = output_size_per_head
+        # the fused forward computes all heads at once from the parameters of the per head aggregators
+        self._fused = fused
         attention_size = output_size_per_head * num_heads
         if count:
             self._output_size = attention_size + 1
@@ -52,6 +57,26 @@ class MultiHeadAggregation(Aggregation):
                 ptr: Optional[Tensor] = None,
                 dim_size: Optional[int] = None,
                 dim: int = -2) -> Tensor:
+        if not self._fused:
+            return self.forward_per_head(x, index=index, ptr=ptr, dim_size=dim_size, dim=dim)
+        # gates of all heads first, then the values of all heads
+        weight = torch.cat([aggregator.gate_nn.weight for aggregator in self._aggregators] + [aggregator.nn.weight for aggregator in self._aggregators])
+        bias = torch.cat([aggregator.gate_nn.bias for aggregator in self._aggregators] + [aggregator.nn.bias for aggregator in self._aggregators])
+        gates, values = torch.split(torch.nn.functional.linear(x, weight, bias), [self._num_heads, self._num_heads * self._output_size_per_head], dim=1)
+        gates = softmax(gates, index, ptr, dim_size, dim)
+        values = (values.view(-1, self._num_heads, self._output_size_per_head) * gates.unsqueeze(dim=2)).flatten(start_dim=1)
+        aggregation = self.reduce(values, index, ptr, dim_size, dim)
+        if self._count:
+            count = self.reduce(torch.ones((x.size(0), 1), dtype=x.dtype, device=x.device), index, ptr, dim_size, dim)
+            aggregation = torch.cat([aggregation, count], dim=1)
+        return aggregation
+
+    def forward_per_head(self,
+                         x: Tensor,
+                         index: Optional[Tensor] = None,
+                         ptr: Optional[Tensor] = None,
+                         dim_size: Optional[int] = None,
+                         dim: int = -2) -> Tensor:
         aggregations = []
         for aggregator in self._aggregators:
             aggregations.append(aggregator.forward(x, index=index, ptr=ptr, dim_size=dim_size, dim=dim))
@@ -90,3 +115,51 @@ def aggregate_many_to_many(input_tensor: FloatTensor, index: LongTensor, dim_siz
     gathered = torch.index_select(input_tensor, 0, index[0])
     scattered = torch_scatter.scatter(gathered, index[1], dim=0, dim_size=dim_size)
     return scattered
+
+
+def label_ids(labels: Tensor, index_encoding: bool) -> Optional[LongTensor]:
+    # ids of index encoded labels or of one-hot encoded labels, None if some dense labels are not one-hot
+    if index_encoding:
+        return labels.long()
+    values, ids = torch.max(labels, dim=1)
+    if not (torch.all(values == 1) and torch.all(torch.sum(labels, dim=1) == 1)):
+        return None
+    return ids
+
+
+def unpack_samples(packed_samples: Tensor, fused_columns: Tensor, fused_values: FloatTensor, bitmap_size: int) -> FloatTensor:
+    # inverse of the packed sample encoding, bits are stored most significant first like numpy.packbits
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=packed_samples.device)
+    bits = torch.bitwise_and(torch.bitwise_right_shift(packed_samples.unsqueeze(dim=2), shifts), 1).flatten(start_dim=1)
+    if bits.size(1) < bitmap_size:
+        bits = torch.nn.functional.pad(bits, (0, bitmap_size - bits.size(1)), "constant", 0)
+    samples = bits[:, :bitmap_size].float()
+    fused_rows = torch.nonzero(fused_columns >= 0).squeeze(dim=1)
+    samples[fused_rows, fused_columns[fused_rows].long()] = fused_values[fused_rows]
+    return samples
+
+
+def table_bitmap_sizes(sampler, node_index: Dict[Any, int]) -> List[int]:
+    # the number of used sample columns per node label, tables with fewer samples are zero padded to the bitmap size
+    hetero_bitmap_sizes = sampler.hetero_bitmap_sizes()
+    sizes = [sampler.bitmap_size()] * len(node_index)
+    for table, i in node_index.items():
+        if table.name() in hetero_bitmap_sizes:
+            sizes[i] = min(hetero_bitmap_sizes[table.name()], sampler.bitmap_size())
+    return sizes
+
+
+def grouped_sample_projection(weights: Tensor, biases: Tensor, labels: LongTensor, samples: FloatTensor, bitmap_sizes: Optional[List[int]] = None) -> FloatTensor:
+    # one matmul per table with its own weights instead of a weight copy per node
+    if labels.size(0) == 0:
+        return samples.new_zeros((0, weights.size(1)))
+    order = torch.argsort(labels, stable=True)
+    present_labels, counts = torch.unique_consecutive(labels[order], return_counts=True)
+    projections = []
+    for label, rows in zip(present_labels.tolist(), torch.split(order, counts.tolist())):
+        width = samples.size(1) if bitmap_sizes is None else min(bitmap_sizes[label], samples.size(1))
+        projections.append(torch.addmm(biases[label], samples[rows, :width], weights[label, :, :width].t()))
+    inverse_order = torch.empty_like(order)
+    inverse_order[order] = torch.arange(order.size(0), device=order.device)
+    return torch.cat(projections)[inverse_order]
+
@@ -1,5 +1,6 @@
 
 import abc
+from typing import Optional
 
 from query.graphlike_query import GraphlikeQuery
 
@@ -8,3 +9,6 @@ class QueryGenerator:
     @abc.abstractmethod
     def generate_query_default(self) -> GraphlikeQuery:
         pass
+
+    def reconnect(self, seed: Optional[int] = None):
+        pass
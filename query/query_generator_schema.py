@@ -4,7 +4,7 @@ from query.predicate_generators import PREDICATE_GENERATORS
 from query.query_edge import QueryEdge
 from query.query_generator import QueryGenerator
 from query.query_node import QueryNode
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from schema.value_picker import ValuePicker
 from schema.schema_edge import SchemaEdge
 from schema.attribute import Attribute
@@ -39,6 +39,10 @@ class QueryGeneratorSchema(QueryGenerator):
         self._default_max_nodes = default_max_nodes
         self._default_predicate_factor = default_predicate_factor
 
+    def reconnect(self, seed: Optional[int] = None):
+        self._random = Random(seed)
+        self._value_picker.reconnect(seed)
+
     def generate_query_default(self) -> GraphlikeQuery:
         return self.generate_query(self._default_min_nodes, self._default_max_nodes, self._default_predicate_factor)
 
@@ -92,12 +96,10 @@ class QueryGeneratorSchema(QueryGenerator):
             number_of_predicates = len(predicate_candidates)
         predicates = self._random.sample(predicate_candidates, number_of_predicates)
 
-        nodes = []
         edges = []
 
-        for i, schema_node in enumerate(schema_nodes):
-            node_predicates = sum([1 for is_node, j in predicates if is_node and i == j])
-            nodes.append(self._generate_node(schema_node, node_predicates))
+        node_predicates = [sum([1 for is_node, j in predicates if is_node and i == j]) for i in range(len(schema_nodes))]
+        nodes = self._generate_nodes(schema_nodes, node_predicates)
 
         for i, edge_triple in enumerate(schema_edges):
             from_number, schema_edge, to_number = edge_triple
@@ -112,6 +114,9 @@ class QueryGeneratorSchema(QueryGenerator):
         reverse_edges = [(node_number, edge, from_node, False) for edge, from_node in self._schema.edges_to(node)]
         return natural_edges + reverse_edges
 
+    def _generate_nodes(self, schema_nodes: List[SchemaNode], num_predicates: List[int]) -> List[QueryNode]:
+        return [self._generate_node(schema_node, node_predicates) for schema_node, node_predicates in zip(schema_nodes, num_predicates)]
+
     @abc.abstractmethod
     def _generate_node(self, schema_node: SchemaNode, num_predicates: int) -> Tuple[QueryNode, int]:
         pass
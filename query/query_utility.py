@@ -14,3 +14,16 @@ def predicates_to_string(alias: str, predicates: List[List[Union[Predicate, Arbi
             disjunction_string = "(%s)" % disjunction_string
         conjunction_strings.append(disjunction_string)
     return "\n\tAND ".join(conjunction_strings)
+
+
+def predicates_to_canonical_string(predicates: List[List[Union[Predicate, ArbitraryPredicate]]]) -> str:
+    disjunction_strings = set()
+    for disjunction in predicates:
+        predicate_strings = set()
+        for predicate in disjunction:
+            if isinstance(predicate, ArbitraryPredicate):
+                predicate_strings.add(predicate.query_string(""))
+            else:
+                predicate_strings.add("%s %s %r %r" % (predicate.attribute().name(), predicate.operator().symbol(), predicate.value(), predicate.positive()))
+        disjunction_strings.add("(" + " OR ".join(sorted(predicate_strings)) + ")")
+    return " AND ".join(sorted(disjunction_strings))
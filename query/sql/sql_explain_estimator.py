@@ -0,0 +1,110 @@
+from __future__ import annotations
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import psycopg2
+
+from schema.sql.sql_schema import SQLSchema
+
+
+_EXPLAIN_FUNCTION = """CREATE OR REPLACE FUNCTION pg_temp.explain_plan_rows(queries text[]) RETURNS SETOF json AS $$
+                       DECLARE
+                           q text;
+                           plan json;
+                       BEGIN
+                           FOREACH q IN ARRAY queries LOOP
+                               EXECUTE 'EXPLAIN (FORMAT JSON) ' || q INTO plan;
+                               RETURN NEXT plan->0->'Plan'->'Plan Rows';
+                           END LOOP;
+                       END
+                       $$ LANGUAGE plpgsql;"""
+
+_estimators: WeakKeyDictionary = WeakKeyDictionary()
+_inherited_connections = []
+
+
+class SQLExplainEstimator:
+    def __init__(self, schema: SQLSchema, memo_size: int = 1000000) -> None:
+        self._schema = schema
+        self._memo_size = memo_size
+        self._memo: OrderedDict[str, Any] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        # the memo is shared by the relation generator threads, the connection is only used by one of them at a time
+        self._memo_lock = Lock()
+        self._connection_lock = Lock()
+        self._connection: Optional[psycopg2.connection] = None
+        self._pid = os.getpid()
+
+    @staticmethod
+    def for_schema(schema: SQLSchema) -> SQLExplainEstimator:
+        if schema not in _estimators:
+            _estimators[schema] = SQLExplainEstimator(schema)
+        return _estimators[schema]
+
+    def hits(self) -> int:
+        return self._hits
+
+    def misses(self) -> int:
+        return self._misses
+
+    def _check_process(self):
+        if self._pid != os.getpid():
+            # a forked process gets its own connection, the inherited one is shared with the parent and must neither be used nor garbage collected
+            if self._connection is not None:
+                _inherited_connections.append(self._connection)
+                self._connection = None
+            self._memo_lock = Lock()
+            self._connection_lock = Lock()
+            self._pid = os.getpid()
+
+    def _cursor(self):
+        if self._connection is None or self._connection.closed:
+            # a dedicated autocommit connection keeps the explain function for the whole session and stays out of the caller's transactions
+            self._connection = self._schema.new_connection()
+            self._connection.autocommit = True
+            cursor = self._connection.cursor()
+            cursor.execute(_EXPLAIN_FUNCTION)
+            cursor.close()
+        return self._connection.cursor()
+
+    def estimate(self, key: str, query: str) -> Any:
+        return self.estimate_many([(key, query)])[0]
+
+    def estimate_many(self, queries: List[Tuple[str, str]]) -> List[Any]:
+        self._check_process()
+        rows: Dict[str, Any] = {}
+        pending: Dict[str, str] = {}
+        with self._memo_lock:
+            for key, query in queries:
+                if key in self._memo:
+                    self._hits += 1
+                    self._memo.move_to_end(key)
+                    rows[key] = self._memo[key]
+                elif key not in pending:
+                    self._misses += 1
+                    pending[key] = query
+
+        if len(pending) > 0:
+            pending_keys = list(pending)
+            with self._connection_lock:
+                cursor = self._cursor()
+                if len(pending_keys) == 1:
+                    cursor.execute("EXPLAIN (FORMAT JSON) " + pending[pending_keys[0]])
+                    plan_rows = [cursor.fetchone()[0][0]["Plan"]["Plan Rows"]]
+                else:
+                    cursor.execute("SELECT * FROM pg_temp.explain_plan_rows(%s);", ([pending[key].rstrip().rstrip(";") for key in pending_keys],))
+                    plan_rows = [row[0] for row in cursor.fetchall()]
+                cursor.close()
+            assert(len(plan_rows) == len(pending_keys))
+            with self._memo_lock:
+                for key, plan_row in zip(pending_keys, plan_rows):
+                    self._memo[key] = plan_row
+                    rows[key] = plan_row
+                while len(self._memo) > self._memo_size:
+                    self._memo.popitem(last=False)
+
+        return [rows[key] for key, _ in queries]
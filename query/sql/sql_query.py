@@ -486,6 +486,14 @@ class SQLQuery(GraphlikeQuery):
         nodes, edges = self.build_subquery_nodes_edges(nodes)
         return SQLQuery(nodes, edges, {"true": cardinality}, id=id)
 
+    def subquery_mask(self, nodes: FrozenSet[SQLTableInstance]) -> int:
+        # bit i is set if the i-th node of this query is part of the subquery
+        mask = 0
+        for i, node in enumerate(self._nodes):
+            if node in nodes:
+                mask |= 1 << i
+        return mask
+
     def shallow_copy(self) -> SQLQuery:
         query = SQLQuery(self._nodes, self.edges(), cardinality_estimates=self._cardinality_estimates)
         aliases = query.aliases()
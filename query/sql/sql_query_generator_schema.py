@@ -57,5 +57,10 @@ class SQLQueryGeneratorSchema(QueryGeneratorSchema):
         predicates = self._generate_predicates(schema_node, num_predicates)
         return SQLTableInstance.build(self._schema, schema_node, predicates)
 
+    def _generate_nodes(self, schema_nodes: List[SQLTable], num_predicates: List[int]) -> List[SQLTableInstance]:
+        # the estimates of all table instances of the query are fetched in one round trip
+        instances = [(schema_node, self._generate_predicates(schema_node, node_predicates), "t") for schema_node, node_predicates in zip(schema_nodes, num_predicates)]
+        return SQLTableInstance.build_many(self._schema, instances)
+
     def _generate_edge(self, schema_edge: SQLForeignKey, num_predicates: int) -> Tuple[SQLJoin, int]:
         return SQLJoin(schema_edge)
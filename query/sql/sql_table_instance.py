@@ -1,10 +1,12 @@
 
 
 from __future__ import annotations
-from query.query_utility import predicates_to_string
+import hashlib
+from query.query_utility import predicates_to_canonical_string, predicates_to_string
+from query.sql.sql_explain_estimator import SQLExplainEstimator
 from schema.sql.sql_schema import SQLSchema
 from query.predicate import Predicate, ArbitraryPredicate
-from typing import List, Union
+from typing import List, Tuple, Union
 from schema.sql.sql_table import SQLTable
 from query.predicatable import Predicatable
 from query.query_node import QueryNode
@@ -33,20 +35,39 @@ class SQLTableInstance(QueryNode, Predicatable):
 
     @staticmethod
     def build(schema: SQLSchema, table: SQLTable, predicates: List[List[Predicate]], alias: str = "t") -> SQLTableInstance:
-        if len(predicates) == 0:
-            cardinality = table.cardinality()
-        else:
-            connection = schema.connection()
-            cursor = connection.cursor()
-            cardinality_query = "EXPLAIN (FORMAT JSON) " + SQLTableInstance.sql(table, predicates, alias=alias)
-            cursor.execute(cardinality_query)
-            cardinality = cursor.fetchone()[0][0]["Plan"]["Plan Rows"]
-            cursor.close()
-
-        return SQLTableInstance(table, cardinality, predicates)
+        return SQLTableInstance.build_many(schema, [(table, predicates, alias)])[0]
+
+    @staticmethod
+    def build_many(schema: SQLSchema, instances: List[Tuple[SQLTable, List[List[Predicate]], str]]) -> List[SQLTableInstance]:
+        explain_queries = []
+        for table, predicates, alias in instances:
+            if len(predicates) > 0:
+                explain_queries.append((SQLTableInstance.explain_key(table, predicates, alias), SQLTableInstance.sql(table, predicates, alias=alias)))
+        plan_rows = iter(SQLExplainEstimator.for_schema(schema).estimate_many(explain_queries))
+
+        table_instances = []
+        for table, predicates, alias in instances:
+            if len(predicates) == 0:
+                cardinality = table.cardinality()
+            else:
+                cardinality = next(plan_rows)
+            table_instances.append(SQLTableInstance(table, cardinality, predicates))
+        return table_instances
+
+    @staticmethod
+    def explain_key(table: SQLTable, predicates: List[List[Union[Predicate, ArbitraryPredicate]]], alias: str) -> str:
+        key = "%s: %s" % (table.name(), predicates_to_canonical_string(predicates))
+        if any(isinstance(predicate, ArbitraryPredicate) for disjunction in predicates for predicate in disjunction):
+            # arbitrary predicates refer to the alias
+            key += " AS " + alias
+        return key
 
     def copy(self) -> SQLTableInstance:
         return SQLTableInstance(self._labels[0], self._cardinality, self._predicates, virtual=self._virtual)
 
     def hash(self):
         return hash(frozenset([frozenset(p) for p in self._predicates]))
+
+    def canonical_hash(self) -> str:
+        canonical_string = "%s: %s" % (self.table().name(), predicates_to_canonical_string(self._predicates))
+        return hashlib.sha1(canonical_string.encode("utf-8")).hexdigest()
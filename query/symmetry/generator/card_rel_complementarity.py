@@ -48,20 +48,19 @@ class CardRelComplementarity(CardinalityRelationGenerator):
                     if attribute not in not_null_attributes and attribute.nullable():
                         null_disjunction.append(Predicate(attribute, OPERATORS["IS"], None))
                 if isinstance(predicatable, SQLTableInstance):
-                    complement_predicatable = SQLTableInstance.build(self._schema, predicatable.table(), compliment_predicates, alias=complement_query.alias(predicatable))
-                    complement_query.replace_node(predicatable, complement_predicatable)
-                    without_predicatable = SQLTableInstance.build(self._schema, predicatable.table(), without_predicates, alias=without_query.alias(predicatable))
-                    without_query.replace_node(predicatable, without_predicatable)
+                    instances = [(predicatable.table(), compliment_predicates, complement_query.alias(predicatable)),
+                                 (predicatable.table(), without_predicates, without_query.alias(predicatable))]
+                    if len(null_disjunction) > 0:
+                        null_predicates.append(null_disjunction)
+                        instances.append((predicatable.table(), null_predicates, null_query.alias(predicatable)))
+                    built_predicatables = SQLTableInstance.build_many(self._schema, instances)
+                    complement_query.replace_node(predicatable, built_predicatables[0])
+                    without_query.replace_node(predicatable, built_predicatables[1])
                 else:
                     raise NotImplementedError()
                 left_queries = [query, complement_query]
                 if len(null_disjunction) > 0:
-                    null_predicates.append(null_disjunction)
-                    if isinstance(predicatable, SQLTableInstance):
-                        null_predicatable = SQLTableInstance.build(self._schema, predicatable.table(), null_predicates, alias=null_query.alias(predicatable))
-                        null_query.replace_node(predicatable, null_predicatable)
-                    else:
-                        raise NotImplementedError()
+                    null_query.replace_node(predicatable, built_predicatables[2])
                     left_queries.append(null_query)
                 return CardinalityRelation(left_queries, [without_query], RelationType.EQUAL)
         return None
@@ -39,18 +39,21 @@ class CardRelInclusionExclusion(CardinalityRelationGenerator):
             if modified:
                 left_queries = [query]
                 if isinstance(predicatable, SQLTableInstance):
-                    a_predicatable = SQLTableInstance.build(self._schema, predicatable.table(), other_disjunctions + [a_disjunction], alias=a_query.alias(predicatable))
-                    a_query.replace_node(predicatable, a_predicatable)
-                    b_predicatable = SQLTableInstance.build(self._schema, predicatable.table(), other_disjunctions + [b_disjunction], alias=b_query.alias(predicatable))
-                    b_query.replace_node(predicatable, b_predicatable)
                     simple =  all(isinstance(predicate, Predicate) for predicate in a_disjunction + b_disjunction)
                     if simple:
                         positive_equal = all(predicate.operator() == OPERATORS["="] and predicate.positive() for predicate in a_disjunction + b_disjunction)
                         disjoint = {predicate.value() for predicate in a_disjunction}.isdisjoint({predicate.value() for predicate in b_disjunction})
-                    if not simple or not (positive_equal and disjoint):
+                    build_ab = not simple or not (positive_equal and disjoint)
+                    instances = [(predicatable.table(), other_disjunctions + [a_disjunction], a_query.alias(predicatable)),
+                                 (predicatable.table(), other_disjunctions + [b_disjunction], b_query.alias(predicatable))]
+                    if build_ab:
+                        instances.append((predicatable.table(), other_disjunctions + [a_disjunction, b_disjunction], "t"))
+                    built_predicatables = SQLTableInstance.build_many(self._schema, instances)
+                    a_query.replace_node(predicatable, built_predicatables[0])
+                    b_query.replace_node(predicatable, built_predicatables[1])
+                    if build_ab:
                         ab_query = query.shallow_copy()
-                        ab_predicatable = SQLTableInstance.build(self._schema, predicatable.table(), other_disjunctions + [a_disjunction, b_disjunction])
-                        ab_query.replace_node(predicatable, ab_predicatable)
+                        ab_query.replace_node(predicatable, built_predicatables[2])
                         left_queries.append(ab_query)
                 else:
                     raise NotImplementedError()
@@ -17,6 +17,9 @@ class CardRelOrMonotonicity(CardinalityRelationGenerator):
         super().__init__(schema)
         self._value_picker = value_picker
 
+    def reconnect(self, seed: Optional[int] = None):
+        self._value_picker.reconnect(seed)
+
     def generate(self, query: GraphlikeQuery) -> Optional[CardinalityRelation]:
         or_query = query.shallow_copy()
         predicatables = list(query.aliases()).copy()
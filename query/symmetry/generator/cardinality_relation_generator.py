@@ -11,6 +11,12 @@ class CardinalityRelationGenerator:
     def __init__(self, schema: GraphlikeSchema) -> None:
         self._schema = schema
 
+    def schema(self) -> GraphlikeSchema:
+        return self._schema
+
+    def reconnect(self, seed: Optional[int] = None):
+        pass
+
     @abstractmethod
     def generate(self, query: GraphlikeQuery) -> Optional[CardinalityRelation]:
         pass
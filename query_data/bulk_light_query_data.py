@@ -23,5 +23,9 @@ class BulkLightQueryData(Data):
             return self.shared_node_labels.size()[0]
         elif key == "my_batch":
             return self.my_batch[-1] + 1
+        elif key == "message_edge":
+            return self.edge_index.size(1)
+        elif key == "message_ptr":
+            return self.message_edge.size(0)
         else:
             return super().__inc__(key, value)
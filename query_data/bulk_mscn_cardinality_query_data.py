@@ -1,4 +1,6 @@
-from torch import FloatTensor, LongTensor
+from typing import Optional
+
+from torch import FloatTensor, IntTensor, LongTensor
 
 from query_data.bulk_mscn_query_data import BulkMSCNQueryData
 from query_data.bulk_query_data import BulkQueryData
@@ -16,7 +18,8 @@ class BulkMSCNCardinalityQueryData(BulkMSCNQueryData):
                  shared_node_predicates: FloatTensor,
                  shared_node_predicate_index: LongTensor,
                  my_batch: LongTensor,
-                 cardinality: FloatTensor) -> None:
+                 cardinality: FloatTensor,
+                 shared_node_predicate_ids: Optional[IntTensor] = None) -> None:
         super(BulkMSCNCardinalityQueryData, self).__init__(node_index,
                                                            edge_index,
                                                            edge_labels,
@@ -26,5 +29,6 @@ class BulkMSCNCardinalityQueryData(BulkMSCNQueryData):
                                                            shared_node_samples,
                                                            shared_node_predicates,
                                                            shared_node_predicate_index,
-                                                           my_batch)
+                                                           my_batch,
+                                                           shared_node_predicate_ids=shared_node_predicate_ids)
         self.cardinality = cardinality
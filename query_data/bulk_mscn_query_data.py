@@ -1,5 +1,7 @@
+from typing import Optional
+
 import torch
-from torch import FloatTensor, LongTensor, BoolTensor
+from torch import FloatTensor, LongTensor, BoolTensor, IntTensor
 from torch_geometric.data import Data
 
 
@@ -14,7 +16,8 @@ class BulkMSCNQueryData(Data):
                  shared_node_samples: FloatTensor,
                  shared_node_predicates: FloatTensor,
                  shared_node_predicate_index: LongTensor,
-                 my_batch: LongTensor) -> None:
+                 my_batch: LongTensor,
+                 shared_node_predicate_ids: Optional[IntTensor] = None) -> None:
         super(BulkMSCNQueryData, self).__init__(node_index, edge_index, edge_labels)
         self.shared_node_labels = shared_node_labels
         self.shared_node_label_vectors = shared_node_label_vectors
@@ -23,6 +26,9 @@ class BulkMSCNQueryData(Data):
         self.shared_node_predicates = shared_node_predicates
         self.shared_node_predicate_index = shared_node_predicate_index
         self.my_batch = my_batch
+        if shared_node_predicate_ids is not None:
+            # attribute and operator ids of index encoded predicates
+            self.shared_node_predicate_ids = shared_node_predicate_ids
 
     def __inc__(self, key, value, *args, **kwargs):
         if key == "x":
@@ -1,7 +1,7 @@
-from typing import Any
+from typing import Any, Optional
 
 import torch
-from torch import FloatTensor, LongTensor, BoolTensor
+from torch import FloatTensor, LongTensor, BoolTensor, IntTensor
 
 from query_data.bulk_mscn_query_data import BulkMSCNQueryData
 from query_data.bulk_query_data import BulkQueryData
@@ -21,7 +21,8 @@ class BulkMSCNRelationQueryData(BulkMSCNQueryData):
                  my_batch: LongTensor,
                  left: LongTensor,
                  right: LongTensor,
-                 equal: BoolTensor) -> None:
+                 equal: BoolTensor,
+                 shared_node_predicate_ids: Optional[IntTensor] = None) -> None:
         super(BulkMSCNRelationQueryData, self).__init__(node_index,
                                                         edge_index,
                                                         edge_labels,
@@ -31,7 +32,8 @@ class BulkMSCNRelationQueryData(BulkMSCNQueryData):
                                                         shared_node_samples,
                                                         shared_node_predicates,
                                                         shared_node_predicate_index,
-                                                        my_batch)
+                                                        my_batch,
+                                                        shared_node_predicate_ids=shared_node_predicate_ids)
         self.left = left
         self.right = right
         self.equal = equal
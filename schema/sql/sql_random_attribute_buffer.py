@@ -13,6 +13,7 @@ class SQLRandomAttributeBuffer(RandomAttributeBuffer):
                                        buffer_size,
                                        {(node, attribute): node.cardinality() * (1 - attribute.null_ratio()) <= buffer_size for node in schema.nodes() for attribute in node.attributes()})
         self._random = Random(seed)
+        self._schema = schema
         self._connection = schema.connection()
 
         self._column_to_table: Dict[SQLColumn, SQLTable] = {}
@@ -22,6 +23,12 @@ class SQLRandomAttributeBuffer(RandomAttributeBuffer):
                 self._column_to_table[column] = table
         self._ratios = {node: min(buffer_size / node.cardinality(), 1) for node in schema.nodes()}
 
+    def reconnect(self, seed: Optional[int] = None):
+        self._random = Random(seed)
+        self._connection = self._schema.connection()
+        for key in self._buffer:
+            self._buffer[key] = []
+
     def _fill_buffer(self, entity: SQLTable, attribute: SQLColumn):
         cursor = self._connection.cursor()
         sample_query = """SELECT %s
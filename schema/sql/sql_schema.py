@@ -51,6 +51,16 @@ class SQLSchema(GraphlikeSchema):
                 self._index_to_table[index] = table
 
 
+    def reconnect(self) -> psycopg2.connection:
+        old_connection = self._connection
+        port = old_connection.info.port
+        self._connection = psycopg2.connect(host="localhost", database=self._name, user="postgres", password="postgres", port=port)
+        return old_connection
+
+    def new_connection(self) -> psycopg2.connection:
+        port = self._connection.info.port
+        return psycopg2.connect(host="localhost", database=self._name, user="postgres", password="postgres", port=port)
+
     def connection(self, timeout: Optional[int] = None):
         if timeout is None:
             return self._connection
@@ -1,5 +1,5 @@
 import abc
-from typing import Any
+from typing import Any, Optional
 from schema.attributable import Attributable
 from schema.attribute import Attribute
 
@@ -8,3 +8,6 @@ class ValuePicker:
     @abc.abstractmethod
     def pick_random(self, entity: Attributable, attribute: Attribute) -> Any:
         pass
+
+    def reconnect(self, seed: Optional[int] = None):
+        pass
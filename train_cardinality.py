@@ -5,6 +5,8 @@ import random
 from torch_geometric.data import Data
 
 from encoder.cardinality_relation_data_generator import CardinalityRelationDataGenerator
+from encoder.encoding_cache import EncodingCache
+from encoder.relation_prefetcher import RelationPrefetcher
 from models.bulk_jgmp_cardinality_model import BulkJGMPCardinalityModel
 from models.bulk_mscn_cardinality_model import BulkMSCNCardinalityModel
 from models.cardinality_model import CardinalityModel
@@ -29,66 +31,89 @@ def train(model: GraphCardinalityModel,
           batch_size: int = 1024,
           epochs: int = 100,
           card_rel_gen: Optional[Tuple[CardinalityRelationDataGenerator, int]] = None,
-          selfsupervised_factor: float = 1):
+          selfsupervised_factor: float = 1,
+          prefetch_depth: int = 0,
+          seed: Optional[int] = None):
     device = next(model.parameters()).device
     print("Training on %s" % device)
     print(datetime.datetime.now())
 
+    if seed is not None:
+        # relation generation draws from the global random state, with a seed it runs in a single thread
+        random.seed(seed)
+        torch.manual_seed(seed)
+        num_threads = 1
+    else:
+        num_threads = 8
+    shuffle_random = random.Random(seed)
+
     loader = DataLoader(training_queries, batch_size=batch_size, shuffle=True)
+    prefetcher = None
     if card_rel_gen is not None:
         card_rel_data_generator, num_relations = card_rel_gen
         total_relations = num_relations * math.ceil(len(training_queries) / batch_size)
+        if isinstance(model, BulkJGMPCardinalityModel):
+            generate_relations = card_rel_data_generator.generate_bulk_light_cardinality_relations_parallel
+        elif isinstance(model, BulkMSCNCardinalityModel):
+            generate_relations = card_rel_data_generator.generate_bulk_mscn_cardinality_relations_parallel
+        else:
+            generate_relations = card_rel_data_generator.generate_cardinality_relations_parallel
+        if prefetch_depth > 0:
+            prefetcher = RelationPrefetcher(lambda n: generate_relations(n, num_threads=num_threads), num_relations, depth=prefetch_depth)
+            prefetcher.start()
     else:
         card_rel_data_generator = None
     card_rels = []
     selfsupervised_losses_epoch = []
 
     optimizer = Adam(model.parameters(), lr=learning_rate)
-    for epoch in range(epochs):
-        total_supervised = 0
-        total_selfsupervised = 0
-        if card_rel_data_generator is not None:
-            if len(selfsupervised_losses_epoch) > 0:
-                loss_cutoff = np.percentile(selfsupervised_losses_epoch, 10)
+    try:
+        for epoch in range(epochs):
+            total_supervised = 0
+            total_selfsupervised = 0
+            if card_rel_data_generator is not None:
+                if len(selfsupervised_losses_epoch) > 0:
+                    loss_cutoff = np.percentile(selfsupervised_losses_epoch, 10)
+                else:
+                    loss_cutoff = 0
+                keep_card_rels = []
+                for card_rel, loss in zip(card_rels, selfsupervised_losses_epoch):
+                    if loss > loss_cutoff:
+                        keep_card_rels.append(card_rel)
+                card_rels = keep_card_rels
+
+                missing_card_rels = total_relations - len(card_rels)
+                if prefetcher is not None:
+                    new_card_rels = prefetcher.take(missing_card_rels)
+                else:
+                    new_card_rels = generate_relations(missing_card_rels, num_threads=num_threads)
+                card_rels += new_card_rels
+                shuffle_random.shuffle(card_rels)
+                selfsupervised_losses_epoch = []
+                card_rel_loader_iter = iter(DataLoader(card_rels, batch_size=num_relations))
             else:
-                loss_cutoff = 0
-            keep_card_rels = []
-            for card_rel, loss in zip(card_rels, selfsupervised_losses_epoch):
-                if loss > loss_cutoff:
-                    keep_card_rels.append(card_rel)
-            card_rels = keep_card_rels
-
-            missing_card_rels = total_relations - len(card_rels)
-            if isinstance(model, BulkJGMPCardinalityModel):
-                new_card_rels = card_rel_data_generator.generate_bulk_light_cardinality_relations_parallel(missing_card_rels)
-            elif isinstance(model, BulkMSCNCardinalityModel):
-                new_card_rels = card_rel_data_generator.generate_bulk_mscn_cardinality_relations_parallel(missing_card_rels)
+                card_rel_loader_iter = None
+
+            for batch_no, batch in enumerate(loader):
+                supervised_batch, selfsupervised_batch, selfsupervised_losses_batch = batch_train(model, optimizer, batch, card_rel_loader_iter, selfsupervised_factor, device)
+                total_supervised += supervised_batch
+                total_selfsupervised += selfsupervised_batch
+                selfsupervised_losses_epoch += selfsupervised_losses_batch
+
+            loss_string = "%d supervised = %f, selfsupervised = %f" % (epoch + 1, total_supervised / (batch_no + 1),
+                                                                       total_selfsupervised / (batch_no + 1))
+
+            if len(validation_queries) > 0:
+                print(loss_string, end=" ")
+                test_result = test(model, validation_queries, device=device)
+                if np.isnan(test_result):
+                    return
             else:
-                new_card_rels = card_rel_data_generator.generate_cardinality_relations_parallel(missing_card_rels)
-            card_rels += new_card_rels
-            random.shuffle(card_rels)
-            selfsupervised_losses_epoch = []
-            card_rel_loader_iter = iter(DataLoader(card_rels, batch_size=num_relations))
-        else:
-            card_rel_loader_iter = None
-
-        for batch_no, batch in enumerate(loader):
-            supervised_batch, selfsupervised_batch, selfsupervised_losses_batch = batch_train(model, optimizer, batch, card_rel_loader_iter, selfsupervised_factor, device)
-            total_supervised += supervised_batch
-            total_selfsupervised += selfsupervised_batch
-            selfsupervised_losses_epoch += selfsupervised_losses_batch
-
-        loss_string = "%d supervised = %f, selfsupervised = %f" % (epoch + 1, total_supervised / (batch_no + 1),
-                                                                   total_selfsupervised / (batch_no + 1))
-
-        if len(validation_queries) > 0:
-            print(loss_string, end=" ")
-            test_result = test(model, validation_queries, device=device)
-            if np.isnan(test_result):
-                return
-        else:
-            print(loss_string)
-
+                print(loss_string)
+    finally:
+        # also stops the producer thread when training or relation generation raises
+        if prefetcher is not None:
+            prefetcher.close()
     print(datetime.datetime.now())
     model.encoder().reset()
 
@@ -125,7 +150,7 @@ def test_base(model: CardinalityModel, encoded_queries: List[Data], device=None)
     old_device = next(model.parameters()).device
     if device is not None:
         model.to(device)
-    model.eval()
+    model.freeze_for_inference()
     with torch.no_grad():
         for batch in loader:
             if device is not None:
@@ -173,12 +198,27 @@ def q_error_stats(estimations: List[float], labels: List[float]) -> float:
 
 def encode(queries: List[List[GraphlikeQuery]],
            cardinality_model: CardinalityModel,
-           device: torch.device
+           device: torch.device,
+           encoding_cache: Optional[EncodingCache] = None
            ) -> List[CardinalityQueryData]:
-    encoded_queries = []
-    for query in queries:
-        encoded_query = cardinality_model.bulk_encode(query)
-        for subquery in encoded_query:
-            subquery.to(device, non_blocking=True)
-        encoded_queries += encoded_query
+    key = None
+    if encoding_cache is not None:
+        encoder_hash = cardinality_model.encoder().config_hash()
+        if encoder_hash is not None:
+            key = EncodingCache.key(queries, type(cardinality_model).__name__, encoder_hash)
+        if key is not None and encoding_cache.contains(key):
+            encoded_queries = encoding_cache.load(key)
+            for subquery in encoded_queries:
+                subquery.to(device, non_blocking=True)
+            return encoded_queries
+
+    sampler = cardinality_model.encoder().sampler()
+    if sampler is not None:
+        sampler.prefetch([subquery for query in queries for subquery in query])
+
+    encoded_queries = cardinality_model.bulk_encode_workload(queries)
+    for subquery in encoded_queries:
+        subquery.to(device, non_blocking=True)
+    if key is not None:
+        encoding_cache.save(key, encoded_queries)
     return encoded_queries
@@ -1,8 +1,10 @@
+import os
 import torch
 
 from cardinality_estimator.learned_cardinality_estimator import LearnedCardinalityEstimator
 from cardinality_estimator.prophetic_cardinality_estimator import PropheticCardinalityEstimator
 from data.query_db import QueryDB
+from encoder.bitmap_cache import BitmapCache
 from encoder.encoder import Encoder
 from encoder.sql_sampler import SQLSampler
 from schema.graphlike_schema import GraphlikeSchema
@@ -20,12 +22,19 @@ def nonempty_powerset(s: List[Any]) -> List[List[Any]]:
     return ps
 
 
-def load_learned_estimator_sql(schema: SQLSchema, model_path: str, model_config, device: Optional[Any], attribute_table_order: Optional[List[str]] = None) -> LearnedCardinalityEstimator:
+def load_learned_estimator_sql(schema: SQLSchema, model_path: str, model_config, device: Optional[Any], attribute_table_order: Optional[List[str]] = None, bitmap_cache_size: Optional[int] = 100000) -> LearnedCardinalityEstimator:
     sampler = SQLSampler.load(schema, model_path + ".samples")
+    if bitmap_cache_size is not None:
+        if os.path.exists(model_path + ".bitmaps"):
+            sampler.set_bitmap_cache(BitmapCache.load(model_path + ".bitmaps", capacity=bitmap_cache_size))
+        else:
+            sampler.set_bitmap_cache(BitmapCache(capacity=bitmap_cache_size))
+    index_encoding = model_config["index_encoding"] if "index_encoding" in model_config else False
+    packed_samples = model_config["packed_samples"] if "packed_samples" in model_config else False
     if "eliminate_lesser" in model_config:
-        encoder = Encoder(schema, sampler, eliminate_lesser=model_config["eliminate_lesser"], attribute_table_order=attribute_table_order)
+        encoder = Encoder(schema, sampler, eliminate_lesser=model_config["eliminate_lesser"], attribute_table_order=attribute_table_order, index_encoding=index_encoding, packed_samples=packed_samples)
     else:
-        encoder = Encoder(schema, sampler, attribute_table_order=attribute_table_order)
+        encoder = Encoder(schema, sampler, attribute_table_order=attribute_table_order, index_encoding=index_encoding, packed_samples=packed_samples)
     model = model_config["type"].from_config(encoder, model_config)
     model.load_state_dict(torch.load(model_path + ".pt"))
     if device is not None: